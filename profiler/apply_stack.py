@@ -0,0 +1,158 @@
+from __future__ import absolute_import, division, print_function
+
+import argparse
+
+import torch
+from torch.autograd import Variable
+
+import pyro
+import pyro.distributions as dist
+import pyro.poutine as poutine
+import pyro.util
+from profiler.profiling_utils import Profile, profile_print
+from pyro.poutine import _PYRO_STACK
+from pyro.util import default_process_message, validate_message
+
+TOOL = 'timeit'
+TOOL_CFG = {}
+
+
+def uncompiled_apply_stack(initial_msg):
+    """
+    Reference implementation of ``pyro.util.apply_stack`` that dispatches
+    every frame by name, as it was done before handler chains were compiled.
+    """
+    msg = initial_msg
+    counter = 0
+    for frame in _PYRO_STACK:
+        validate_message(msg)
+        counter = counter + 1
+        frame._process_message(msg)
+        if msg.stop:
+            break
+    default_process_message(msg)
+    for frame in reversed(_PYRO_STACK[0:counter]):
+        frame._postprocess_message(msg)
+    cont = msg.continuation
+    if cont is not None:
+        cont(msg)
+    return None
+
+
+def make_model(num_sites):
+    # a deterministic stochastic function keeps the distribution out of the measurement
+    value = Variable(torch.zeros(1))
+    delta = dist.Delta(value)
+    names = ["x_{}".format(i) for i in range(num_sites)]
+
+    def model():
+        for name in names:
+            pyro.sample(name, delta)
+
+    return model
+
+
+def wrap(model, depth):
+    """
+    Wraps ``model`` in a trace and ``depth - 1`` other (cheap) poutines.
+    """
+    for _ in range(depth - 1):
+        model = poutine.block(model, hide=[])
+    return poutine.trace(model)
+
+
+def get_tool():
+    return TOOL
+
+
+def get_tool_cfg():
+    return TOOL_CFG
+
+
+@Profile(
+    tool=get_tool,
+    tool_cfg=get_tool_cfg,
+    fn_id=lambda model, depth, num_sites, compiled: 'apply_stack_depth={}_sites={}_compiled={}'.format(
+        depth, num_sites, compiled))
+def run_model(model, depth, num_sites, compiled):
+    return model()
+
+
+def run_with_tool(tool, depths, num_sites):
+    column_widths, field_format, template = None, None, None
+    if tool == 'timeit':
+        column_widths = [14] * 4
+        field_format = [None, '{:.3f}', '{:.3f}', '{:.2f}']
+        template = 'column'
+    elif tool == 'cprofile':
+        column_widths = [14, 80]
+        template = 'row'
+    with profile_print(column_widths, field_format, template) as out:
+        out.header(['STACK DEPTH', 'BY NAME (us/site)', 'COMPILED (us/site)', 'SPEEDUP'])
+        original_apply_stack = pyro.util.apply_stack
+        for depth in depths:
+            model = wrap(make_model(num_sites), depth)
+            pyro.apply_stack = uncompiled_apply_stack
+            try:
+                _, by_name = run_model(model, depth, num_sites, compiled=False)
+            finally:
+                pyro.apply_stack = original_apply_stack
+            _, compiled = run_model(model, depth, num_sites, compiled=True)
+            if tool == 'timeit':
+                by_name, compiled = 1e6 * by_name / num_sites, 1e6 * compiled / num_sites
+                out.push([depth, by_name, compiled, by_name / compiled])
+            else:
+                out.push([depth, by_name])
+                out.push([depth, compiled])
+
+
+def set_tool_cfg(args):
+    global TOOL, TOOL_CFG
+    TOOL = args.tool
+    tool_cfg = {}
+    if args.tool == 'timeit':
+        repeat = 5
+        if args.repeat is not None:
+            repeat = args.repeat
+        tool_cfg = {'repeat': repeat}
+    TOOL_CFG = tool_cfg
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profiling the per-site overhead of pyro.util.apply_stack '
+                                     'as a function of the depth of the poutine stack.')
+    parser.add_argument(
+        '--tool',
+        nargs='?',
+        default='timeit',
+        help='Profile using tool. One of following should be specified:'
+        ' ["timeit", "cprofile"]')
+    parser.add_argument(
+        '--depths',
+        nargs='*',
+        type=int,
+        help='Depths of the poutine stack to profile. Default = [1, 2, 4, 8, 16]')
+    parser.add_argument(
+        '--num_sites',
+        nargs='?',
+        default=1000,
+        type=int,
+        help='Number of sample sites in the profiled model. default=1000.')
+    parser.add_argument(
+        '--repeat',
+        nargs='?',
+        default=5,
+        type=int,
+        help='When profiling using "timeit", the number of repetitions to '
+        'use for the profiled function. default=5. The minimum value '
+        'is reported.')
+    args = parser.parse_args()
+    set_tool_cfg(args)
+    depths = args.depths
+    if not depths:
+        depths = [1, 2, 4, 8, 16]
+    run_with_tool(args.tool, depths, args.num_sites)
+
+
+if __name__ == '__main__':
+    main()
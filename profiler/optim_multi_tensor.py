@@ -0,0 +1,129 @@
+from __future__ import absolute_import, division, print_function
+
+import argparse
+
+import torch
+from torch.autograd import Variable
+
+from profiler.profiling_utils import Profile, profile_print
+from pyro.optim.adagrad_rmsprop import AdagradRMSProp
+from pyro.optim.clipped_adam import ClippedAdam
+
+TOOL = 'timeit'
+TOOL_CFG = {}
+OPTIMIZERS = {
+    'ClippedAdam': (ClippedAdam, {'lr': 0.01}),
+    'AdagradRMSProp': (AdagradRMSProp, {'eta': 0.01}),
+}
+
+
+def get_tool():
+    return TOOL
+
+
+def get_tool_cfg():
+    return TOOL_CFG
+
+
+@Profile(
+    tool=get_tool,
+    tool_cfg=get_tool_cfg,
+    fn_id=lambda optimizer, name, num_tensors, multi_tensor: '{}_tensors={}_multi_tensor={}'.format(
+        name, num_tensors, multi_tensor))
+def step(optimizer, name, num_tensors, multi_tensor):
+    optimizer.step()
+
+
+def make_optimizer(name, num_tensors, tensor_size, multi_tensor):
+    optim_class, optim_args = OPTIMIZERS[name]
+    params = []
+    for _ in range(num_tensors):
+        param = Variable(torch.randn(tensor_size), requires_grad=True)
+        param.grad = Variable(torch.randn(tensor_size))
+        params.append(param)
+    optimizer = optim_class(params, multi_tensor=multi_tensor, **optim_args)
+    # initializes the state outside of the measurement
+    optimizer.step()
+    return optimizer
+
+
+def run_with_tool(tool, names, num_tensors, tensor_size):
+    column_widths, field_format, template = None, None, None
+    if tool == 'timeit':
+        column_widths = [16, 14, 16, 20, 10]
+        field_format = [None, None, '{:.6f}', '{:.6f}', '{:.2f}']
+        template = 'column'
+    elif tool == 'cprofile':
+        column_widths = [16, 14, 80]
+        template = 'row'
+    with profile_print(column_widths, field_format, template) as out:
+        out.header(['OPTIMIZER', 'NUM TENSORS', 'PER PARAM (s)', 'MULTI TENSOR (s)', 'SPEEDUP'])
+        for name in names:
+            for n in num_tensors:
+                _, per_param = step(make_optimizer(name, n, tensor_size, False), name, n, multi_tensor=False)
+                _, multi_tensor = step(make_optimizer(name, n, tensor_size, True), name, n, multi_tensor=True)
+                if tool == 'timeit':
+                    out.push([name, n, per_param, multi_tensor, per_param / multi_tensor])
+                else:
+                    out.push([name, n, per_param])
+                    out.push([name, n, multi_tensor])
+
+
+def set_tool_cfg(args):
+    global TOOL, TOOL_CFG
+    TOOL = args.tool
+    tool_cfg = {}
+    if args.tool == 'timeit':
+        repeat = 5
+        if args.repeat is not None:
+            repeat = args.repeat
+        tool_cfg = {'repeat': repeat}
+    TOOL_CFG = tool_cfg
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profiling a step of ClippedAdam and AdagradRMSProp '
+                                     'against the number of parameter tensors, updating one tensor at '
+                                     'a time versus all tensors at once.')
+    parser.add_argument(
+        '--tool',
+        nargs='?',
+        default='timeit',
+        help='Profile using tool. One of following should be specified:'
+        ' ["timeit", "cprofile"]')
+    parser.add_argument(
+        '--optimizers',
+        nargs='*',
+        help='Optimizers to profile. Default = ["ClippedAdam", "AdagradRMSProp"]')
+    parser.add_argument(
+        '--num_tensors',
+        nargs='*',
+        type=int,
+        help='Numbers of parameter tensors to profile. Default = [1, 10, 100, 1000]')
+    parser.add_argument(
+        '--tensor_size',
+        nargs='?',
+        default=100,
+        type=int,
+        help='Number of elements of each parameter tensor. default=100.')
+    parser.add_argument(
+        '--repeat',
+        nargs='?',
+        default=5,
+        type=int,
+        help='When profiling using "timeit", the number of repetitions to '
+        'use for the profiled function. default=5. The minimum value '
+        'is reported.')
+    args = parser.parse_args()
+    set_tool_cfg(args)
+    names = args.optimizers
+    if not names:
+        names = ['ClippedAdam', 'AdagradRMSProp']
+    num_tensors = args.num_tensors
+    if not num_tensors:
+        num_tensors = [1, 10, 100, 1000]
+    run_with_tool(args.tool, names, num_tensors, args.tensor_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,7 +6,7 @@ import os
 import pstats
 import timeit
 from contextlib import contextmanager
-from cStringIO import StringIO
+from six.moves import cStringIO as StringIO
 
 from prettytable import ALL, PrettyTable
 
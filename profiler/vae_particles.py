@@ -0,0 +1,167 @@
+from __future__ import absolute_import, division, print_function
+
+import argparse
+
+import torch
+import torch.nn as nn
+from torch.autograd import Variable
+
+import pyro
+import pyro.distributions as dist
+from profiler.profiling_utils import Profile, profile_print
+from pyro.infer.trace_elbo import Trace_ELBO
+from pyro.util import ng_ones, ng_zeros
+
+TOOL = 'timeit'
+TOOL_CFG = {}
+fudge = 1e-7
+
+
+# the model and guide of examples/vae.py, without the dependencies of the example
+class Encoder(nn.Module):
+    def __init__(self, z_dim, hidden_dim):
+        super(Encoder, self).__init__()
+        self.fc1 = nn.Linear(784, hidden_dim)
+        self.fc21 = nn.Linear(hidden_dim, z_dim)
+        self.fc22 = nn.Linear(hidden_dim, z_dim)
+        self.softplus = nn.Softplus()
+
+    def forward(self, x):
+        x = x.view(-1, 784)
+        hidden = self.softplus(self.fc1(x))
+        z_mu = self.fc21(hidden)
+        z_sigma = torch.exp(self.fc22(hidden))
+        return z_mu, z_sigma
+
+
+class Decoder(nn.Module):
+    def __init__(self, z_dim, hidden_dim):
+        super(Decoder, self).__init__()
+        self.fc1 = nn.Linear(z_dim, hidden_dim)
+        self.fc21 = nn.Linear(hidden_dim, 784)
+        self.softplus = nn.Softplus()
+        self.sigmoid = nn.Sigmoid()
+
+    def forward(self, z):
+        hidden = self.softplus(self.fc1(z))
+        mu_img = (self.sigmoid(self.fc21(hidden)) + fudge) * (1 - 2 * fudge)
+        return mu_img
+
+
+class VAE(nn.Module):
+    def __init__(self, z_dim=50, hidden_dim=400):
+        super(VAE, self).__init__()
+        self.encoder = Encoder(z_dim, hidden_dim)
+        self.decoder = Decoder(z_dim, hidden_dim)
+        self.z_dim = z_dim
+
+    def model(self, x):
+        pyro.module("decoder", self.decoder)
+        z_mu = ng_zeros([x.size(0), self.z_dim], type_as=x.data)
+        z_sigma = ng_ones([x.size(0), self.z_dim], type_as=x.data)
+        # with vectorized particles, z and mu_img get a leftmost particle dimension
+        z = pyro.sample("latent", dist.Normal(z_mu, z_sigma))
+        mu_img = self.decoder.forward(z)
+        pyro.sample("obs", dist.Bernoulli(mu_img), obs=x.view(-1, 784))
+
+    def guide(self, x):
+        pyro.module("encoder", self.encoder)
+        z_mu, z_sigma = self.encoder.forward(x)
+        pyro.sample("latent", dist.Normal(z_mu, z_sigma))
+
+
+def get_tool():
+    return TOOL
+
+
+def get_tool_cfg():
+    return TOOL_CFG
+
+
+@Profile(
+    tool=get_tool,
+    tool_cfg=get_tool_cfg,
+    fn_id=lambda elbo, vae, data, num_particles, vectorized: 'vae_particles={}_vectorized={}'.format(
+        num_particles, vectorized))
+def loss_and_grads(elbo, vae, data, num_particles, vectorized):
+    return elbo.loss_and_grads(vae.model, vae.guide, data)
+
+
+def run_with_tool(tool, particles, batch_size):
+    column_widths, field_format, template = None, None, None
+    if tool == 'timeit':
+        column_widths = [14] * 4
+        field_format = [None, '{:.4f}', '{:.4f}', '{:.2f}']
+        template = 'column'
+    elif tool == 'cprofile':
+        column_widths = [14, 80]
+        template = 'row'
+    pyro.clear_param_store()
+    vae = VAE()
+    data = Variable(torch.rand(batch_size, 784).round())
+    with profile_print(column_widths, field_format, template) as out:
+        out.header(['NUM PARTICLES', 'LOOP (s/step)', 'VECTORIZED (s/step)', 'SPEEDUP'])
+        for num_particles in particles:
+            loop_elbo = Trace_ELBO(num_particles=num_particles)
+            vectorized_elbo = Trace_ELBO(num_particles=num_particles, vectorize_particles=True)
+            # records the site shapes outside of the measurement
+            vectorized_elbo.loss(vae.model, vae.guide, data)
+            _, loop = loss_and_grads(loop_elbo, vae, data, num_particles, vectorized=False)
+            _, vectorized = loss_and_grads(vectorized_elbo, vae, data, num_particles, vectorized=True)
+            if tool == 'timeit':
+                out.push([num_particles, loop, vectorized, loop / vectorized])
+            else:
+                out.push([num_particles, loop])
+                out.push([num_particles, vectorized])
+
+
+def set_tool_cfg(args):
+    global TOOL, TOOL_CFG
+    TOOL = args.tool
+    tool_cfg = {}
+    if args.tool == 'timeit':
+        repeat = 5
+        if args.repeat is not None:
+            repeat = args.repeat
+        tool_cfg = {'repeat': repeat}
+    TOOL_CFG = tool_cfg
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profiling a step of Trace_ELBO on the VAE model of '
+                                     'examples/vae.py, looping over particles versus vectorizing them.')
+    parser.add_argument(
+        '--tool',
+        nargs='?',
+        default='timeit',
+        help='Profile using tool. One of following should be specified:'
+        ' ["timeit", "cprofile"]')
+    parser.add_argument(
+        '--particles',
+        nargs='*',
+        type=int,
+        help='Numbers of particles to profile. Default = [1, 10, 100]')
+    parser.add_argument(
+        '--batch_size',
+        nargs='?',
+        default=128,
+        type=int,
+        help='Size of the minibatch of random binary images. default=128.')
+    parser.add_argument(
+        '--repeat',
+        nargs='?',
+        default=5,
+        type=int,
+        help='When profiling using "timeit", the number of repetitions to '
+        'use for the profiled function. default=5. The minimum value '
+        'is reported.')
+    args = parser.parse_args()
+    set_tool_cfg(args)
+    particles = args.particles
+    if not particles:
+        particles = [1, 10, 100]
+    run_with_tool(args.tool, particles, args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ from __future__ import absolute_import, division, print_function
 import contextlib
 import copy
 import logging
+import threading
 import warnings
 from collections import OrderedDict
 from inspect import isclass
@@ -12,8 +13,11 @@ from torch.autograd import Variable
 
 import pyro.poutine as poutine
 from pyro.distributions.distribution import Distribution
-from pyro.params import _MODULE_NAMESPACE_DIVIDER, _PYRO_PARAM_STORE, param_with_module_name
+from pyro.params import _MODULE_NAMESPACE_DIVIDER, get_current_param_store, param_with_module_name
+from pyro.params import param_store_scope  # noqa: F401
 from pyro.poutine import _PYRO_STACK, condition, do  # noqa: F401
+from pyro.poutine.message import Message
+from pyro.shim import ContextVar
 from pyro.util import apply_stack, deep_getattr, get_tensor_data, ones, set_rng_seed, zeros, am_i_wrapped  # noqa: F401
 
 __version__ = '0.1.2'
@@ -21,19 +25,23 @@ __version__ = '0.1.2'
 # Default logger to prevent 'No handler found' warning.
 logging.getLogger(__name__).addHandler(logging.NullHandler())
 
+# the frame of the frozen predictor running in the current context, if any, see pyro.infer.frozen
+_FROZEN_FRAME = ContextVar("pyro_frozen_frame", default=None)
+
 
 def get_param_store():
     """
-    Returns the ParamStore
+    Returns the ParamStore, i.e. the param store of the current context if it is in a
+    :func:`~pyro.params.param_store_scope`, else the global one
     """
-    return _PYRO_PARAM_STORE
+    return get_current_param_store()
 
 
 def clear_param_store():
     """
     Clears the ParamStore. This is especially useful if you're working in a REPL.
     """
-    return _PYRO_PARAM_STORE.clear()
+    return get_current_param_store().clear()
 
 
 def sample(name, fn, *args, **kwargs):
@@ -56,6 +64,9 @@ def sample(name, fn, *args, **kwargs):
     # check if stack is empty
     # if stack empty, default behavior (defined here)
     if not am_i_wrapped():
+        frame = _FROZEN_FRAME.get()
+        if frame is not None:
+            return frame.sample(name, fn, obs, args, kwargs)
         if obs is not None:
             warnings.warn("trying to observe a value outside of inference at " + name,
                           RuntimeWarning)
@@ -64,28 +75,14 @@ def sample(name, fn, *args, **kwargs):
     # if stack not empty, apply everything in the stack?
     else:
         # initialize data structure to pass up/down the stack
-        msg = {
-            "type": "sample",
-            "name": name,
-            "fn": fn,
-            "is_observed": False,
-            "args": args,
-            "kwargs": kwargs,
-            "value": None,
-            "infer": infer,
-            "scale": 1.0,
-            "cond_indep_stack": [],
-            "done": False,
-            "stop": False,
-            "continuation": None
-        }
+        msg = Message("sample", name, fn, False, args, kwargs, None, infer, 1.0, [], False, False, None)
         # handle observation
         if obs is not None:
-            msg["value"] = obs
-            msg["is_observed"] = True
+            msg.value = obs
+            msg.is_observed = True
         # apply the stack and return its return value
         apply_stack(msg)
-        return msg["value"]
+        return msg.value
 
 
 def observe(name, fn, obs, *args, **kwargs):
@@ -101,6 +98,85 @@ def observe(name, fn, obs, *args, **kwargs):
     return sample(name, fn, *args, **kwargs)
 
 
+def _sample_without_replacement(size, subsample_size):
+    """
+    Draws ``subsample_size`` distinct indices uniformly at random from ``range(size)``, in
+    O(subsample_size) time and memory when ``subsample_size`` is small compared to ``size``: indices are
+    drawn with replacement, and the duplicates are drawn again until there are none left. Since this
+    is symmetric in the indices, the resulting subset is uniformly distributed.
+
+    :rtype: torch.LongTensor
+    """
+    if subsample_size * 4 > size:
+        # there would be too many duplicates
+        return torch.randperm(size)[:subsample_size]
+    result = (torch.DoubleTensor(subsample_size).uniform_() * size).long()
+    while True:
+        sorted_result, order = result.sort()
+        duplicate = sorted_result[1:] == sorted_result[:-1]
+        if not duplicate.any():
+            return result
+        positions = order[1:].masked_select(duplicate)
+        result.index_copy_(0, positions, (torch.DoubleTensor(len(positions)).uniform_() * size).long())
+
+
+class _EpochPermutation(object):
+    """
+    A persistent random permutation of ``range(size)`` that is consumed in contiguous chunks. When a
+    permutation is used up, the next epoch starts with a new one, so that every index is drawn exactly
+    once per epoch. A chunk that crosses the end of an epoch is completed from the next one, whose
+    permutation is then drawn so that the chunk does not contain any index twice.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.epoch = 0
+        self._permutation = torch.randperm(size)
+        self._position = 0
+        self._lock = threading.Lock()
+
+    def _next_epoch(self, taken, num_needed):
+        self.epoch += 1
+        permutation = torch.randperm(self.size)
+        if len(taken):
+            # move the indices already in the chunk after the first num_needed ones
+            is_taken = torch.zeros(self.size).long().index_fill_(0, taken, 1).index_select(0, permutation)
+            order = (is_taken * self.size + torch.arange(0, self.size).long()).sort()[1]
+            permutation = permutation.index_select(0, order)
+            rest = permutation[num_needed:]
+            permutation = torch.cat([permutation[:num_needed], rest.index_select(0, torch.randperm(len(rest)))])
+        self._permutation = permutation
+        self._position = 0
+
+    def next_chunk(self, chunk_size):
+        with self._lock:
+            return self._next_chunk(chunk_size)
+
+    def _next_chunk(self, chunk_size):
+        chunks = []
+        num_taken = 0
+        while num_taken < chunk_size:
+            if self._position == self.size:
+                self._next_epoch(torch.cat(chunks) if chunks else torch.LongTensor(), chunk_size - num_taken)
+            length = min(chunk_size - num_taken, self.size - self._position)
+            chunks.append(self._permutation.narrow(0, self._position, length))
+            self._position += length
+            num_taken += length
+        return chunks[0] if len(chunks) == 1 else torch.cat(chunks)
+
+
+# data sources of iaranges of the current context, by iarange name; the dict is replaced, never modified
+_DATA_SOURCES = ContextVar("pyro_data_sources", default={})
+
+
+def _shard_bounds(subsample_size, rank, num_shards):
+    """
+    :returns: the ``(start, stop)`` positions of a shard of a subsample, in contiguous shards of
+        balanced sizes
+    """
+    return subsample_size * rank // num_shards, subsample_size * (rank + 1) // num_shards
+
+
 class _Subsample(Distribution):
     """
     Randomly select a subsample of a range of indices.
@@ -108,15 +184,18 @@ class _Subsample(Distribution):
     Internal use only. This should only be used by `iarange`.
     """
 
-    def __init__(self, size, subsample_size, use_cuda=None):
+    def __init__(self, size, subsample_size, use_cuda=None, sampler=None):
         """
         :param int size: the size of the range to subsample from
         :param int subsample_size: the size of the returned subsample
         :param bool use_cuda: whether to use cuda tensors
+        :param sampler: an object whose ``next_chunk(subsample_size)`` method returns the next
+            subsample, e.g. an epoch permutation or a data source, or None to draw independent subsamples
         """
         self.size = size
         self.subsample_size = subsample_size
         self.use_cuda = torch.Tensor.is_cuda if use_cuda is None else use_cuda
+        self.sampler = sampler
 
     def sample(self, sample_shape=torch.Size()):
         """
@@ -130,8 +209,10 @@ class _Subsample(Distribution):
             subsample_size = self.size
         if subsample_size == self.size:
             result = Variable(torch.LongTensor(list(range(self.size))))
+        elif self.sampler is not None:
+            result = Variable(self.sampler.next_chunk(subsample_size))
         else:
-            result = Variable(torch.randperm(self.size)[:self.subsample_size])
+            result = Variable(_sample_without_replacement(self.size, subsample_size))
         return result.cuda() if self.use_cuda else result
 
     def log_prob(self, x):
@@ -141,10 +222,12 @@ class _Subsample(Distribution):
         return result.cuda() if self.use_cuda else result
 
 
-def _subsample(name, size=None, subsample_size=None, subsample=None, use_cuda=None):
+def _subsample(name, size=None, subsample_size=None, subsample=None, use_cuda=None, subsample_mode="random"):
     """
     Helper function for iarange and irange. See their docstrings for details.
     """
+    if subsample_mode not in ("random", "epoch"):
+        raise ValueError("unknown subsample_mode: {}".format(subsample_mode))
     if size is None:
         assert subsample_size is None
         assert subsample is None
@@ -153,7 +236,23 @@ def _subsample(name, size=None, subsample_size=None, subsample=None, use_cuda=No
     elif subsample is None:
         names = [name]
         names += [str(f.counter) for f in _PYRO_STACK if isinstance(f, poutine.IndepMessenger)]
-        subsample = sample("_".join(names), _Subsample(size, subsample_size, use_cuda))
+        site_name = "_".join(names)
+        sampler = _DATA_SOURCES.get().get(name)
+        if sampler is not None:
+            if sampler.size != size:
+                raise ValueError("iarange '{}' has size {} but its data source has size {}".format(
+                    name, size, sampler.size))
+        elif subsample_mode == "epoch":
+            # the epoch state is kept with the params, so that it is reset by clear_param_store and
+            # separate for each param_store_scope
+            sampler = get_current_param_store().get_epoch_permutation(site_name, size)
+        subsample = sample(site_name, _Subsample(size, subsample_size, use_cuda, sampler))
+        # the subsample is restricted to a shard by a messenger of the current stack, e.g. a ShardMessenger
+        shards = [f.get_shard(name) for f in _PYRO_STACK if hasattr(f, "get_shard")]
+        shard = next((s for s in shards if s is not None), None)
+        if shard is not None:
+            start, stop = _shard_bounds(size if subsample_size is None else subsample_size, *shard)
+            subsample_size = stop - start
 
     if subsample_size is None:
         subsample_size = len(subsample)
@@ -167,7 +266,7 @@ def _subsample(name, size=None, subsample_size=None, subsample=None, use_cuda=No
 
 
 @contextlib.contextmanager
-def iarange(name, size=None, subsample_size=None, subsample=None, use_cuda=None):
+def iarange(name, size=None, subsample_size=None, subsample=None, use_cuda=None, subsample_mode="random"):
     """
     Context manager for conditionally independent ranges of variables.
 
@@ -196,6 +295,17 @@ def iarange(name, size=None, subsample_size=None, subsample=None, use_cuda=None)
     single random batch of indices of size ``subsample_size`` and scales all
     log likelihood terms by ``size/batch_size``, within this context.
 
+    With ``subsample_mode="random"`` each batch is drawn independently, in
+    O(subsample_size) time and memory when ``subsample_size`` is small compared
+    to ``size``. With ``subsample_mode="epoch"`` the batches are contiguous
+    chunks of a shuffled permutation of the indices that persists across calls
+    with the same name, so that every index is visited exactly once per epoch.
+    The permutations are kept in the param store of the current context, see
+    :func:`~pyro.params.param_store_scope`, so that ``clear_param_store``
+    starts new epochs and jobs with separate param stores do not share them.
+    They are not saved with the params, so that a restored param store also
+    starts new epochs.
+
     .. warning::  This is only correct if all computation is conditionally
         independent within the context.
 
@@ -211,6 +321,8 @@ def iarange(name, size=None, subsample_size=None, subsample=None, use_cuda=None)
     :type subsample: Anything supporting `len()`.
     :param bool use_cuda: Optional bool specifying whether to use cuda tensors
         for `subsample` and `log_pdf`. Defaults to `torch.Tensor.is_cuda`.
+    :param str subsample_mode: How subsamples are drawn, either `"random"`
+        (default) or `"epoch"`.
     :return: A context manager yielding a single 1-dimensional `torch.Tensor`
         of indices.
 
@@ -232,7 +344,7 @@ def iarange(name, size=None, subsample_size=None, subsample=None, use_cuda=None)
     See `SVI Part II <http://pyro.ai/examples/svi_part_ii.html>`_ for an
     extended discussion.
     """
-    subsample, scale = _subsample(name, size, subsample_size, subsample, use_cuda)
+    subsample, scale = _subsample(name, size, subsample_size, subsample, use_cuda, subsample_mode)
     if not am_i_wrapped():
         yield subsample
     else:
@@ -241,7 +353,7 @@ def iarange(name, size=None, subsample_size=None, subsample=None, use_cuda=None)
                 yield subsample
 
 
-def irange(name, size, subsample_size=None, subsample=None, use_cuda=None):
+def irange(name, size, subsample_size=None, subsample=None, use_cuda=None, subsample_mode="random"):
     """
     Non-vectorized version of ``iarange``. See ``iarange`` for details.
 
@@ -257,6 +369,8 @@ def irange(name, size, subsample_size=None, subsample=None, use_cuda=None):
     :param bool use_cuda: Optional bool specifying whether to use cuda tensors
         for internal ``log_pdf`` computations. Defaults to
         ``torch.Tensor.is_cuda``.
+    :param str subsample_mode: How subsamples are drawn, either ``"random"``
+        (default) or ``"epoch"``. See ``iarange`` for details.
     :return: A generator yielding a sequence of integers.
 
     Examples::
@@ -267,7 +381,7 @@ def irange(name, size, subsample_size=None, subsample=None, use_cuda=None):
 
     See `SVI Part II <http://pyro.ai/examples/svi_part_ii.html>`_ for an extended discussion.
     """
-    subsample, scale = _subsample(name, size, subsample_size, subsample, use_cuda)
+    subsample, scale = _subsample(name, size, subsample_size, subsample, use_cuda, subsample_mode)
     if isinstance(subsample, Variable):
         subsample = subsample.data
     if not am_i_wrapped():
@@ -282,7 +396,7 @@ def irange(name, size, subsample_size=None, subsample=None, use_cuda=None):
                     yield i
 
 
-def map_data(name, data, fn, batch_size=None, batch_dim=0, use_cuda=None):
+def map_data(name, data, fn, batch_size=None, batch_dim=0, use_cuda=None, subsample_mode="random"):
     """
     Data subsampling with the important property that all the data are conditionally independent.
 
@@ -296,17 +410,61 @@ def map_data(name, data, fn, batch_size=None, batch_dim=0, use_cuda=None):
     :param int batch_dim: dimension to subsample for tensor inputs
     :param bool use_cuda: Optional bool specifying whether to use cuda tensors
         for `log_pdf`. Defaults to `torch.Tensor.is_cuda`.
+    :param str subsample_mode: how batches are drawn, either `"random"` (default) or `"epoch"`;
+        see `iarange` for details
     :return: a list of values returned by `fn`
+
+    If a data source is registered with the name, see :func:`register_data_source`, the batches of
+    tensor data are taken from the data source, which must wrap the same ``data`` along the same
+    ``batch_dim``; otherwise a ``ValueError`` is raised.
     """
 
     use_cuda = use_cuda or getattr(data, 'is_cuda', None)
     if isinstance(data, (torch.Tensor, Variable)):
         size = data.size(batch_dim)
-        with iarange(name, size, batch_size, use_cuda=use_cuda) as batch:
+        with iarange(name, size, batch_size, use_cuda=use_cuda, subsample_mode=subsample_mode) as batch:
+            data_source = _DATA_SOURCES.get().get(name)
+            if data_source is not None:
+                if getattr(data_source, "data", data) is not data or \
+                        getattr(data_source, "batch_dim", 0) != batch_dim:
+                    raise ValueError("the data source of map_data '{}' must wrap its data along its "
+                                     "batch_dim".format(name))
+                return fn(batch, data_source[batch])
             return fn(batch, data.index_select(batch_dim, batch))
     else:
         size = len(data)
-        return [fn(i, data[i]) for i in irange(name, size, batch_size, use_cuda=use_cuda)]
+        return [fn(i, data[i]) for i in irange(name, size, batch_size, use_cuda=use_cuda,
+                                               subsample_mode=subsample_mode)]
+
+
+def register_data_source(name, data_source):
+    """
+    Registers a data source, e.g. a :class:`~pyro.data_source.DataSource`, with the ``iarange``,
+    ``irange`` or ``map_data`` of a name. The subsamples of the range are then drawn by the data
+    source, which can prepare the corresponding batches ahead of time::
+
+        source = DataSource(data, subsample_size=256)
+        pyro.register_data_source("data", source)
+
+        def model():
+            with pyro.iarange("data", len(data), subsample_size=256) as ind:
+                batch = source[ind]  # the batch was gathered in the background
+
+    Like the Pyro stack, data sources are registered in the current context, i.e. the current thread
+    or asyncio task, so that independent jobs of a process can register data sources with the same
+    name: a new thread starts without data sources, and an asyncio task starts with those of the
+    context that created it.
+
+    :param str name: the name of the range
+    :param data_source: an object with a ``size`` attribute and a ``next_chunk(subsample_size)`` method
+        that returns the next subsample, or None to unregister the data source of the name
+    """
+    data_sources = dict(_DATA_SOURCES.get())
+    if data_source is None:
+        data_sources.pop(name, None)
+    else:
+        data_sources[name] = data_source
+    _DATA_SOURCES.set(data_sources)
 
 
 # XXX this should have the same call signature as torch.Tensor constructors
@@ -320,24 +478,15 @@ def param(name, *args, **kwargs):
     :returns: parameter
     """
     if not am_i_wrapped():
-        return _PYRO_PARAM_STORE.get_param(name, *args, **kwargs)
+        frame = _FROZEN_FRAME.get()
+        if frame is not None:
+            return frame.param(name)
+        return get_current_param_store().get_param(name, *args, **kwargs)
     else:
-        msg = {
-            "type": "param",
-            "name": name,
-            "args": args,
-            "kwargs": kwargs,
-            "infer": {},
-            "scale": 1.0,
-            "cond_indep_stack": [],
-            "value": None,
-            "done": False,
-            "stop": False,
-            "continuation": None
-        }
+        msg = Message("param", name, None, False, args, kwargs, None, {}, 1.0, [], False, False, None)
         # apply the stack and return its return value
         apply_stack(msg)
-        return msg["value"]
+        return msg.value
 
 
 def module(name, nn_module, tags="default", update_module_params=False):
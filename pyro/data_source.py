@@ -0,0 +1,206 @@
+from __future__ import absolute_import, division, print_function
+
+import threading
+from collections import deque
+
+import torch
+from six.moves import queue
+from torch.autograd import Variable
+
+from pyro import _EpochPermutation, _sample_without_replacement
+
+
+def is_contiguous_range(indices):
+    """
+    :param torch.LongTensor indices: a one dimensional tensor of indices
+    :returns: whether the indices are ``start, start + 1, ..., start + len(indices) - 1``
+    :rtype: bool
+    """
+    if len(indices) < 2:
+        return True
+    return indices[-1] - indices[0] == len(indices) - 1 and ((indices[1:] - indices[:-1]) == 1).all()
+
+
+class _SequentialChunks(object):
+    """
+    Contiguous chunks of ``range(size)`` in order, wrapping around at the end.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.epoch = 0
+        self._position = 0
+
+    def next_chunk(self, chunk_size):
+        chunks = []
+        num_taken = 0
+        while num_taken < chunk_size:
+            if self._position == self.size:
+                self.epoch += 1
+                self._position = 0
+            length = min(chunk_size - num_taken, self.size - self._position)
+            chunks.append(torch.arange(self._position, self._position + length).long())
+            self._position += length
+            num_taken += length
+        return chunks[0] if len(chunks) == 1 else torch.cat(chunks)
+
+
+class _RandomChunks(object):
+    """
+    Independent random subsamples of ``range(size)``.
+    """
+
+    def __init__(self, size):
+        self.size = size
+
+    def next_chunk(self, chunk_size):
+        return _sample_without_replacement(self.size, chunk_size)
+
+
+class _Batch(object):
+    def __init__(self, indices):
+        self.indices = indices
+        self.value = None
+        self.error = None
+        self.ready = threading.Event()
+
+
+class DataSource(object):
+    """
+    A source of minibatches of a dataset, to be registered with an ``iarange`` (or ``irange`` or
+    ``map_data``) using :func:`pyro.register_data_source`. The data source draws the subsample indices
+    of the range ahead of time, and gathers the corresponding batches on background worker threads, so
+    that the batch of a subsample is ready when the ``iarange`` opens. Index the data source with the
+    indices yielded by the ``iarange`` to get the batch::
+
+        source = DataSource(data, subsample_size=256)
+        pyro.register_data_source("data", source)
+
+        def model():
+            with pyro.iarange("data", len(data), subsample_size=256) as ind:
+                batch = source[ind]
+                ...
+
+    Batches of contiguous indices, e.g. with ``subsample_mode="sequential"``, are views of the data
+    rather than copies.
+
+    :param data: a tensor, or a tuple of tensors of the same size along ``batch_dim``
+    :param int subsample_size: the size of the subsamples, which must match the ``subsample_size``
+        of the range
+    :param str subsample_mode: how subsamples are drawn: ``"random"`` for independent subsamples,
+        ``"epoch"`` for chunks of a shuffled permutation that visits every index once per epoch, or
+        ``"sequential"`` for contiguous chunks in order
+    :param int batch_dim: the dimension of the data to subsample
+    :param int num_workers: the number of worker threads gathering batches
+    :param int prefetch: the number of batches to gather ahead of time
+    :param callable collate: an optional function taking ``(data, indices)`` and returning a batch;
+        defaults to selecting the indices along ``batch_dim`` of each tensor
+    """
+
+    def __init__(self, data, subsample_size, subsample_mode="random", batch_dim=0, num_workers=1,
+                 prefetch=2, collate=None):
+        self.data = data
+        tensors = data if isinstance(data, tuple) else (data,)
+        self.size = tensors[0].size(batch_dim)
+        if any(t.size(batch_dim) != self.size for t in tensors):
+            raise ValueError("all the tensors of a DataSource must have the same size along batch_dim")
+        self.subsample_size = subsample_size
+        self.batch_dim = batch_dim
+        self.prefetch = prefetch
+        self.collate = collate
+        if subsample_mode == "random":
+            self._chunks = _RandomChunks(self.size)
+        elif subsample_mode == "epoch":
+            self._chunks = _EpochPermutation(self.size)
+        elif subsample_mode == "sequential":
+            self._chunks = _SequentialChunks(self.size)
+        else:
+            raise ValueError("unknown subsample_mode: {}".format(subsample_mode))
+        self._pending = deque()  # batches in the order their subsamples will be drawn
+        self._current = None  # the batch of the last subsample drawn
+        self._jobs = queue.Queue()
+        self._workers = []
+        for _ in range(num_workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def gather(self, indices):
+        """
+        Gathers the batch of some indices on the calling thread.
+
+        :param torch.LongTensor indices: the indices of the batch
+        :returns: the batch
+        """
+        if self.collate is not None:
+            return self.collate(self.data, indices)
+        contiguous = is_contiguous_range(indices)
+        batch = []
+        for t in self.data if isinstance(self.data, tuple) else (self.data,):
+            if contiguous:
+                t = t.narrow(self.batch_dim, int(indices[0]) if len(indices) else 0, len(indices))
+            else:
+                t = t.index_select(self.batch_dim, Variable(indices) if isinstance(t, Variable) else indices)
+            batch.append(t)
+        return tuple(batch) if isinstance(self.data, tuple) else batch[0]
+
+    def _work(self):
+        while True:
+            batch = self._jobs.get()
+            if batch is None:
+                return
+            try:
+                batch.value = self.gather(batch.indices)
+            except Exception as e:
+                batch.error = e
+            batch.ready.set()
+
+    def _fill(self):
+        while len(self._pending) < self.prefetch:
+            batch = _Batch(self._chunks.next_chunk(self.subsample_size))
+            self._pending.append(batch)
+            self._jobs.put(batch)
+
+    def next_chunk(self, subsample_size):
+        """
+        Draws the next subsample, whose batch is being gathered in the background. This is called by
+        the range the data source is registered with.
+
+        :param int subsample_size: the size of the subsample
+        :rtype: torch.LongTensor
+        """
+        if subsample_size != self.subsample_size:
+            raise ValueError("subsample_size {} does not match the subsample_size {} of the data source"
+                             .format(subsample_size, self.subsample_size))
+        self._fill()
+        self._current = self._pending.popleft()
+        self._fill()
+        return self._current.indices
+
+    def __getitem__(self, indices):
+        """
+        :param indices: subsample indices yielded by the range the data source is registered with
+        :returns: the batch of the indices; if they are not the last subsample drawn, e.g. if the range
+            did not draw them, the batch is gathered on the calling thread
+        """
+        if isinstance(indices, Variable):
+            indices = indices.data
+        indices = indices.cpu()
+        batch = self._current
+        if batch is None or len(batch.indices) != len(indices) or not batch.indices.equal(indices):
+            return self.gather(indices)
+        batch.ready.wait()
+        if batch.error is not None:
+            raise batch.error
+        return batch.value
+
+    def close(self):
+        """
+        Stops the worker threads.
+        """
+        for _ in self._workers:
+            self._jobs.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
@@ -126,6 +126,39 @@ def sum_leftmost(x, dim):
     return x.contiguous().view(-1, *x.shape[dim:]).sum(0)
 
 
+def sum_terms(terms):
+    """
+    Sums a list of numbers and tensors with a single stacked reduction,
+    rather than adding the terms one by one, which creates a chain of small
+    autograd nodes. Tensors of different shapes are broadcast against each
+    other.
+
+    :param list terms: numbers and ``torch.autograd.Variable`` s to sum.
+    :returns: the sum, or the number zero if ``terms`` is empty.
+    """
+    number = 0
+    tensors = []
+    for term in terms:
+        if isinstance(term, numbers.Number):
+            number = number + term
+        else:
+            tensors.append(term)
+    if not tensors:
+        return number
+    if len(tensors) == 1:
+        result = tensors[0]
+    else:
+        shape = tensors[0].size()
+        if all(tensor.size() == shape for tensor in tensors):
+            result = torch.stack(tensors).sum(0)
+        else:
+            shape = broadcast_shape(*(tensor.size() for tensor in tensors))
+            result = torch.stack([tensor.expand(shape) for tensor in tensors]).sum(0)
+    if number != 0:
+        result = result + number
+    return result
+
+
 def scale_tensor(tensor, scale):
     """
     Safely scale a tensor without increasing its ``.size()``.
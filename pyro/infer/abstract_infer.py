@@ -141,6 +141,16 @@ class TracePosterior(object):
         """
         raise NotImplementedError("inference algorithm must implement _traces")
 
+    def get_traces(self, *args, **kwargs):
+        """
+        Runs the inference algorithm and collects its traces, e.g. to draw
+        posterior predictive samples with :class:`~pyro.infer.predictive.Predictive`.
+
+        :returns: a list of ``(trace, log_weight)`` pairs
+        :rtype: list
+        """
+        return list(poutine.block(self._traces)(*args, **kwargs))
+
     def __call__(self, *args, **kwargs):
         traces, logits = [], []
         for tr, logit in poutine.block(self._traces)(*args, **kwargs):
@@ -0,0 +1,220 @@
+from __future__ import absolute_import, division, print_function
+
+import numbers
+from collections import OrderedDict, defaultdict
+
+from pyro.distributions.util import broadcast_shape, scale_tensor, sum_terms
+
+
+def _numel(shape):
+    numel = 1
+    for size in shape:
+        numel *= size
+    return numel
+
+
+def tensor_dims(value, dims):
+    """
+    :param value: a number or a tensor
+    :param dims: candidate dimensions, as negative indices
+    :returns: the dimensions among ``dims`` that the value varies along, i.e.
+        along which its size is not one
+    :rtype: set
+    """
+    if isinstance(value, numbers.Number):
+        return set()
+    return set(dim for dim in dims if value.dim() >= -dim and value.size(dim) > 1)
+
+
+def logsumexp(value, dim):
+    """
+    Numerically stable ``log(exp(value).sum(dim, keepdim=True))``, that is
+    ``-inf`` where all the summed values are ``-inf``.
+
+    :param value: a tensor
+    :param int dim: the dimension to sum along
+    """
+    max_value = value.max(dim, keepdim=True)[0].detach()
+    max_value[max_value == -float('inf')] = 0
+    return max_value + (value - max_value).exp().sum(dim, keepdim=True).log()
+
+
+def contract(factors, sum_dims, log=True):
+    """
+    Sums out dimensions of the product of a list of broadcastable factors by
+    variable elimination, without materializing the full product.
+
+    The dimensions are eliminated one at a time, in a greedy order: at each
+    step, the dimension whose elimination costs the least, i.e. for which the
+    product of the factors that vary along it is the smallest, is summed out
+    of that product, which replaces these factors. The cost thus grows with
+    the size of the largest intermediate product rather than with the product
+    of the sizes of all the dimensions.
+
+    :param list factors: tensors that broadcast against each other
+    :param sum_dims: the dimensions to sum out, as negative indices
+    :param bool log: whether the factors are in log space, in which case
+        products are sums and sums are ``logsumexp``
+    :returns: a list of factors whose product is the result; the summed out
+        dimensions are kept with size one
+    :rtype: list
+    """
+    factors = list(factors)
+    sum_dims = set(sum_dims)
+    while sum_dims:
+        costs = {}
+        for dim in sum_dims:
+            shapes = [f.size() for f in factors if tensor_dims(f, [dim])]
+            costs[dim] = _numel(broadcast_shape(*shapes)) if shapes else 0
+        dim = min(sum_dims, key=lambda d: (costs[d], -d))
+        sum_dims.remove(dim)
+        involved = [f for f in factors if tensor_dims(f, [dim])]
+        if not involved:
+            continue
+        factors = [f for f in factors if not tensor_dims(f, [dim])]
+        if log:
+            factors.append(logsumexp(sum_terms(involved), dim))
+        else:
+            product = involved[0]
+            for f in involved[1:]:
+                product = product * f
+            factors.append(product.sum(dim, keepdim=True))
+    return factors
+
+
+def einsum(equation, *operands, **kwargs):
+    """
+    Evaluates an ``einsum`` equation, e.g. ``"ab,bc->ac"``, by
+    :func:`contract`, i.e. summing out the dimensions in a greedy order.
+    Every letter must have the same size in all the operands it appears in,
+    and repeated letters within an operand are not supported.
+
+    :param str equation: the input letters of each operand, separated by
+        commas, then ``->`` and the output letters
+    :param operands: one tensor per input of the equation
+    :param bool log: whether the operands are in log space, in which case the
+        result is ``log(einsum(equation, *[exp(x) for x in operands]))``
+    :returns: the result, with its dimensions in the order of the output
+    """
+    log = kwargs.pop("log", False)
+    if kwargs:
+        raise TypeError("unexpected keyword arguments: {}".format(", ".join(sorted(kwargs))))
+    inputs, output = equation.replace(" ", "").split("->")
+    inputs = inputs.split(",")
+    if len(inputs) != len(operands):
+        raise ValueError("expected {} operands, got {}".format(len(inputs), len(operands)))
+    # every letter gets a dimension of a shared layout, in which the operands broadcast
+    letters = OrderedDict()
+    for letter in "".join(inputs) + output:
+        letters.setdefault(letter, -1 - len(letters))
+    sizes = {}
+    factors = []
+    for letters_in, operand in zip(inputs, operands):
+        if len(set(letters_in)) != len(letters_in) or len(letters_in) != operand.dim():
+            raise ValueError("invalid operand of shape {} for {}".format(tuple(operand.size()), letters_in))
+        for letter, size in zip(letters_in, operand.size()):
+            if sizes.setdefault(letter, size) != size:
+                raise ValueError("letter {} has sizes {} and {}".format(letter, sizes[letter], size))
+        # order the dimensions as in the shared layout, i.e. the first letter rightmost
+        order = sorted(letters_in, key=lambda letter: letters[letter])
+        operand = operand.permute(*[letters_in.index(letter) for letter in order])
+        shape = [1] * len(letters)
+        for letter in order:
+            shape[len(letters) + letters[letter]] = sizes[letter]
+        factors.append(operand.contiguous().view(*shape))
+    sum_dims = [letters[letter] for letter in letters if letter not in output]
+    factors = contract(factors, sum_dims, log=log)
+    if log:
+        result = sum_terms(factors)
+    else:
+        result = factors[0]
+        for f in factors[1:]:
+            result = result * f
+    result = result.expand(*[sizes[letter] if letter in output else 1 for letter in reversed(letters)])
+    # drop the summed out dimensions, then order the output letters
+    remaining = [letter for letter in reversed(letters) if letter in output]
+    if not remaining:
+        return result.sum()
+    result = result.contiguous().view(*[sizes[letter] for letter in remaining])
+    return result.permute(*[remaining.index(letter) for letter in output])
+
+
+def _parent_ordinal(ordinal, ordinals):
+    candidates = [other for other in ordinals if other < ordinal]
+    if not candidates:
+        return frozenset()
+    parent = max(candidates, key=len)
+    if any(len(other) == len(parent) and other != parent for other in candidates):
+        raise NotImplementedError("the iaranges {} do not nest in a tree".format(sorted(ordinal)))
+    return parent
+
+
+def contract_plates(log_factors, ordinals, sum_dims, dim_ordinals, scales=None):
+    """
+    Sums out enumerated dimensions of the product of log-space factors that
+    live in nested ``iarange`` contexts, by variable elimination.
+
+    The ordinal of a factor is the frozenset of the names of the vectorized
+    ``iarange`` contexts it is in, as recorded in the ``cond_indep_stack`` of
+    its site. The ordinals are processed from the innermost out. In each
+    ordinal, the dimensions of the variables of this ordinal are summed out
+    by :func:`contract`. The resulting factors that do not depend on
+    dimensions that remain to be summed out are final terms. The others are
+    combined into a message for the parent ordinal, which is multiplied
+    across the elements of the ``iarange``, i.e. summed in log space along
+    the batch dimensions that the factors of the parent do not vary along.
+
+    The final terms are not reduced across the elements of their ``iarange``,
+    so that they can be weighted per element, e.g. by the probabilities of
+    values enumerated in a guide.
+
+    :param list log_factors: log-space tensors that broadcast against each
+        other
+    :param list ordinals: the ordinal of each factor
+    :param sum_dims: the enumerated dimensions to sum out
+    :param dict dim_ordinals: the ordinal of the variable of each enumerated
+        dimension, including the dimensions that are not summed out
+    :param dict scales: the scale of the factors of each ordinal, e.g. from
+        subsampling, by which messages and final terms are multiplied
+    :returns: a list of ``(ordinal, log_factor)`` terms, the sum of all of
+        whose elements is the log of the sum of the product of the factors
+    :rtype: list
+    """
+    scales = {} if scales is None else scales
+    remaining_dims = set(sum_dims)
+    by_ordinal = defaultdict(list)
+    by_ordinal[frozenset()] = []
+    for ordinal, factor in zip(ordinals, log_factors):
+        by_ordinal[ordinal].append(factor)
+    for dim in remaining_dims:
+        by_ordinal[dim_ordinals[dim]]
+    all_ordinals = set(by_ordinal)
+    enum_dims = set(dim_ordinals)
+
+    terms = []
+    for ordinal in sorted(all_ordinals, key=lambda o: (-len(o), sorted(o))):
+        local_dims = set(dim for dim in remaining_dims if dim_ordinals[dim] == ordinal)
+        remaining_dims -= local_dims
+        factors = contract(by_ordinal.pop(ordinal), local_dims)
+        scale = scales.get(ordinal, 1.0)
+        messages = []
+        for factor in factors:
+            if tensor_dims(factor, remaining_dims):
+                messages.append(factor)
+            else:
+                terms.append((ordinal, scale_tensor(factor, scale)))
+        if not messages:
+            continue
+        parent = _parent_ordinal(ordinal, all_ordinals)
+        message = sum_terms(messages)
+        for dim in tensor_dims(message, enum_dims - set(sum_dims)):
+            if not dim_ordinals[dim] <= parent:
+                raise NotImplementedError("cannot sum out the enumerated values that depend on the enumerated "
+                                          "values of dimension {} across the elements of an iarange".format(dim))
+        parent_factors = by_ordinal[parent]
+        for dim in range(-message.dim(), 0):
+            if dim not in enum_dims and message.size(dim) > 1 and \
+                    not any(tensor_dims(f, [dim]) for f in parent_factors):
+                message = message.sum(dim, keepdim=True)
+        parent_factors.append(scale_tensor(message, scale / scales.get(parent, 1.0)))
+    return terms
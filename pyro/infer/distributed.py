@@ -0,0 +1,368 @@
+from __future__ import absolute_import, division, print_function
+
+import socket
+import traceback
+
+import cloudpickle
+import torch
+import torch.distributed as dist
+from torch.autograd import Variable
+
+import pyro
+from pyro import _EpochPermutation, _shard_bounds
+from pyro.infer.parallel import _get_context, _put, _receive, _stop
+from pyro.infer.svi import SVI
+from pyro.poutine.poutine import Messenger
+from pyro.poutine.util import site_is_subsample
+from pyro.util import set_rng_seed
+
+_SUM = dist.ReduceOp.SUM if hasattr(dist, "ReduceOp") else dist.reduce_op.SUM
+
+
+class ShardMessenger(Messenger):
+    """
+    Restricts the subsample of an ``iarange`` to the shard of one of several
+    workers, for data-parallel inference.
+
+    Every worker draws the subsample of the ``iarange`` from a random number
+    generator that is shared by the workers, i.e. seeded identically on each
+    of them, so that all the workers draw the same subsample. The subsample is
+    then split into contiguous shards, one per worker. The ``iarange`` scales
+    the log likelihood terms of its sites by the size of the range over the
+    size of the shard, so that the loss of each worker is an unbiased estimate
+    of the full loss, and the average of the losses of the workers is the
+    estimate of the whole subsample.
+
+    The random number generator of the worker is used for everything else, so
+    that the workers draw independent samples of the other sites.
+
+    :param str iarange_name: the name of the ``iarange`` to shard, which must
+        not be nested in another ``iarange`` or ``irange``
+    :param int rank: the index of the shard of this worker
+    :param int num_shards: the number of workers
+    :param torch.ByteTensor rng_state: the initial state of the shared random
+        number generator, see ``torch.get_rng_state()``
+    """
+    def __init__(self, iarange_name, rank, num_shards, rng_state):
+        super(ShardMessenger, self).__init__()
+        self.iarange_name = iarange_name
+        self.rank = rank
+        self.num_shards = num_shards
+        self.rng_state = rng_state
+        self._synced_samplers = []
+
+    def get_shard(self, iarange_name):
+        """
+        :param str iarange_name: the name of an ``iarange``
+        :returns: the ``(rank, num_shards)`` of the shard of the ``iarange``,
+            if this messenger shards it, else None
+        """
+        if iarange_name == self.iarange_name:
+            return self.rank, self.num_shards
+        return None
+
+    def _draw(self, fn):
+        local_state = torch.get_rng_state()
+        torch.set_rng_state(self.rng_state)
+        try:
+            sampler = fn.sampler
+            if isinstance(sampler, _EpochPermutation) and \
+                    not any(sampler is synced for synced in self._synced_samplers):
+                # the permutation of a new epoch sampler was drawn by the worker
+                if sampler.epoch == 0 and sampler._position == 0:
+                    sampler._permutation = torch.randperm(sampler.size)
+                self._synced_samplers.append(sampler)
+            value = fn.sample()
+            self.rng_state = torch.get_rng_state()
+        finally:
+            torch.set_rng_state(local_state)
+        return value
+
+    def _pyro_sample(self, msg):
+        """
+        :param msg: current message at a trace site
+
+        Replaces the subsample of the ``iarange`` by the shard of this worker,
+        unless it already has a value, e.g. replayed from a sharded guide.
+        """
+        if site_is_subsample(msg) and msg.name == self.iarange_name and msg.value is None:
+            fn = msg.fn
+            subsample_size = fn.size if fn.subsample_size is None else min(fn.subsample_size, fn.size)
+            start, stop = _shard_bounds(subsample_size, self.rank, self.num_shards)
+            if start == stop:
+                raise ValueError("the subsample of iarange '{}' has {} indices, which is fewer than the {} "
+                                 "workers".format(self.iarange_name, subsample_size, self.num_shards))
+            msg.value = self._draw(fn).narrow(0, start, stop - start)
+            msg.done = True
+        return None
+
+
+def _broadcast_bytes(payload, src):
+    length = torch.LongTensor([len(payload) if payload is not None else 0])
+    dist.broadcast(length, src)
+    if payload is not None:
+        data = torch.ByteTensor(list(bytearray(payload)))
+    else:
+        data = torch.ByteTensor(int(length[0])).zero_()
+    dist.broadcast(data, src)
+    return bytes(bytearray(data.tolist()))
+
+
+class DistributedSVI(SVI):
+    """
+    Data-parallel stochastic variational inference, to be run by each of the
+    processes of an initialized ``torch.distributed`` process group, e.g. with
+    the ``"gloo"`` backend. See :class:`DataParallelSVI` to launch the
+    processes on the local machine.
+
+    At each step, every worker computes the loss and gradients on its shard of
+    the subsample of ``iarange_name``, see :class:`ShardMessenger`. The
+    gradients of the params that are active on any worker are then averaged
+    across the workers with an allreduce, and each worker takes the same
+    optimizer step, so that the params stay identical on all the workers.
+
+    Params that are created lazily are registered on all the workers: if a
+    worker creates a param that the others do not have, they create it too,
+    and its value is broadcast from the worker of lowest rank that created it.
+    If this changes the value of a param on any worker, the step is computed
+    again with the synchronized values.
+
+    :param model: the model (callable containing Pyro primitives)
+    :param guide: the guide (callable containing Pyro primitives)
+    :param optim: a wrapper a for a PyTorch optimizer
+    :type optim: pyro.optim.PyroOptim
+    :param loss: the loss, as for :class:`~pyro.infer.svi.SVI`
+    :param str iarange_name: the name of the ``iarange`` whose subsample is
+        split between the workers, or None to not split any data, in which
+        case the workers average their estimates of the loss of the whole data
+    :param loss_and_grads: the loss and gradients, as for
+        :class:`~pyro.infer.svi.SVI`
+    """
+    def __init__(self, model, guide, optim, loss="ELBO", iarange_name=None, loss_and_grads=None, **kwargs):
+        super(DistributedSVI, self).__init__(model, guide, optim, loss, loss_and_grads, **kwargs)
+        self.rank = dist.get_rank()
+        self.num_workers = dist.get_world_size()
+        self.iarange_name = iarange_name
+        self._registered = set()  # names of the params that are registered on all the workers
+        # the seed of the shared random number generator of the subsamples
+        seed = torch.LongTensor(1).random_(0, 2 ** 31)
+        dist.broadcast(seed, 0)
+        local_state = torch.get_rng_state()
+        torch.manual_seed(int(seed[0]))
+        shared_state = torch.get_rng_state()
+        torch.set_rng_state(local_state)
+        self._shard = None
+        if iarange_name is not None:
+            self._shard = ShardMessenger(iarange_name, self.rank, self.num_workers, shared_state)
+
+    def _local(self, fn, *args, **kwargs):
+        if self._shard is None:
+            return fn(self.model, self.guide, *args, **kwargs)
+        with self._shard:
+            return fn(self.model, self.guide, *args, **kwargs)
+
+    def _mean(self, value):
+        value = torch.DoubleTensor([float(value)])
+        dist.all_reduce(value, op=_SUM)
+        return float(value[0]) / self.num_workers
+
+    def _register_params(self, param_store):
+        """
+        Registers the params that are not registered on all the workers yet.
+
+        :returns: whether the value of a param changed on any worker
+        """
+        new_names = [name for name in param_store.get_all_param_names() if name not in self._registered]
+        num_new = torch.LongTensor([len(new_names)])
+        dist.all_reduce(num_new, op=_SUM)
+        if int(num_new[0]) == 0:
+            return False
+        specs = [(name, param_store.get_param(name).data.type(), tuple(param_store.get_param(name).size()),
+                  sorted(param_store.get_param_tags(name)))
+                 for name in new_names]
+        owners = {}
+        for rank in range(self.num_workers):
+            payload = cloudpickle.dumps(specs) if rank == self.rank else None
+            for name, tensor_type, shape, tags in cloudpickle.loads(_broadcast_bytes(payload, rank)):
+                owners.setdefault(name, (rank, tensor_type, shape, tags))
+        changed = 0
+        for name in sorted(owners):
+            owner, tensor_type, shape, tags = owners[name]
+            if name in param_store.get_all_param_names():
+                param = param_store.get_param(name)
+            else:
+                init_tensor = Variable(torch.zeros(*shape).type(tensor_type), requires_grad=True)
+                param = param_store.get_param(name, init_tensor, tags=tags)
+            value = param.data.contiguous() if owner == self.rank else param.data.clone()
+            dist.broadcast(value, owner)
+            if owner != self.rank and not value.equal(param.data):
+                param.data.copy_(value)
+                changed = 1
+        self._registered.update(owners)
+        changed = torch.LongTensor([changed])
+        dist.all_reduce(changed, op=_SUM)
+        return int(changed[0]) > 0
+
+    def _active_names(self, param_store):
+        names = sorted(self._registered)
+        active_names = set(param_store.param_name(p) for p in param_store.get_active_params())
+        flags = torch.FloatTensor([1.0 if name in active_names else 0.0 for name in names])
+        if len(names):
+            dist.all_reduce(flags, op=_SUM)
+        return [name for name, flag in zip(names, flags.tolist()) if flag > 0]
+
+    def _average_grads(self, params):
+        # one allreduce per tensor type
+        by_type = {}
+        for param in params:
+            by_type.setdefault(param.data.type(), []).append(param)
+        for tensor_type in sorted(by_type):
+            group = by_type[tensor_type]
+            flat = torch.cat([param.grad.data.contiguous().view(-1) if param.grad is not None
+                              else param.data.new(param.data.numel()).zero_()
+                              for param in group])
+            dist.all_reduce(flat, op=_SUM)
+            flat /= self.num_workers
+            offset = 0
+            for param in group:
+                grad = flat[offset:offset + param.data.numel()].view_as(param.data)
+                offset += param.data.numel()
+                if param.grad is None:
+                    param.grad = Variable(grad.clone())
+                else:
+                    param.grad.data.copy_(grad)
+
+    def evaluate_loss(self, *args, **kwargs):
+        """
+        :returns: estimate of the loss, averaged across the workers
+        :rtype: float
+
+        Evaluate the loss function on the shard of this worker. Any args or kwargs are passed to the
+        model and guide.
+        """
+        return self._mean(self._local(self.loss, *args, **kwargs))
+
+    def step(self, *args, **kwargs):
+        """
+        :returns: estimate of the loss, averaged across the workers
+        :rtype: float
+
+        Take a gradient step on the loss function, with the gradients averaged across the workers.
+        Any args or kwargs are passed to the model and guide.
+        """
+        param_store = pyro.get_param_store()
+        while True:
+            loss = self._local(self.loss_and_grads, *args, **kwargs)
+            if not self._register_params(param_store):
+                break
+            # recompute the step with the synchronized values of the new params
+            active = list(param_store.get_active_params())
+            param_store.zero_grads(active)
+            param_store.mark_params_inactive(active)
+
+        names = self._active_names(param_store)
+        params = [param_store.get_param(name) for name in names]
+        self._average_grads(params)
+        loss = self._mean(loss)
+
+        self.optim(params)
+        param_store.zero_grads(params)
+        param_store.mark_params_inactive(list(param_store.get_active_params()))
+        return loss
+
+
+def _free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def _svi_worker(rank, launcher, seed, init_method, num_steps, result_queue, args, kwargs):
+    try:
+        torch.set_num_threads(1)
+        set_rng_seed(seed + rank)
+        dist.init_process_group("gloo", init_method=init_method, world_size=launcher.num_workers, rank=rank)
+        svi = DistributedSVI(launcher.model, launcher.guide, launcher.optim, launcher.loss,
+                             iarange_name=launcher.iarange_name, **launcher.kwargs)
+        losses = [svi.step(*args, **kwargs) for _ in range(num_steps)]
+        if rank == 0:
+            _put(result_queue, ("done", losses, pyro.get_param_store().get_state(), launcher.optim.get_state()))
+        else:
+            _put(result_queue, ("done", None, None, None))
+        if hasattr(dist, "destroy_process_group"):
+            dist.destroy_process_group()
+    except Exception:
+        _put(result_queue, ("error", traceback.format_exc(), None, None))
+
+
+class DataParallelSVI(object):
+    """
+    Runs :class:`DistributedSVI` on worker processes forked from this one,
+    which communicate with the ``"gloo"`` backend of ``torch.distributed``.
+    The workers start from the params of the param store of this process, and
+    when they are done, the param store and the optimizer state are updated
+    with those of the workers. Each worker has its own random number
+    generator, seeded from the random number generator of this process.
+
+    Example::
+
+        svi = DataParallelSVI(model, guide, Adam({"lr": 0.01}), "ELBO", iarange_name="data", num_workers=4)
+        losses = svi.run(1000, data)
+
+    :param model: the model (callable containing Pyro primitives)
+    :param guide: the guide (callable containing Pyro primitives)
+    :param optim: a wrapper a for a PyTorch optimizer
+    :type optim: pyro.optim.PyroOptim
+    :param loss: the loss, as for :class:`~pyro.infer.svi.SVI`
+    :param str iarange_name: the name of the ``iarange`` whose subsample is
+        split between the workers, see :class:`DistributedSVI`
+    :param int num_workers: the number of worker processes
+    :param str init_method: the URL used to initialize the process group;
+        defaults to a free TCP port on localhost
+    """
+    def __init__(self, model, guide, optim, loss="ELBO", iarange_name=None, num_workers=2, init_method=None,
+                 **kwargs):
+        self.model = model
+        self.guide = guide
+        self.optim = optim
+        self.loss = loss
+        self.iarange_name = iarange_name
+        self.num_workers = num_workers
+        self.init_method = init_method
+        self.kwargs = kwargs
+
+    def run(self, num_steps, *args, **kwargs):
+        """
+        Takes gradient steps on the worker processes. Any args or kwargs are passed to the model and guide.
+
+        :param int num_steps: the number of steps
+        :returns: the estimates of the loss at each step, averaged across the workers
+        :rtype: list
+        """
+        init_method = self.init_method
+        if init_method is None:
+            init_method = "tcp://127.0.0.1:{}".format(_free_port())
+        seed = int(torch.LongTensor(1).random_(0, 2 ** 30)[0])
+        context = _get_context()
+        result_queue = context.Queue()
+        workers = [context.Process(target=_svi_worker,
+                                   args=(rank, self, seed, init_method, num_steps, result_queue, args, kwargs))
+                   for rank in range(self.num_workers)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        joined = False
+        try:
+            for _ in workers:
+                _, losses, param_state, optim_state = _receive(result_queue, workers)
+                if param_state is not None:
+                    result = losses, param_state, optim_state
+            joined = True
+        finally:
+            _stop(workers, joined)
+        losses, param_state, optim_state = result
+        pyro.get_param_store().set_state(param_state)
+        self.optim.set_state(optim_state)
+        return losses
@@ -11,8 +11,10 @@ class ELBO(object):
 
     :param num_particles: The number of particles/samples used to form the ELBO
         (gradient) estimators.
-    :param bool enum_discrete: Whether to sum over discrete latent variables,
-        rather than sample them.
+    :param enum_discrete: Whether to sum over discrete latent variables,
+        rather than sample them: ``True`` to enumerate them sequentially, or
+        ``"parallel"`` to enumerate them in parallel along extra tensor
+        dimensions, which is only supported by `Trace_ELBO`.
 
     References
 
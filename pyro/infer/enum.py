@@ -1,12 +1,16 @@
 from __future__ import absolute_import, division, print_function
 
 import math
+import numbers
 
 import torch
 from torch.autograd import Variable
 
 from pyro import poutine
-from pyro.poutine.trace import Trace
+from pyro.distributions.util import sum_terms
+from pyro.infer.contract import contract_plates
+from pyro.poutine.trace_prefix import TracePrefix
+from pyro.poutine.util import prune_subsample_sites
 from six.moves.queue import LifoQueue
 
 
@@ -29,7 +33,7 @@ def iter_discrete_traces(graph_type, fn, *args, **kwargs):
     :returns: An iterator over (scale, trace) pairs.
     """
     queue = LifoQueue()
-    queue.put(Trace())
+    queue.put(TracePrefix())
     q_fn = poutine.queue(fn, queue=queue)
     while not queue.empty():
         q_fn = poutine.queue(fn, queue=queue)
@@ -43,3 +47,87 @@ def iter_discrete_traces(graph_type, fn, *args, **kwargs):
         else:
             scale = math.exp(log_pdf)
         yield scale, full_trace
+
+
+def site_ordinal(site):
+    """
+    :returns: the frozenset of the names of the vectorized ``iarange``
+        contexts a site is in
+    :rtype: frozenset
+    """
+    return frozenset(frame.name for frame in site["cond_indep_stack"] if frame.vectorized)
+
+
+def enumerated_dim_ordinals(trace):
+    """
+    :param Trace trace: a trace of a function enumerated by :func:`~pyro.poutine.enum`
+    :returns: the ordinal of each of the sites enumerated in the trace, by
+        enumeration dimension
+    :rtype: dict
+    """
+    return {site["infer"]["_enum_dim"]: site_ordinal(site)
+            for site in trace.nodes.values()
+            if site["type"] == "sample" and "_enum_dim" in site["infer"]}
+
+
+def contract_trace(trace, sum_dims, dim_ordinals):
+    """
+    Sums out enumerated dimensions of the joint probability of the sample
+    sites of a trace by variable elimination, see
+    :func:`~pyro.infer.contract.contract_plates`. The ``iarange`` structure
+    of the sites is read from their ``cond_indep_stack``.
+
+    :param Trace trace: a trace of a function enumerated by
+        :func:`~pyro.poutine.enum`, without subsample sites
+    :param sum_dims: the enumeration dimensions to sum out
+    :param dict dim_ordinals: the ordinal of each enumeration dimension that
+        the sites may depend on, see :func:`enumerated_dim_ordinals`
+    :returns: a list of ``(ordinal, log_factor)`` terms, the sum of all of
+        whose elements is the log of the sum of the joint probability
+    :rtype: list
+    """
+    log_factors, ordinals, scales = [], [], {}
+    for name, site in trace.nodes.items():
+        if site["type"] != "sample":
+            continue
+        ordinal = site_ordinal(site)
+        log_factors.append(site["fn"].log_prob(site["value"], *site["args"], **site["kwargs"]))
+        ordinals.append(ordinal)
+        scale = scales.setdefault(ordinal, site["scale"])
+        if isinstance(scale, numbers.Number) and isinstance(site["scale"], numbers.Number) and \
+                scale != site["scale"]:
+            raise NotImplementedError("the sites of iaranges {} have different scales".format(sorted(ordinal)))
+    return contract_plates(log_factors, ordinals, sum_dims, dim_ordinals, scales)
+
+
+def log_marginal_likelihood(model, *args, **kwargs):
+    """
+    Computes the exact log marginal likelihood of the observations of a model
+    whose latent sample sites are all discrete, e.g. a mixture model with
+    parameters ``pyro.param``.
+
+    The model is run once with its discrete sites enumerated in parallel by
+    :func:`~pyro.poutine.enum`, so it must broadcast against the enumerated
+    values, and the enumerated values are summed out by variable elimination,
+    whose cost grows with the size of the largest factor created rather than
+    with the size of the joint enumeration. The number of batch dimensions is
+    recorded from an ordinary run of the model.
+
+    :param callable model: a model whose latent sample sites are enumerable
+    :returns: the log marginal likelihood, which is differentiable with
+        respect to the parameters of the model
+    :rtype: torch.autograd.Variable
+    :raises: ValueError if a latent sample site is not enumerable
+    """
+    trace = prune_subsample_sites(poutine.trace(model).get_trace(*args, **kwargs))
+    trace.compute_batch_log_pdf()
+    first_available_dim = -1 - max([0] + [site["batch_log_pdf"].dim() for site in trace.nodes.values()
+                                          if site["type"] == "sample"])
+    trace = poutine.trace(poutine.enum(model, first_available_dim)).get_trace(*args, **kwargs)
+    trace = prune_subsample_sites(trace)
+    for name, site in trace.nodes.items():
+        if site["type"] == "sample" and not site["is_observed"] and "_enum_dim" not in site["infer"]:
+            raise ValueError("the latent site {} is not enumerable".format(name))
+    dim_ordinals = enumerated_dim_ordinals(trace)
+    terms = contract_trace(trace, dim_ordinals, dim_ordinals)
+    return sum_terms([log_factor.sum() for _, log_factor in terms])
@@ -0,0 +1,193 @@
+from __future__ import absolute_import, division, print_function
+
+import importlib
+from collections import OrderedDict
+
+from torch.autograd import Variable
+
+import pyro
+import pyro.poutine as poutine
+from pyro.params.checkpoint import Checkpoint, write_checkpoint
+from pyro.poutine.util import site_is_subsample
+from pyro.shim import torch_no_grad
+from pyro.util import am_i_wrapped
+
+
+class _FrozenFrame(object):
+    """
+    Handles the pyro primitives of a frozen predictor: params are looked up in
+    a dict and the values of sample sites are recorded in another, or replayed
+    from the guide.
+    """
+    __slots__ = ("params", "replay", "values")
+
+    def __init__(self, params):
+        self.params = params
+        self.replay = {}
+        self.values = {}
+
+    def sample(self, name, fn, obs, args, kwargs):
+        if obs is not None:
+            value = obs
+        elif name in self.replay:
+            value = self.replay[name]
+        else:
+            value = fn(*args, **kwargs)
+        self.values[name] = value
+        return value
+
+    def param(self, name):
+        try:
+            return self.params[name]
+        except KeyError:
+            raise ValueError("param {} was not used when the predictor was frozen".format(name))
+
+
+def _import_path(fn):
+    module = getattr(fn, "__module__", None)
+    name = getattr(fn, "__qualname__", getattr(fn, "__name__", None))
+    if module is None or name is None or "<" in name:
+        return None
+    return "{}:{}".format(module, name)
+
+
+def _resolve(path, what):
+    if path is None:
+        raise ValueError("the {} of the frozen predictor cannot be imported, so it must be given".format(what))
+    module_name, name = path.split(":")
+    obj = importlib.import_module(module_name)
+    for attr in name.split("."):
+        obj = getattr(obj, attr)
+    return obj
+
+
+class FrozenPredictor(object):
+    """
+    A trained guide, and optionally a model, frozen by :func:`freeze` into a
+    callable that draws from the guide and evaluates sites of the model
+    replayed against the guide, without poutines: it runs the guide and model
+    functions with the pyro primitives short-circuited, so that params are
+    direct references to tensors rather than param store lookups, and the
+    values of sample sites are recorded in a dict rather than in a trace.
+
+    The computation, and thus the consumption of random numbers, is that of
+    :func:`~pyro.poutine.trace` and :func:`~pyro.poutine.replay`, so that the
+    outputs are bit-identical to theirs for a given state of the random
+    number generator. A frozen predictor must not run inside a poutine, and
+    does not record gradients.
+
+    :param callable guide: the guide
+    :param OrderedDict params: the params of the guide and model, by name
+    :param callable model: the model, or None
+    :param list return_sites: the names of the sites to return
+    """
+    def __init__(self, guide, params, model=None, return_sites=()):
+        self.guide = guide
+        self.params = params
+        self.model = model
+        self.return_sites = list(return_sites)
+
+    def __call__(self, *args, **kwargs):
+        """
+        Draws from the guide, then runs the model replayed against it. Any args
+        or kwargs are passed to the guide and model.
+
+        :returns: the values of the returned sites, by name
+        :rtype: dict
+        """
+        if am_i_wrapped():
+            raise RuntimeError("a frozen predictor cannot run inside a poutine")
+        frame = _FrozenFrame(self.params)
+        previous = pyro._FROZEN_FRAME.get()
+        pyro._FROZEN_FRAME.set(frame)
+        try:
+            with torch_no_grad():
+                self.guide(*args, **kwargs)
+                if self.model is not None:
+                    frame.replay, frame.values = frame.values, {}
+                    self.model(*args, **kwargs)
+        finally:
+            pyro._FROZEN_FRAME.set(previous)
+        values = frame.replay
+        values.update(frame.values)
+        return {name: values[name] for name in self.return_sites}
+
+    def save(self, filename):
+        """
+        Saves the params to a binary checkpoint, see
+        :func:`~pyro.params.checkpoint.write_checkpoint`. The guide and model
+        are stored by import path, if they are module level functions or
+        classes, so that :meth:`load` can import them.
+
+        :param str filename: file name to save to
+        """
+        extra = {"frozen_predictor": {"guide": _import_path(self.guide),
+                                      "model": None if self.model is None else _import_path(self.model),
+                                      "has_model": self.model is not None,
+                                      "return_sites": self.return_sites}}
+        write_checkpoint(filename, [(name, param, ()) for name, param in self.params.items()], extra=extra)
+
+    @classmethod
+    def load(cls, filename, guide=None, model=None, mmap=True):
+        """
+        Loads a frozen predictor saved with :meth:`save`.
+
+        :param str filename: file name to load from
+        :param callable guide: the guide; defaults to the guide imported by its
+            saved import path
+        :param callable model: the model; defaults to the model imported by its
+            saved import path, if the predictor has a model
+        :param bool mmap: whether to memory map the file rather than read the
+            params into memory
+        :returns: the frozen predictor
+        :rtype: FrozenPredictor
+        """
+        checkpoint = Checkpoint(filename, mmap=mmap)
+        info = checkpoint.extra.get("frozen_predictor")
+        if info is None:
+            raise ValueError("{} is not a frozen predictor".format(filename))
+        if guide is None:
+            guide = _resolve(info["guide"], "guide")
+        if model is None and info["has_model"]:
+            model = _resolve(info["model"], "model")
+        params = OrderedDict((str(name), Variable(checkpoint.tensor(name))) for name in checkpoint.param_names())
+        return cls(guide, params, model, [str(name) for name in info["return_sites"]])
+
+
+def freeze(guide, model=None, args=(), kwargs=None, return_sites=None):
+    """
+    Freezes a trained guide, and optionally a model, into a
+    :class:`FrozenPredictor`. The guide, and the model replayed against it,
+    are traced once on example inputs against the current param store, to
+    find the params they use, to which the predictor then holds direct
+    references.
+
+    Example::
+
+        predict = freeze(guide, model, args=(x,), return_sites=["y"])
+        y = predict(x)["y"]
+        predict.save("predictor.ckpt")
+
+    :param callable guide: the guide
+    :param callable model: the model, or None
+    :param tuple args: example args of the guide and model
+    :param dict kwargs: example kwargs of the guide and model
+    :param list return_sites: the names of the sites to return; defaults to
+        the sample sites of the model that are not observed, or the sample
+        sites of the guide if there is no model
+    :returns: the frozen predictor
+    :rtype: FrozenPredictor
+    """
+    kwargs = {} if kwargs is None else kwargs
+    traces = [poutine.trace(guide).get_trace(*args, **kwargs)]
+    if model is not None:
+        traces.append(poutine.trace(poutine.replay(model, traces[0])).get_trace(*args, **kwargs))
+    params = OrderedDict()
+    for trace in traces:
+        for name, site in trace.nodes.items():
+            if site["type"] == "param":
+                params[name] = site["value"]
+    if return_sites is None:
+        return_sites = [name for name, site in traces[-1].nodes.items()
+                        if site["type"] == "sample" and not site["is_observed"] and not site_is_subsample(site)]
+    return FrozenPredictor(guide, params, model, return_sites)
@@ -0,0 +1,145 @@
+from __future__ import absolute_import, division, print_function
+
+import time
+import traceback
+from collections import Counter
+
+import torch
+
+import pyro
+from pyro.infer.parallel import _get_context, _put, _receive, _stop
+from pyro.infer.svi import SVI
+from pyro.util import set_rng_seed
+
+_WAIT_SECONDS = 1e-4
+
+
+def _hogwild_worker(rank, launcher, seed, num_steps, version, clocks, result_queue, args, kwargs):
+    try:
+        torch.set_num_threads(1)
+        set_rng_seed(seed + rank)
+        param_store = pyro.get_param_store()
+        names = set(param_store.get_all_param_names())
+        svi = SVI(launcher.model, launcher.guide, launcher.optim, launcher.loss, **launcher.kwargs)
+        records = []
+        for step in range(num_steps):
+            if launcher.max_staleness is not None:
+                # wait for the slowest worker to be at most max_staleness steps behind
+                while min(clocks[:]) < step - launcher.max_staleness:
+                    time.sleep(_WAIT_SECONDS)
+            start = version.value
+            loss = svi.step(*args, **kwargs)
+            with version.get_lock():
+                version.value += 1
+                end = version.value
+            clocks[rank] = step + 1
+            # the number of updates of other workers applied while this one was computed
+            records.append((end, float(loss), end - 1 - start))
+            if len(names) != len(param_store.get_all_param_names()):
+                new_names = sorted(set(param_store.get_all_param_names()) - names)
+                raise RuntimeError("params {} were created by a worker, so they are not shared; "
+                                   "create them before calling run()".format(new_names))
+    except Exception:
+        clocks[rank] = num_steps  # do not hold back the other workers
+        _put(result_queue, ("error", traceback.format_exc(), None, None))
+        return
+    _put(result_queue, ("done", records, None, None))
+
+
+class HogwildSVI(object):
+    """
+    Asynchronous stochastic variational inference, in the style of Hogwild!:
+    several worker processes run :meth:`SVI.step <pyro.infer.svi.SVI.step>`
+    independently and update the params of a param store in shared memory in
+    place, without locks. This suits models whose steps only update a small
+    part of the params, e.g. the rows of local params of the data points of a
+    subsample, so that concurrent updates rarely overlap.
+
+    Before the workers are forked, the loss is evaluated once to create the
+    params, and the param store is moved to shared memory, see
+    :meth:`~pyro.params.param_store.ParamStoreDict.share_memory`. Params that a
+    worker creates later would not be shared, and are an error. Each worker
+    has its own optimizer state and its own random number generator, seeded
+    from the random number generator of this process.
+
+    The staleness of an update is the number of updates of other workers that
+    were applied between the start of its step and its own update. It is
+    recorded in :attr:`staleness`, a histogram from staleness to number of
+    updates. With ``max_staleness``, the staleness is bounded in the manner of
+    stale synchronous parallel: a worker does not start a step while it is
+    more than ``max_staleness`` steps ahead of the slowest worker, so that the
+    staleness is at most ``(2 * max_staleness + 1) * (num_workers - 1)``.
+
+    Example::
+
+        svi = HogwildSVI(model, guide, Adam({"lr": 0.01}), "ELBO", num_workers=4, max_staleness=8)
+        losses = svi.run(1000, data)
+
+    :param model: the model (callable containing Pyro primitives)
+    :param guide: the guide (callable containing Pyro primitives)
+    :param optim: a wrapper a for a PyTorch optimizer
+    :type optim: pyro.optim.PyroOptim
+    :param loss: the loss, as for :class:`~pyro.infer.svi.SVI`
+    :param int num_workers: the number of worker processes
+    :param int max_staleness: how many steps a worker may be ahead of the
+        slowest worker, or None for no bound
+    """
+    def __init__(self, model, guide, optim, loss="ELBO", num_workers=2, max_staleness=None, **kwargs):
+        self.model = model
+        self.guide = guide
+        self.optim = optim
+        self.loss = loss
+        self.num_workers = num_workers
+        self.max_staleness = max_staleness
+        self.kwargs = kwargs
+        self.staleness = Counter()
+
+    def mean_staleness(self):
+        """
+        :returns: the mean staleness of the updates so far
+        :rtype: float
+        """
+        num_updates = sum(self.staleness.values())
+        return sum(s * n for s, n in self.staleness.items()) / num_updates if num_updates else 0.0
+
+    def max_observed_staleness(self):
+        """
+        :returns: the largest staleness of the updates so far
+        :rtype: int
+        """
+        return max(self.staleness) if self.staleness else 0
+
+    def run(self, num_steps, *args, **kwargs):
+        """
+        Takes ``num_steps`` steps on each worker process. Any args or kwargs are passed to the model
+        and guide.
+
+        :param int num_steps: the number of steps of each worker
+        :returns: the estimates of the loss of all the steps, in the order of their updates
+        :rtype: list
+        """
+        param_store = pyro.get_param_store()
+        SVI(self.model, self.guide, self.optim, self.loss, **self.kwargs).evaluate_loss(*args, **kwargs)
+        param_store.share_memory()
+        seed = int(torch.LongTensor(1).random_(0, 2 ** 30)[0])
+        context = _get_context()
+        version = context.Value("l", 0)
+        clocks = context.Array("l", self.num_workers, lock=False)
+        result_queue = context.Queue()
+        workers = [context.Process(target=_hogwild_worker,
+                                   args=(rank, self, seed, num_steps, version, clocks, result_queue, args, kwargs))
+                   for rank in range(self.num_workers)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        records = []
+        joined = False
+        try:
+            for _ in workers:
+                records.extend(_receive(result_queue, workers)[1])
+            joined = True
+        finally:
+            _stop(workers, joined)
+        records.sort()
+        self.staleness.update(staleness for _, _, staleness in records)
+        return [loss for _, loss, _ in records]
@@ -5,6 +5,7 @@ import logging
 import pyro.poutine as poutine
 
 from .abstract_infer import TracePosterior
+from .parallel import importance_traces
 
 logger = logging.getLogger(__name__)
 
@@ -14,12 +15,15 @@ class Importance(TracePosterior):
     :param model: probabilistic model defined as a function
     :param guide: guide used for sampling defined as a function
     :param num_samples: number of samples to draw from the guide (default 10)
+    :param num_workers: number of worker processes drawing the samples, see
+        :func:`~pyro.infer.parallel.importance_traces` (by default, samples
+        are drawn in this process)
 
     This method performs posterior inference by importance sampling
     using the guide as the proposal distribution.
     If no guide is provided, it defaults to proposing from the model's prior.
     """
-    def __init__(self, model, guide=None, num_samples=None):
+    def __init__(self, model, guide=None, num_samples=None, num_workers=None):
         """
         Constructor. default to num_samples = 10, guide = model
         """
@@ -33,11 +37,17 @@ class Importance(TracePosterior):
         self.num_samples = num_samples
         self.model = model
         self.guide = guide
+        self.num_workers = num_workers
 
     def _traces(self, *args, **kwargs):
         """
         Generator of weighted samples from the proposal distribution.
         """
+        if self.num_workers is not None:
+            for model_trace, log_weight in importance_traces(self.model, self.guide, self.num_samples,
+                                                             self.num_workers, *args, **kwargs):
+                yield (model_trace, log_weight)
+            return
         for i in range(self.num_samples):
             guide_trace = poutine.trace(self.guide).get_trace(*args, **kwargs)
             model_trace = poutine.trace(
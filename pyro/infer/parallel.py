@@ -0,0 +1,204 @@
+from __future__ import absolute_import, division, print_function
+
+import multiprocessing
+import traceback
+
+import cloudpickle
+import torch
+from six.moves import queue
+
+import pyro.poutine as poutine
+from pyro.poutine.prefix_poutine import PrefixPoutine
+from pyro.poutine.util import NonlocalExit, discrete_escape, enum_extend
+from pyro.shim import torch_no_grad
+from pyro.util import set_rng_seed
+
+_POLL_SECONDS = 1.0
+
+
+def _put(queue, item):
+    # tensors are sent by value, since a worker may exit before they are received
+    queue.put(cloudpickle.dumps(item))
+
+
+def _get(queue, timeout=None):
+    return cloudpickle.loads(queue.get(timeout=timeout))
+
+
+def _get_context():
+    # workers are forked, so that models and their arguments need not be picklable
+    if hasattr(multiprocessing, "get_context"):
+        return multiprocessing.get_context("fork")
+    return multiprocessing
+
+
+class _CountingQueue(object):
+    """
+    Wraps a queue to count the items put in it.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.count = 0
+
+    def put(self, item):
+        _put(self.queue, item)
+        self.count += 1
+
+
+def _search_worker(model, work_queue, result_queue, args, kwargs):
+    torch.set_num_threads(1)
+    work = _CountingQueue(work_queue)
+    while True:
+        prefix = _get(work_queue)
+        if prefix is None:
+            return
+        work.count = 0
+        try:
+            with torch_no_grad():
+                try:
+                    trace = poutine.trace(PrefixPoutine(model, prefix, work, discrete_escape, enum_extend)) \
+                        .get_trace(*args, **kwargs)
+                except NonlocalExit as site_container:
+                    site_container.reset_stack()
+                    trace = None
+                log_weight = None if trace is None else trace.log_pdf()
+        except Exception:
+            _put(result_queue, ("error", traceback.format_exc(), None, 0))
+            return
+        _put(result_queue, ("trace", trace, log_weight, work.count))
+
+
+def _importance_worker(model, guide, num_samples, seed, result_queue, args, kwargs):
+    torch.set_num_threads(1)
+    set_rng_seed(seed)
+    try:
+        with torch_no_grad():
+            for i in range(num_samples):
+                guide_trace = poutine.trace(guide).get_trace(*args, **kwargs)
+                model_trace = poutine.trace(
+                    poutine.replay(model, guide_trace)).get_trace(*args, **kwargs)
+                log_weight = model_trace.log_pdf() - guide_trace.log_pdf()
+                _put(result_queue, ("trace", model_trace, log_weight, 0))
+    except Exception:
+        _put(result_queue, ("error", traceback.format_exc(), None, 0))
+        return
+    _put(result_queue, ("done", None, None, 0))
+
+
+def _receive(result_queue, workers):
+    while True:
+        try:
+            message = _get(result_queue, timeout=_POLL_SECONDS)
+        except queue.Empty:
+            for worker in workers:
+                if not worker.is_alive() and worker.exitcode != 0:
+                    raise RuntimeError("worker process exited with code {}".format(worker.exitcode))
+            continue
+        if message[0] == "error":
+            raise RuntimeError("worker process failed:\n{}".format(message[1]))
+        return message
+
+
+def _stop(workers, joined):
+    for worker in workers:
+        if joined:
+            worker.join()
+        elif worker.is_alive():
+            worker.terminate()
+            worker.join()
+
+
+def search_traces(model, num_workers, max_tries, *args, **kwargs):
+    """
+    Enumerates the discrete sample sites of a model, like
+    :class:`~pyro.infer.search.Search`, on worker processes that share a work
+    queue of partial traces, i.e. of :class:`~pyro.poutine.TracePrefix`
+    objects. A worker pulls a partial trace, completes it while pushing the
+    other extensions of its discrete sites to the queue, and sends the complete
+    trace to the parent process.
+
+    The workers are forked, and run the model without recording gradients.
+    The order of the traces depends on the scheduling of the workers.
+
+    As with :func:`~pyro.poutine.queue`, a ``ValueError`` is raised when
+    ``max_tries`` partial traces in a row are processed without completing a
+    trace, counted in the order their results arrive.
+
+    :param callable model: the model
+    :param int num_workers: the number of worker processes
+    :param int max_tries: the maximum number of partial traces processed to
+        complete a single trace
+    :returns: an iterator over ``(trace, log_weight)`` pairs
+    """
+    context = _get_context()
+    work_queue = context.Queue()
+    result_queue = context.Queue()
+    workers = [context.Process(target=_search_worker, args=(model, work_queue, result_queue, args, kwargs))
+               for _ in range(num_workers)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    _put(work_queue, poutine.TracePrefix())
+    pending = 1  # partial traces put in the queue and not processed yet
+    tries = 0  # partial traces processed since the last complete trace
+    joined = False
+    try:
+        while pending:
+            _, trace, log_weight, num_extensions = _receive(result_queue, workers)
+            pending += num_extensions - 1
+            tries += 1
+            if trace is not None:
+                tries = 0
+                yield trace, log_weight
+            elif tries >= max_tries:
+                raise ValueError("max tries ({}) exceeded".format(str(max_tries)))
+        for _ in workers:
+            _put(work_queue, None)
+        joined = True
+    finally:
+        _stop(workers, joined)
+
+
+def importance_traces(model, guide, num_samples, num_workers, *args, **kwargs):
+    """
+    Draws weighted samples from a guide, like
+    :class:`~pyro.infer.importance.Importance`, on worker processes. Each
+    worker draws its share of the samples with its own random number
+    generator, seeded from the random number generator of the parent process,
+    so that the samples are reproducible given the seed of the parent.
+
+    The workers are forked, and run the model and guide without recording
+    gradients. The order of the samples depends on the scheduling of the
+    workers.
+
+    :param callable model: the model
+    :param callable guide: the guide
+    :param int num_samples: the total number of samples
+    :param int num_workers: the number of worker processes
+    :returns: an iterator over ``(trace, log_weight)`` pairs
+    """
+    context = _get_context()
+    result_queue = context.Queue()
+    seeds = torch.LongTensor(num_workers).random_(0, 2 ** 31)
+    workers = []
+    for i in range(num_workers):
+        worker_samples = num_samples // num_workers + (i < num_samples % num_workers)
+        workers.append(context.Process(target=_importance_worker,
+                                       args=(model, guide, worker_samples, int(seeds[i]), result_queue,
+                                             args, kwargs)))
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    running = num_workers
+    joined = False
+    try:
+        while running:
+            kind, trace, log_weight, _ = _receive(result_queue, workers)
+            if kind == "done":
+                running -= 1
+            else:
+                yield trace, log_weight
+        joined = True
+    finally:
+        _stop(workers, joined)
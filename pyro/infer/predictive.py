@@ -0,0 +1,204 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import numpy as np
+import torch
+from torch.autograd import Variable
+
+import pyro.poutine as poutine
+from pyro.infer.trace_elbo import _ParticleMessenger
+from pyro.poutine.util import site_is_subsample
+from pyro.shim import torch_no_grad
+from pyro.util import log_sum_exp
+
+
+def _latent_sites(trace):
+    return [name for name, site in trace.nodes.items()
+            if site["type"] == "sample" and not site["is_observed"] and not site_is_subsample(site)]
+
+
+def _batch_shapes(source, trace):
+    return {(source, name): getattr(trace.nodes[name]["fn"], "batch_shape", None) for name in _latent_sites(trace)}
+
+
+def _to_numpy(value):
+    if isinstance(value, Variable):
+        value = value.data
+    return value.cpu().numpy()
+
+
+class Predictive(object):
+    """
+    Draws samples from the posterior predictive distribution of a model, in
+    vectorized form: ``num_samples`` samples of the posterior are drawn at
+    once along a new leftmost sample dimension, and the model is replayed
+    against them once, so that the samples of every site are tensors whose
+    first dimension indexes the samples.
+
+    The posterior is either a guide, e.g. trained by
+    :class:`~pyro.infer.svi.SVI`, which is run once for all the samples, or
+    weighted traces of a :class:`~pyro.infer.abstract_infer.TracePosterior`,
+    e.g. :class:`~pyro.infer.mcmc.mcmc.MCMC` or
+    :class:`~pyro.infer.importance.Importance`, as returned by
+    :meth:`~pyro.infer.abstract_infer.TracePosterior.get_traces`, which are
+    resampled according to their weights and stacked.
+
+    The samples are declared independent by an outermost vectorized
+    ``iarange``, and sample sites whose distribution does not depend on the
+    samples draw a batch of them, as for the vectorized particles of
+    :class:`~pyro.infer.trace_elbo.Trace_ELBO`. The site shapes without the
+    sample dimension are recorded from an ordinary run of the model. The
+    model and guide must visit the same sites in all runs, and must not
+    depend on the shapes of the sampled values beyond broadcasting.
+    Observed sites keep their observations: to sample them, call the model
+    with the observations set to None.
+
+    The samples are drawn in chunks of at most ``chunk_size`` samples, which
+    can be streamed to a callback with :meth:`stream`, or to memory mapped
+    ``.npy`` files with :meth:`to_memmap`, so that ``num_samples`` is not
+    bounded by memory.
+
+    Example::
+
+        predictive = Predictive(model, guide=guide, num_samples=10000, chunk_size=1000)
+        samples = predictive(x)  # samples["y"] has size 10000 x len(x)
+
+        posterior = Importance(model, guide, num_samples=100).get_traces(x, y)
+        samples = Predictive(model, posterior=posterior, num_samples=10000)(x)
+
+    :param callable model: the model
+    :param callable guide: the guide, or None
+    :param list posterior: the ``(trace, log_weight)`` pairs of a posterior,
+        or None
+    :param int num_samples: the number of samples
+    :param int chunk_size: the largest number of samples drawn at once;
+        defaults to ``num_samples``
+    :param list return_sites: the names of the sites to return; defaults to
+        the sample sites of the model that are not observed
+    """
+    def __init__(self, model, guide=None, posterior=None, num_samples=1, chunk_size=None, return_sites=None):
+        if (guide is None) == (posterior is None):
+            raise ValueError("exactly one of guide and posterior must be given")
+        self.model = model
+        self.guide = guide
+        self.num_samples = num_samples
+        self.chunk_size = num_samples if chunk_size is None else chunk_size
+        self.return_sites = return_sites
+        self._posterior_values = None
+        if posterior is not None:
+            traces, log_weights = zip(*posterior)
+            self._posterior_traces = traces
+            log_weights = torch.cat([log_weight.view(1) for log_weight in log_weights])
+            if isinstance(log_weights, Variable):
+                log_weights = log_weights.data
+            self._posterior_probs = (log_weights - log_sum_exp(log_weights)).exp()
+
+    def _stacked_posterior(self):
+        """
+        :returns: the values of the latent sites of all the traces of the
+            posterior, stacked along the leftmost dimension, by site name
+        """
+        if self._posterior_values is None:
+            names = _latent_sites(self._posterior_traces[0])
+            values = {}
+            for name in names:
+                try:
+                    values[name] = torch.stack([trace.nodes[name]["value"] for trace in self._posterior_traces])
+                except KeyError:
+                    raise ValueError("site {} is not in all the traces of the posterior".format(name))
+            self._posterior_values = values
+        return self._posterior_values
+
+    def _posterior_trace(self, indices):
+        trace = poutine.Trace()
+        for name, value in self._stacked_posterior().items():
+            if indices is None:
+                value = value[0]
+            else:
+                value = value.index_select(0, Variable(indices) if isinstance(value, Variable) else indices)
+            trace.add_node(name, type="sample", name=name, value=value)
+        return trace
+
+    def _record_shapes(self, args, kwargs):
+        if self.guide is not None:
+            guide_trace = poutine.trace(self.guide).get_trace(*args, **kwargs)
+            shapes = _batch_shapes("guide", guide_trace)
+        else:
+            guide_trace = self._posterior_trace(None)
+            shapes = {}
+        model_trace = poutine.trace(poutine.replay(self.model, guide_trace)).get_trace(*args, **kwargs)
+        shapes.update(_batch_shapes("model", model_trace))
+        return shapes, _latent_sites(model_trace) if self.return_sites is None else self.return_sites
+
+    def _chunk(self, num_samples, shapes, return_sites, args, kwargs):
+        if self.guide is not None:
+            guide_trace = poutine.trace(
+                poutine.Poutine(_ParticleMessenger(num_samples, shapes, "guide"), self.guide)
+            ).get_trace(*args, **kwargs)
+        else:
+            indices = torch.multinomial(self._posterior_probs, num_samples, replacement=True)
+            guide_trace = self._posterior_trace(indices)
+        model_trace = poutine.trace(
+            poutine.Poutine(_ParticleMessenger(num_samples, shapes, "model"),
+                            poutine.replay(self.model, guide_trace))
+        ).get_trace(*args, **kwargs)
+        return {name: model_trace.nodes[name]["value"] for name in return_sites}
+
+    def stream(self, callback, *args, **kwargs):
+        """
+        Draws the samples in chunks, and passes each chunk to a callback as
+        soon as it is drawn. Any args or kwargs are passed to the model and
+        guide.
+
+        :param callable callback: called as ``callback(start, values)`` for
+            each chunk, where ``values`` are the samples number ``start`` to
+            ``start + len(chunk)`` of the returned sites, by name
+        """
+        with torch_no_grad():
+            shapes, return_sites = self._record_shapes(args, kwargs)
+            for start in range(0, self.num_samples, self.chunk_size):
+                num_samples = min(self.chunk_size, self.num_samples - start)
+                callback(start, self._chunk(num_samples, shapes, return_sites, args, kwargs))
+
+    def __call__(self, *args, **kwargs):
+        """
+        Draws the samples. Any args or kwargs are passed to the model and
+        guide.
+
+        :returns: the samples of the returned sites, by name
+        :rtype: dict
+        """
+        chunks = []
+        self.stream(lambda start, values: chunks.append(values), *args, **kwargs)
+        return {name: torch.cat([values[name] for values in chunks]) if len(chunks) > 1 else chunks[0][name]
+                for name in chunks[0]}
+
+    def to_memmap(self, directory, *args, **kwargs):
+        """
+        Draws the samples in chunks, and writes them to memory mapped ``.npy``
+        files, one per returned site, named after the site, which can be read
+        with ``numpy.load(filename, mmap_mode="r")``. Any args or kwargs are
+        passed to the model and guide.
+
+        :param str directory: the directory of the files
+        :returns: the memory mapped samples of the returned sites, by name
+        :rtype: dict
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        arrays = {}
+
+        def write(start, values):
+            for name, value in values.items():
+                value = _to_numpy(value)
+                if name not in arrays:
+                    arrays[name] = np.lib.format.open_memmap(os.path.join(directory, name + ".npy"), mode="w+",
+                                                             dtype=value.dtype,
+                                                             shape=(self.num_samples,) + value.shape[1:])
+                arrays[name][start:start + len(value)] = value
+
+        self.stream(write, *args, **kwargs)
+        for array in arrays.values():
+            array.flush()
+        return arrays
@@ -2,6 +2,7 @@ from __future__ import absolute_import, division, print_function
 
 import pyro.poutine as poutine
 from pyro.infer import TracePosterior
+from pyro.infer.parallel import search_traces
 from six.moves.queue import Queue
 
 
@@ -11,16 +12,20 @@ class Search(TracePosterior):
 
     :param callable model: Probabilistic model defined as a function.
     :param int max_tries: The maximum number of times to try completing a trace from the queue.
+    :param int num_workers: The number of worker processes sharing the queue, see
+        :func:`~pyro.infer.parallel.search_traces`. By default, the search runs in this process.
     """
-    def __init__(self, model, max_tries=1e6):
+    def __init__(self, model, max_tries=1e6, num_workers=None):
         """
         Constructor. Default `max_tries` to something sensible - 1e6.
 
         :param callable model: Probabilistic model defined as a function.
         :param int max_tries: The maximum number of times to try completing a trace from the queue.
+        :param int num_workers: The number of worker processes sharing the queue.
         """
         self.model = model
         self.max_tries = int(max_tries)
+        self.num_workers = num_workers
 
     def _traces(self, *args, **kwargs):
         """
@@ -31,9 +36,15 @@ class Search(TracePosterior):
         :returns: Iterator of traces from the posterior.
         :rtype: Generator[:class:`pyro.Trace`]
         """
+        if self.num_workers is not None:
+            for tr, log_weight in search_traces(self.model, self.num_workers, self.max_tries,
+                                                *args, **kwargs):
+                yield (tr, log_weight)
+            return
+
         # currently only using the standard library queue
         self.queue = Queue()
-        self.queue.put(poutine.Trace())
+        self.queue.put(poutine.TracePrefix())
 
         p = poutine.trace(
             poutine.queue(self.model, queue=self.queue, max_tries=self.max_tries))
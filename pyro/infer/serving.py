@@ -0,0 +1,292 @@
+"""
+Batched serving of posterior predictive samples. This module requires
+``asyncio`` and ``concurrent.futures``, i.e. Python 3.4 or later: it can be
+imported on Python 2, but its servers cannot be created there.
+"""
+from __future__ import absolute_import, division, print_function
+
+import threading
+import time
+from collections import Counter, namedtuple
+
+import torch
+from torch.autograd import Variable
+
+import pyro
+import pyro.poutine as poutine
+from pyro.params import param_store_scope
+from pyro.poutine.util import site_is_subsample
+from pyro.shim import torch_no_grad
+
+try:
+    import asyncio
+    from concurrent.futures import Future, ThreadPoolExecutor
+except ImportError:
+    asyncio = None
+
+# upper bounds of the buckets of the latency histograms, in seconds
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, float("inf"))
+
+_Request = namedtuple("_Request", ["args", "future", "start"])
+
+
+def _latency_bucket(latency):
+    for bound in LATENCY_BUCKETS:
+        if latency <= bound:
+            return bound
+
+
+def _concat(values):
+    return values[0] if len(values) == 1 else torch.cat(values, 0)
+
+
+class PredictiveServer(object):
+    """
+    Serves samples from the posterior predictive distribution of a model
+    given an amortized guide, batching concurrent requests.
+
+    The model and guide take a batch of inputs, i.e. tensors whose first
+    dimension is the batch dimension, and draw their local sites, i.e. the
+    sites of the data points, in a vectorized ``iarange`` along it::
+
+        def model(x, y=None):
+            w = pyro.sample("w", Normal(zero, one))
+            with pyro.iarange("data", x.size(0)):
+                return pyro.sample("y", Normal(x * w, one), obs=y)
+
+    Each request is a batch of inputs of one or more rows. Requests that
+    arrive within ``max_latency`` seconds of the oldest pending request, up
+    to ``max_batch_size`` of them, are concatenated along the batch dimension
+    and served by a single run of the guide, and of the model replayed
+    against the guide, see :func:`~pyro.poutine.trace` and
+    :func:`~pyro.poutine.replay`. The values of the local sites are then split
+    back per request, and each request also gets the values of the global
+    sites. Batches run one at a time on a thread of the server, so that
+    requests keep arriving while a batch runs, within the param store of the
+    server, see :func:`~pyro.params.param_store_scope`.
+
+    The server is driven by an asyncio event loop: :meth:`submit` must be
+    called from the thread of the loop, e.g. in a coroutine, and returns an
+    ``asyncio`` future. :class:`LocalClient` runs a loop for the server in a
+    thread and can be used from any thread.
+
+    The number of batches of each size is recorded in
+    :attr:`batch_sizes`, and the number of requests whose latency, from
+    :meth:`submit` to the result, falls in each bucket of
+    :data:`LATENCY_BUCKETS`, keyed by its upper bound, in :attr:`latencies`.
+
+    :param callable model: the model, taking the inputs of a batch
+    :param callable guide: the amortized guide, taking the same inputs
+    :param int max_batch_size: the largest number of requests in a batch
+    :param float max_latency: how long, in seconds, a request may wait for
+        other requests to be batched with it
+    :param list return_sites: the names of the sites to return; defaults to
+        all the sample sites of the model that are not observed
+    :param str iarange_name: the name of the ``iarange`` of the batch
+        dimension; defaults to any vectorized ``iarange``
+    :param param_store: the param store of the model and guide; defaults to
+        the param store of the current context
+    :type param_store: pyro.params.param_store.ParamStoreDict
+    """
+    def __init__(self, model, guide, max_batch_size=32, max_latency=0.005, return_sites=None,
+                 iarange_name=None, param_store=None):
+        if asyncio is None:
+            raise ImportError("PredictiveServer requires asyncio, i.e. Python 3.4 or later")
+        self.model = model
+        self.guide = guide
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.return_sites = return_sites
+        self.iarange_name = iarange_name
+        self.param_store = pyro.get_param_store() if param_store is None else param_store
+        self.batch_sizes = Counter()
+        self.latencies = Counter()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = []
+        self._timer = None
+        self._running = False
+
+    def _is_local(self, site):
+        return any(frame.vectorized and (self.iarange_name is None or frame.name == self.iarange_name)
+                   for frame in site["cond_indep_stack"])
+
+    def predict_batch(self, requests):
+        """
+        Serves a batch of requests in a single run of the guide and model.
+
+        :param list requests: the inputs of each request, as tuples of
+            tensors whose first dimension is the batch dimension
+        :returns: the values of the returned sites of each request, as
+            dicts from site name to value
+        :rtype: list
+        """
+        sizes = [args[0].size(0) for args in requests]
+        batch_args = tuple(_concat([args[i] for args in requests]) for i in range(len(requests[0])))
+        with param_store_scope(self.param_store), torch_no_grad():
+            guide_trace = poutine.trace(self.guide).get_trace(*batch_args)
+            model_trace = poutine.trace(poutine.replay(self.model, guide_trace)).get_trace(*batch_args)
+        return_sites = self.return_sites
+        if return_sites is None:
+            return_sites = [name for name, site in model_trace.nodes.items()
+                            if site["type"] == "sample" and not site["is_observed"] and
+                            not site_is_subsample(site)]
+        results = [{} for _ in requests]
+        for name in return_sites:
+            site = model_trace.nodes[name]
+            value = site["value"]
+            if name == "_RETURN":
+                local = ((isinstance(value, Variable) or torch.is_tensor(value)) and
+                         value.dim() > 0 and value.size(0) == sum(sizes))
+            else:
+                local = self._is_local(site)
+            start = 0
+            for result, size in zip(results, sizes):
+                result[name] = value[start:start + size] if local else value
+                start += size
+        return results
+
+    def submit(self, *args):
+        """
+        Queues a request.
+
+        :param args: the inputs of the request, tensors whose first dimension
+            is the batch dimension
+        :returns: a future of the values of the returned sites of the request,
+            as a dict from site name to value
+        :rtype: asyncio.Future
+        """
+        loop = asyncio.get_event_loop()
+        future = asyncio.Future(loop=loop)
+        self._pending.append(_Request(args, future, time.time()))
+        self._schedule(loop)
+        return future
+
+    def _schedule(self, loop):
+        if self._running or not self._pending:
+            return
+        waited = time.time() - self._pending[0].start
+        if len(self._pending) >= self.max_batch_size or waited >= self.max_latency:
+            self._flush(loop)
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_latency - waited, self._flush, loop)
+
+    def _flush(self, loop):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._running or not self._pending:
+            return
+        batch = self._pending[:self.max_batch_size]
+        self._pending = self._pending[self.max_batch_size:]
+        self._running = True
+        result = loop.run_in_executor(self._executor, self.predict_batch, [request.args for request in batch])
+        result.add_done_callback(lambda result: self._done(loop, batch, result))
+
+    def _done(self, loop, batch, result):
+        self._running = False
+        end = time.time()
+        error = result.exception()
+        for i, request in enumerate(batch):
+            if request.future.cancelled():
+                continue
+            if error is None:
+                request.future.set_result(result.result()[i])
+            else:
+                request.future.set_exception(error)
+            self.latencies[_latency_bucket(end - request.start)] += 1
+        self.batch_sizes[len(batch)] += 1
+        self._schedule(loop)
+
+    def mean_batch_size(self):
+        """
+        :returns: the mean size of the batches served so far
+        :rtype: float
+        """
+        num_batches = sum(self.batch_sizes.values())
+        return sum(s * n for s, n in self.batch_sizes.items()) / num_batches if num_batches else 0.0
+
+    def close(self):
+        """
+        Stops the thread of the server, once the running batch is served.
+        """
+        self._executor.shutdown(wait=True)
+
+
+class LocalClient(object):
+    """
+    In-process client of a :class:`PredictiveServer`, which runs an event
+    loop for the server in a thread, and can be used from any thread, e.g.
+    to test a server or to serve the requests of a thread pool::
+
+        with LocalClient(PredictiveServer(model, guide)) as client:
+            samples = client.predict(x)["y"]
+
+    :param PredictiveServer server: the server
+    """
+    def __init__(self, server):
+        self.server = server
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def _submit(self, args, future):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = self.server.submit(*args)
+        except Exception as e:
+            future.set_exception(e)
+            return
+
+        def done(result):
+            if result.cancelled():
+                future.cancel()
+            elif result.exception() is not None:
+                future.set_exception(result.exception())
+            else:
+                future.set_result(result.result())
+
+        result.add_done_callback(done)
+
+    def submit(self, *args):
+        """
+        Queues a request.
+
+        :param args: the inputs of the request, as for :meth:`PredictiveServer.submit`
+        :returns: a future of the values of the returned sites of the request
+        :rtype: concurrent.futures.Future
+        """
+        future = Future()
+        self._loop.call_soon_threadsafe(self._submit, args, future)
+        return future
+
+    def predict(self, *args):
+        """
+        Queues a request and waits for its result.
+
+        :param args: the inputs of the request, as for :meth:`PredictiveServer.submit`
+        :returns: the values of the returned sites of the request, as a dict
+            from site name to value
+        :rtype: dict
+        """
+        return self.submit(*args).result()
+
+    def close(self):
+        """
+        Stops the event loop and the server.
+        """
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self.server.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
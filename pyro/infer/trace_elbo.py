@@ -8,11 +8,13 @@ from torch.autograd import Variable
 
 import pyro
 import pyro.poutine as poutine
-from pyro.distributions.util import is_identically_zero
+from pyro.distributions.util import is_identically_zero, sum_terms
+from pyro.infer.contract import contract, tensor_dims
 from pyro.infer.elbo import ELBO
-from pyro.infer.enum import iter_discrete_traces
+from pyro.infer.enum import contract_trace, enumerated_dim_ordinals, iter_discrete_traces
 from pyro.infer.util import torch_backward, torch_data_sum, torch_sum
-from pyro.poutine.util import prune_subsample_sites
+from pyro.poutine.indep_poutine import IndepMessenger
+from pyro.poutine.util import prune_subsample_sites, site_is_subsample
 from pyro.util import check_model_guide_match, is_nan
 
 
@@ -42,11 +44,398 @@ def check_enum_discrete_can_run(model_trace, guide_trace):
                                for shape, (source, name) in sorted(shapes.items())])))
 
 
+def _structure_signature(trace):
+    """
+    Cheap summary of the structure of a trace: the ordered sequence of
+    site names, types and whether they are observed.
+    """
+    return tuple((name, site["type"], site["is_observed"]) for name, site in trace.nodes.items())
+
+
+class _StaticStructure(object):
+    """
+    Site layout of a (model, guide) pair, recorded once the pair has passed
+    :func:`~pyro.util.check_model_guide_match`.
+    """
+    def __init__(self, model_trace, guide_trace):
+        self.model_signature = _structure_signature(model_trace)
+        self.guide_signature = _structure_signature(guide_trace)
+        # same as the default sites of poutine.replay
+        self.replay_sites = {name: name for name, site in guide_trace.nodes.items()
+                             if site["type"] == "sample" and not site["is_observed"]}
+        self.model_subsample_sites = [name for name, site in model_trace.nodes.items()
+                                      if site_is_subsample(site)]
+        self.guide_subsample_sites = [name for name, site in guide_trace.nodes.items()
+                                      if site_is_subsample(site)]
+
+
+class _ParticleShapes(object):
+    """
+    Shapes of the sites of a (model, guide) pair, recorded from a run
+    without the particle dimension.
+    """
+    def __init__(self, model_trace, guide_trace):
+        self.model_signature = _structure_signature(model_trace)
+        self.guide_signature = _structure_signature(guide_trace)
+        guide_trace.compute_score_parts()
+        model_trace.compute_batch_log_pdf()
+        self.batch_shapes = {}
+        self.log_pdf_dims = {}
+        for source, trace in [("model", model_trace), ("guide", guide_trace)]:
+            for name, site in trace.nodes.items():
+                if site["type"] == "sample":
+                    self.batch_shapes[source, name] = getattr(site["fn"], "batch_shape", None)
+                    self.log_pdf_dims[source, name] = site["batch_log_pdf"].dim()
+
+
+class _ParticleMessenger(IndepMessenger):
+    """
+    Declares the particles to be conditionally independent like an outermost
+    ``iarange``, and draws a batch of ``num_particles`` samples at each sample
+    site whose distribution does not already depend on the particles.
+    """
+    def __init__(self, num_particles, batch_shapes, source):
+        super(_ParticleMessenger, self).__init__("num_particles_vectorized", vectorized=True)
+        self.num_particles = num_particles
+        self.batch_shapes = batch_shapes
+        self.source = source
+
+    def _process_message(self, msg):
+        super(_ParticleMessenger, self)._process_message(msg)
+        if msg.type != "sample" or msg.is_observed or msg.done or msg.value is not None:
+            return None
+        key = self.source, msg.name
+        if key not in self.batch_shapes:
+            # a new site, the shapes will be recorded again
+            return None
+        batch_shape = self.batch_shapes[key]
+        if batch_shape is None:
+            raise NotImplementedError("vectorized particles require a torch distribution at site {}".format(
+                msg.name))
+        fn_batch_shape = msg.fn.batch_shape
+        if fn_batch_shape == batch_shape:
+            msg.fn = msg.fn.reshape(sample_shape=torch.Size((self.num_particles,)))
+        elif fn_batch_shape != torch.Size((self.num_particles,)) + batch_shape:
+            raise ValueError("Expected the batch shape at site {} to be {} or {}, but got {}".format(
+                msg.name, tuple(batch_shape), (self.num_particles,) + tuple(batch_shape),
+                tuple(fn_batch_shape)))
+        return None
+
+
+def _sum_to_particles(value, dim, num_particles):
+    """
+    Sums a batched term of a vectorized trace down to a vector of length
+    ``num_particles``. Terms that do not depend on the particles are shared by
+    all of them.
+
+    :param value: a number or a tensor of either ``dim`` dimensions or
+        ``dim + 1`` dimensions, the leftmost of which indexes the particles
+    :param int dim: number of dimensions of the term without the particles
+    :param int num_particles: number of particles
+    """
+    if isinstance(value, numbers.Number):
+        return value
+    if value.dim() == dim:
+        return value.sum().expand(num_particles)
+    if value.dim() == dim + 1 and value.size(0) == num_particles:
+        return value.contiguous().view(num_particles, -1).sum(1)
+    raise ValueError("Expected a term of {} or {} dimensions, but got shape {}".format(
+        dim, dim + 1, tuple(value.size())))
+
+
+def _enum_expectation(value, guide_log_pdfs):
+    """
+    Computes the expectation of a term of an enumerated trace under the
+    enumerated guide distribution.
+
+    The term is weighted by the marginal guide probability of the values it
+    varies along, which is computed by variable elimination from the guide
+    probabilities of these values and of the upstream values they depend on.
+
+    :param value: a number or a tensor, broadcastable to the enumerated values
+    :param dict guide_log_pdfs: the batched guide log-probabilities of the
+        enumerated sites, by enumeration dimension
+    """
+    dims = tensor_dims(value, guide_log_pdfs)
+    if not dims:
+        return torch_sum(value)
+    upstream_dims = set(dims)
+    pending = list(dims)
+    while pending:
+        upstream = tensor_dims(guide_log_pdfs[pending.pop()], guide_log_pdfs) - upstream_dims
+        upstream_dims.update(upstream)
+        pending.extend(upstream)
+    log_weight = sum_terms(contract([guide_log_pdfs[dim] for dim in sorted(upstream_dims)], upstream_dims - dims))
+    weight = torch.exp(log_weight)
+    weighted = weight * value
+    # drop terms of weight zero to avoid nans
+    weighted[(weight == 0).expand_as(weighted)] = 0.0
+    return weighted.sum()
+
+
+def _zeros_like_weight(weight):
+    """
+    :returns: the initial list of ELBO terms of a particle of the given
+        weight, which broadcasts the ELBO to the shape of a batched weight
+    """
+    if isinstance(weight, numbers.Number):
+        return []
+    return [weight * 0]
+
+
 class Trace_ELBO(ELBO):
     """
     A trace implementation of ELBO-based SVI
+
+    :param bool static_structure: Whether to assume that the model and guide
+        visit the same sites in the same order at every step. The site layout
+        is then recorded once and the structural checks and copies done for
+        each particle are skipped, as long as a cheap comparison of the site
+        names, types and observation status confirms that the structure is
+        unchanged. If it has changed, the full checks are run and the new
+        layout is recorded. Note that the shapes of model and guide sites are
+        only compared when the layout is recorded. Has no effect with
+        ``enum_discrete=True`` or ``vectorize_particles=True``.
+    :param bool vectorize_particles: Whether to draw all ``num_particles``
+        particles in a single run of the guide and the model, rather than
+        running them once per particle. The particles are declared
+        conditionally independent like an outermost ``iarange``, and each
+        sample site whose distribution does not depend on the particles yet
+        draws a batch of samples along a new leftmost dimension. The model
+        and guide must broadcast correctly against that dimension, and must
+        visit the same sites for all particles, which also share the
+        subsample drawn by each ``iarange``. The shapes of the sites are
+        recorded from an ordinary run of the model and guide, which is
+        repeated whenever the sites that are visited change. Not supported
+        with ``enum_discrete=True``.
+
+    With ``enum_discrete=True``, the guide is run once for each joint
+    configuration of its discrete sites. With ``enum_discrete="parallel"``,
+    the discrete sites are instead enumerated in parallel by
+    :func:`~pyro.poutine.enum`: each of them takes the whole support of its
+    distribution along a fresh dimension to the left of the batch dimensions,
+    so that the guide and the model are run only once per particle and must
+    broadcast correctly against these dimensions. The discrete sites of the
+    model that are not in the guide are enumerated in the same way, and
+    summed out of the joint probability of the model by variable elimination
+    (see :mod:`pyro.infer.contract`), which follows the ``iarange`` structure
+    of the sites. Each term of the ELBO is then averaged over the discrete
+    values of the guide it depends on, whose marginal probabilities are
+    computed by variable elimination as well. The number of batch
+    dimensions is recorded from an ordinary run of the model and guide, which
+    is repeated whenever the sites that are visited change. The score
+    functions of other non-reparameterized sites may not depend on the
+    discrete sites.
     """
 
+    def __init__(self,
+                 num_particles=1,
+                 enum_discrete=False,
+                 static_structure=False,
+                 vectorize_particles=False):
+        super(Trace_ELBO, self).__init__(num_particles=num_particles,
+                                         enum_discrete=enum_discrete)
+        if vectorize_particles and enum_discrete:
+            raise NotImplementedError("vectorize_particles is not supported with enum_discrete")
+        self.static_structure = static_structure
+        self.vectorize_particles = vectorize_particles
+        self._static_structure = None
+        self._particle_shapes = None
+        self._enum_shapes = None
+
+    def _get_static_structure_traces(self, model, guide, *args, **kwargs):
+        """
+        runs the guide and runs the model against the guide, reusing the
+        recorded site layout when the structure has not changed
+        """
+        # the traces are fresh for each call, so they are used without copying
+        guide_poutine = poutine.trace(guide)
+        guide_poutine(*args, **kwargs)
+        guide_trace = guide_poutine.trace
+
+        structure = self._static_structure
+        if structure is not None and structure.guide_signature != _structure_signature(guide_trace):
+            structure = None
+        replay_sites = None if structure is None else structure.replay_sites
+
+        model_poutine = poutine.trace(poutine.replay(model, guide_trace, sites=replay_sites))
+        model_poutine(*args, **kwargs)
+        model_trace = model_poutine.trace
+
+        if structure is None or structure.model_signature != _structure_signature(model_trace):
+            check_model_guide_match(model_trace, guide_trace)
+            structure = _StaticStructure(model_trace, guide_trace)
+            self._static_structure = structure
+
+        for name in structure.guide_subsample_sites:
+            guide_trace.remove_node(name)
+        for name in structure.model_subsample_sites:
+            model_trace.remove_node(name)
+        return model_trace, guide_trace
+
+    def _get_vectorized_traces(self, model, guide, *args, **kwargs):
+        """
+        runs the guide and runs the model against the guide once, with all
+        particles batched along the leftmost dimension
+
+        :returns: model trace, guide trace and the recorded site shapes
+        """
+        shapes = self._particle_shapes
+        recorded = shapes is None
+        if recorded:
+            guide_trace = poutine.trace(guide).get_trace(*args, **kwargs)
+            model_trace = poutine.trace(poutine.replay(model, guide_trace)).get_trace(*args, **kwargs)
+            check_model_guide_match(model_trace, guide_trace)
+            shapes = _ParticleShapes(prune_subsample_sites(model_trace), prune_subsample_sites(guide_trace))
+            self._particle_shapes = shapes
+
+        guide_trace = poutine.trace(
+            poutine.Poutine(_ParticleMessenger(self.num_particles, shapes.batch_shapes, "guide"), guide)
+        ).get_trace(*args, **kwargs)
+        model_trace = poutine.trace(
+            poutine.Poutine(_ParticleMessenger(self.num_particles, shapes.batch_shapes, "model"),
+                            poutine.replay(model, guide_trace))
+        ).get_trace(*args, **kwargs)
+        guide_trace = prune_subsample_sites(guide_trace)
+        model_trace = prune_subsample_sites(model_trace)
+
+        if shapes.guide_signature != _structure_signature(guide_trace) or \
+                shapes.model_signature != _structure_signature(model_trace):
+            if recorded:
+                raise ValueError("The sites of the model and guide changed between the run recording "
+                                 "their shapes and the vectorized run.")
+            self._particle_shapes = None
+            return self._get_vectorized_traces(model, guide, *args, **kwargs)
+        return model_trace, guide_trace, shapes
+
+    def _get_enumerated_traces(self, model, guide, *args, **kwargs):
+        """
+        runs the guide with its discrete sites enumerated in parallel, and
+        runs the model against the guide with its discrete sites that are not
+        in the guide enumerated in parallel
+
+        :returns: model trace, guide trace and the batched guide log-pdfs of
+            the enumerated sites, by enumeration dimension
+        """
+        shapes = self._enum_shapes
+        recorded = shapes is None
+        if recorded:
+            guide_trace = poutine.trace(guide).get_trace(*args, **kwargs)
+            model_trace = poutine.trace(poutine.replay(model, guide_trace)).get_trace(*args, **kwargs)
+            # discrete sites of the model only are summed out rather than matched by the guide
+            checked_model_trace = model_trace.copy()
+            for name, site in model_trace.nodes.items():
+                if site["type"] == "sample" and not site["is_observed"] and name not in guide_trace and \
+                        getattr(site["fn"], "enumerable", False):
+                    checked_model_trace.remove_node(name)
+            check_model_guide_match(checked_model_trace, guide_trace)
+            shapes = _ParticleShapes(prune_subsample_sites(model_trace), prune_subsample_sites(guide_trace))
+            self._enum_shapes = shapes
+
+        first_available_dim = -1 - max([0] + list(shapes.log_pdf_dims.values()))
+        guide_trace = poutine.trace(poutine.enum(guide, first_available_dim)).get_trace(*args, **kwargs)
+        first_available_dim = min([first_available_dim + 1] + list(enumerated_dim_ordinals(guide_trace))) - 1
+        model_trace = poutine.trace(poutine.enum(poutine.replay(model, guide_trace), first_available_dim)
+                                    ).get_trace(*args, **kwargs)
+        guide_trace = prune_subsample_sites(guide_trace)
+        model_trace = prune_subsample_sites(model_trace)
+
+        if shapes.guide_signature != _structure_signature(guide_trace) or \
+                shapes.model_signature != _structure_signature(model_trace):
+            if recorded:
+                raise ValueError("The sites of the model and guide changed between the run recording "
+                                 "their shapes and the enumerated run.")
+            self._enum_shapes = None
+            return self._get_enumerated_traces(model, guide, *args, **kwargs)
+
+        guide_trace.compute_score_parts()
+        if not enumerated_dim_ordinals(model_trace):
+            model_trace.compute_batch_log_pdf()
+        guide_log_pdfs = {}
+        for name, site in guide_trace.nodes.items():
+            if site["type"] == "sample" and "_enum_dim" in site["infer"]:
+                guide_log_pdfs[site["infer"]["_enum_dim"]] = site["batch_log_pdf"]
+        return model_trace, guide_trace, guide_log_pdfs
+
+    def _enumerated_elbo_particle(self, model_trace, guide_trace, guide_log_pdfs):
+        """
+        :returns: the ELBO and the surrogate ELBO of a particle of an
+            enumerated run
+        """
+        model_terms, guide_terms, entropy_terms, score_function_terms = [], [], [], []
+        model_dim_ordinals = enumerated_dim_ordinals(model_trace)
+        if model_dim_ordinals:
+            # the discrete sites of the model only are summed out by variable elimination
+            dim_ordinals = enumerated_dim_ordinals(guide_trace)
+            dim_ordinals.update(model_dim_ordinals)
+            for _, log_factor in contract_trace(model_trace, model_dim_ordinals, dim_ordinals):
+                model_terms.append(_enum_expectation(log_factor, guide_log_pdfs))
+        for name, model_site in model_trace.nodes.items():
+            if model_site["type"] != "sample":
+                continue
+            if not model_dim_ordinals:
+                model_terms.append(_enum_expectation(model_site["batch_log_pdf"], guide_log_pdfs))
+            if model_site["is_observed"] or "_enum_dim" in model_site["infer"]:
+                continue
+            guide_site = guide_trace.nodes[name]
+            guide_log_pdf, score_function_term, entropy_term = guide_site["score_parts"]
+            guide_log_pdf = _enum_expectation(guide_log_pdf, guide_log_pdfs)
+            guide_terms.append(guide_log_pdf)
+            if "_enum_dim" in guide_site["infer"]:
+                # the expectation over enumerated values is exact, hence differentiable
+                entropy_terms.append(guide_log_pdf)
+                continue
+            if not is_identically_zero(entropy_term):
+                entropy_terms.append(_enum_expectation(entropy_term, guide_log_pdfs))
+            if not is_identically_zero(score_function_term):
+                if tensor_dims(score_function_term, guide_log_pdfs):
+                    raise NotImplementedError(
+                        "enum_discrete='parallel' does not support site {}, whose score function "
+                        "depends on enumerated sites".format(name))
+                score_function_terms.append(torch_sum(score_function_term))
+
+        model_log_pdf = sum_terms(model_terms)
+        elbo_particle = model_log_pdf - sum_terms(guide_terms)
+        surrogate_elbo_particle = model_log_pdf - sum_terms(entropy_terms)
+        if score_function_terms:
+            surrogate_elbo_particle = surrogate_elbo_particle + \
+                elbo_particle.detach() * sum_terms(score_function_terms)
+        return elbo_particle, surrogate_elbo_particle
+
+    def _vectorized_elbo_particles(self, model_trace, guide_trace, shapes):
+        """
+        :returns: the ELBO and the surrogate ELBO of each particle of a
+            vectorized run, as vectors of length ``num_particles``
+        """
+        num_particles = self.num_particles
+        guide_trace.compute_score_parts()
+        model_trace.compute_batch_log_pdf()
+
+        model_terms, guide_terms, entropy_terms, score_function_terms = [], [], [], []
+        for name, model_site in model_trace.nodes.items():
+            if model_site["type"] != "sample":
+                continue
+            model_terms.append(_sum_to_particles(model_site["batch_log_pdf"],
+                                                 shapes.log_pdf_dims["model", name], num_particles))
+            if model_site["is_observed"]:
+                continue
+            dim = shapes.log_pdf_dims["guide", name]
+            guide_log_pdf, score_function_term, entropy_term = guide_trace.nodes[name]["score_parts"]
+            guide_terms.append(_sum_to_particles(guide_log_pdf, dim, num_particles))
+            if not is_identically_zero(entropy_term):
+                entropy_terms.append(_sum_to_particles(entropy_term, dim, num_particles))
+            if not is_identically_zero(score_function_term):
+                score_function_terms.append(_sum_to_particles(score_function_term, dim, num_particles))
+
+        model_log_pdf = sum_terms(model_terms)
+        elbo_particles = model_log_pdf - sum_terms(guide_terms)
+        surrogate_elbo_particles = model_log_pdf - sum_terms(entropy_terms)
+        if score_function_terms:
+            # the elbo of each particle is its log_r
+            surrogate_elbo_particles = surrogate_elbo_particles + \
+                elbo_particles.detach() * sum_terms(score_function_terms)
+        return elbo_particles, surrogate_elbo_particles
+
     def _get_traces(self, model, guide, *args, **kwargs):
         """
         runs the guide and runs the model against the guide with
@@ -71,12 +460,15 @@ class Trace_ELBO(ELBO):
                     yield weight, model_trace, guide_trace, log_r
                 continue
 
-            guide_trace = poutine.trace(guide).get_trace(*args, **kwargs)
-            model_trace = poutine.trace(poutine.replay(model, guide_trace)).get_trace(*args, **kwargs)
+            if self.static_structure:
+                model_trace, guide_trace = self._get_static_structure_traces(model, guide, *args, **kwargs)
+            else:
+                guide_trace = poutine.trace(guide).get_trace(*args, **kwargs)
+                model_trace = poutine.trace(poutine.replay(model, guide_trace)).get_trace(*args, **kwargs)
 
-            check_model_guide_match(model_trace, guide_trace)
-            guide_trace = prune_subsample_sites(guide_trace)
-            model_trace = prune_subsample_sites(model_trace)
+                check_model_guide_match(model_trace, guide_trace)
+                guide_trace = prune_subsample_sites(guide_trace)
+                model_trace = prune_subsample_sites(model_trace)
 
             guide_trace.compute_score_parts()
             log_r = model_trace.log_pdf() - guide_trace.log_pdf()
@@ -84,7 +476,7 @@ class Trace_ELBO(ELBO):
             yield weight, model_trace, guide_trace, log_r
 
     def _is_batched(self, weight):
-        return self.enum_discrete and \
+        return self.enum_discrete is True and \
                isinstance(weight, Variable) and \
                weight.dim() > 0 and \
                weight.size(0) > 1
@@ -96,21 +488,38 @@ class Trace_ELBO(ELBO):
 
         Evaluates the ELBO with an estimator that uses num_particles many samples/particles.
         """
-        elbo = 0.0
-        for weight, model_trace, guide_trace, log_r in self._get_traces(model, guide, *args, **kwargs):
-            elbo_particle = weight * 0
+        if self.vectorize_particles:
+            model_trace, guide_trace, shapes = self._get_vectorized_traces(model, guide, *args, **kwargs)
+            elbo_particles, _ = self._vectorized_elbo_particles(model_trace, guide_trace, shapes)
+            loss = -torch_data_sum(elbo_particles) / self.num_particles
+            if is_nan(loss):
+                warnings.warn('Encountered NAN loss')
+            return loss
+
+        elbo_terms = []
+        if self.enum_discrete == "parallel":
+            for i in range(self.num_particles):
+                model_trace, guide_trace, guide_log_pdfs = self._get_enumerated_traces(model, guide,
+                                                                                       *args, **kwargs)
+                elbo_particle, _ = self._enumerated_elbo_particle(model_trace, guide_trace, guide_log_pdfs)
+                elbo_terms.append(elbo_particle / self.num_particles)
+            loss = -torch_data_sum(sum_terms(elbo_terms))
+            if is_nan(loss):
+                warnings.warn('Encountered NAN loss')
+            return loss
 
+        for weight, model_trace, guide_trace, log_r in self._get_traces(model, guide, *args, **kwargs):
             if self._is_batched(weight):
                 log_pdf = "batch_log_pdf"
             else:
                 log_pdf = "log_pdf"
-            for name in model_trace.nodes.keys():
-                if model_trace.nodes[name]["type"] == "sample":
-                    if model_trace.nodes[name]["is_observed"]:
-                        elbo_particle += model_trace.nodes[name][log_pdf]
-                    else:
-                        elbo_particle += model_trace.nodes[name][log_pdf]
-                        elbo_particle -= guide_trace.nodes[name][log_pdf]
+            model_terms, guide_terms = _zeros_like_weight(weight), []
+            for name, model_site in model_trace.nodes.items():
+                if model_site["type"] == "sample":
+                    model_terms.append(model_site[log_pdf])
+                    if not model_site["is_observed"]:
+                        guide_terms.append(guide_trace.nodes[name][log_pdf])
+            elbo_particle = sum_terms(model_terms) - sum_terms(guide_terms)
 
             # drop terms of weight zero to avoid nans
             if isinstance(weight, numbers.Number):
@@ -119,9 +528,10 @@ class Trace_ELBO(ELBO):
             else:
                 elbo_particle[weight == 0] = 0.0
 
-            elbo += torch_data_sum(weight * elbo_particle)
+            elbo_terms.append(torch_sum(weight * elbo_particle))
 
-        loss = -elbo
+        # a single sync and NAN check for all particles
+        loss = -torch_data_sum(sum_terms(elbo_terms))
         if is_nan(loss):
             warnings.warn('Encountered NAN loss')
         return loss
@@ -133,42 +543,50 @@ class Trace_ELBO(ELBO):
 
         Computes the ELBO as well as the surrogate ELBO that is used to form the gradient estimator.
         Performs backward on the latter. Num_particle many samples are used to form the estimators.
+        With ``vectorize_particles=True`` a single backward pass is performed for all particles.
         """
-        elbo = 0.0
+        if self.vectorize_particles:
+            return self._vectorized_loss_and_grads(model, guide, *args, **kwargs)
+        if self.enum_discrete == "parallel":
+            return self._enumerated_loss_and_grads(model, guide, *args, **kwargs)
+
+        elbo_terms = []
         # grab a trace from the generator
         for weight, model_trace, guide_trace, log_r in self._get_traces(model, guide, *args, **kwargs):
-            elbo_particle = weight * 0
-            surrogate_elbo_particle = weight * 0
             batched = self._is_batched(weight)
             # compute elbo and surrogate elbo
             if batched:
                 log_pdf = "batch_log_pdf"
             else:
                 log_pdf = "log_pdf"
+            # the terms are collected and summed with a single reduction each
+            model_terms, guide_terms, entropy_terms, score_function_terms = _zeros_like_weight(weight), [], [], []
             for name, model_site in model_trace.nodes.items():
                 if model_site["type"] == "sample":
-                    model_log_pdf = model_site[log_pdf]
-                    if model_site["is_observed"]:
-                        elbo_particle += model_log_pdf
-                        surrogate_elbo_particle += model_log_pdf
-                    else:
+                    model_terms.append(model_site[log_pdf])
+                    if not model_site["is_observed"]:
                         guide_site = guide_trace.nodes[name]
                         guide_log_pdf, score_function_term, entropy_term = guide_site["score_parts"]
 
                         if not batched:
                             guide_log_pdf = guide_log_pdf.sum()
-                        elbo_particle += model_log_pdf - guide_log_pdf
-                        surrogate_elbo_particle += model_log_pdf
+                        guide_terms.append(guide_log_pdf)
 
                         if not is_identically_zero(entropy_term):
                             if not batched:
                                 entropy_term = entropy_term.sum()
-                            surrogate_elbo_particle -= entropy_term
+                            entropy_terms.append(entropy_term)
 
                         if not is_identically_zero(score_function_term):
                             if not batched:
                                 score_function_term = score_function_term.sum()
-                            surrogate_elbo_particle += log_r.detach() * score_function_term
+                            score_function_terms.append(score_function_term)
+            model_log_pdf = sum_terms(model_terms)
+            elbo_particle = model_log_pdf - sum_terms(guide_terms)
+            surrogate_elbo_particle = model_log_pdf - sum_terms(entropy_terms)
+            if score_function_terms:
+                surrogate_elbo_particle = surrogate_elbo_particle + \
+                    log_r.detach() * sum_terms(score_function_terms)
 
             # drop terms of weight zero to avoid nans
             if isinstance(weight, numbers.Number):
@@ -180,7 +598,8 @@ class Trace_ELBO(ELBO):
                 elbo_particle[weight_eq_zero] = 0.0
                 surrogate_elbo_particle[weight_eq_zero] = 0.0
 
-            elbo += torch_data_sum(weight * elbo_particle)
+            elbo_particle = torch_sum(weight * elbo_particle)
+            elbo_terms.append(elbo_particle.detach() if isinstance(elbo_particle, Variable) else elbo_particle)
             surrogate_elbo_particle = torch_sum(weight * surrogate_elbo_particle)
 
             # collect parameters to train from model and guide
@@ -194,7 +613,54 @@ class Trace_ELBO(ELBO):
                 torch_backward(surrogate_loss_particle)
                 pyro.get_param_store().mark_params_active(trainable_params)
 
+        # a single sync and NAN check for all particles
+        loss = -torch_data_sum(sum_terms(elbo_terms))
+        if is_nan(loss):
+            warnings.warn('Encountered NAN loss')
+        return loss
+
+    def _vectorized_loss_and_grads(self, model, guide, *args, **kwargs):
+        model_trace, guide_trace, shapes = self._get_vectorized_traces(model, guide, *args, **kwargs)
+        elbo_particles, surrogate_elbo_particles = self._vectorized_elbo_particles(model_trace, guide_trace,
+                                                                                   shapes)
+        elbo = torch_data_sum(elbo_particles) / self.num_particles
+
+        trainable_params = set(site["value"]
+                               for trace in (model_trace, guide_trace)
+                               for site in trace.nodes.values()
+                               if site["type"] == "param")
+
+        if trainable_params:
+            surrogate_loss = -torch_sum(surrogate_elbo_particles) / self.num_particles
+            torch_backward(surrogate_loss)
+            pyro.get_param_store().mark_params_active(trainable_params)
+
         loss = -elbo
         if is_nan(loss):
             warnings.warn('Encountered NAN loss')
         return loss
+
+    def _enumerated_loss_and_grads(self, model, guide, *args, **kwargs):
+        elbo_terms = []
+        for i in range(self.num_particles):
+            model_trace, guide_trace, guide_log_pdfs = self._get_enumerated_traces(model, guide, *args, **kwargs)
+            elbo_particle, surrogate_elbo_particle = self._enumerated_elbo_particle(model_trace, guide_trace,
+                                                                                    guide_log_pdfs)
+            elbo_particle = elbo_particle / self.num_particles
+            elbo_terms.append(elbo_particle.detach() if isinstance(elbo_particle, Variable) else elbo_particle)
+
+            trainable_params = set(site["value"]
+                                   for trace in (model_trace, guide_trace)
+                                   for site in trace.nodes.values()
+                                   if site["type"] == "param")
+
+            if trainable_params:
+                surrogate_loss_particle = -surrogate_elbo_particle / self.num_particles
+                torch_backward(surrogate_loss_particle)
+                pyro.get_param_store().mark_params_active(trainable_params)
+
+        # a single sync and NAN check for all particles
+        loss = -torch_data_sum(sum_terms(elbo_terms))
+        if is_nan(loss):
+            warnings.warn('Encountered NAN loss')
+        return loss
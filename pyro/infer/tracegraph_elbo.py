@@ -1,15 +1,18 @@
 from __future__ import absolute_import, division, print_function
 
 import warnings
+from collections import OrderedDict
 
 import networkx
 import torch
+from torch.autograd import Variable
 
 import pyro
 import pyro.poutine as poutine
-from pyro.distributions.util import is_identically_zero
+from pyro.distributions.util import is_identically_zero, sum_terms
 from pyro.infer.elbo import ELBO
 from pyro.infer.util import torch_backward, torch_data_sum
+from pyro.poutine.trace_poutine import get_vectorized_map_data_info, identify_dense_edges
 from pyro.poutine.util import prune_subsample_sites
 from pyro.util import check_model_guide_match, detach_iterable, ng_zeros, is_nan
 
@@ -30,38 +33,154 @@ def _get_baseline_options(site):
     return options_tuple
 
 
-def _compute_downstream_costs(model_trace, guide_trace,  #
-                              model_vec_md_nodes, guide_vec_md_nodes,  #
-                              non_reparam_nodes):
-    # recursively compute downstream cost nodes for all sample sites in model and guide
-    # (even though ultimately just need for non-reparameterizable sample sites)
-    # 1. downstream costs used for rao-blackwellization
-    # 2. model observe sites (as well as terms that arise from the model and guide having different
-    # dependency structures) are taken care of via 'children_in_model' below
-    topo_sort_guide_nodes = list(reversed(list(networkx.topological_sort(guide_trace))))
-    topo_sort_guide_nodes = [x for x in topo_sort_guide_nodes
-                             if guide_trace.nodes[x]["type"] == "sample"]
-    downstream_guide_cost_nodes = {}
+def _structure_key(trace):
+    """
+    Summary of everything the dependency structure of a (pruned) trace is
+    derived from: the ordered site names and types, whether sample sites are
+    observed or reparameterized, and their ``cond_indep_stack``.
+    """
+    key = []
+    for name, site in trace.nodes.items():
+        if site["type"] == "sample":
+            key.append((name, "sample", site["is_observed"], getattr(site["fn"], "reparameterized", False),
+                        tuple((f.name, f.counter, f.vectorized) for f in site["cond_indep_stack"])))
+        elif site["type"] == "param":
+            key.append((name, "param", tuple((f.name, f.counter, f.vectorized) for f in site["cond_indep_stack"])))
+        else:
+            key.append((name, site["type"]))
+    return tuple(key)
+
+
+class _TraceGraphStructure(object):
+    """
+    The parts of the TraceGraph_ELBO gradient estimator that depend only on
+    the dependency structure of the model and guide, not on the values at
+    their sites.
+
+    :param pyro.poutine.Trace model_trace: a pruned model trace
+    :param pyro.poutine.Trace guide_trace: a pruned guide trace
+
+    Dense edges are added to the traces in place.
+    """
+    def __init__(self, model_trace, guide_trace):
+        identify_dense_edges(model_trace)
+        identify_dense_edges(guide_trace)
+
+        # get info regarding rao-blackwellization of vectorized map_data
+        guide_vec_md_info = get_vectorized_map_data_info(guide_trace)
+        model_vec_md_info = get_vectorized_map_data_info(model_trace)
+        guide_vec_md_condition = guide_vec_md_info['rao-blackwellization-condition']
+        model_vec_md_condition = model_vec_md_info['rao-blackwellization-condition']
+        self.do_vec_rb = guide_vec_md_condition and model_vec_md_condition
+        self.vec_md_warnings = guide_vec_md_info["warnings"] | model_vec_md_info["warnings"]
+        self.guide_vec_md_nodes = guide_vec_md_info['nodes'] if self.do_vec_rb else set()
+        self.model_vec_md_nodes = model_vec_md_info['nodes'] if self.do_vec_rb else set()
+
+        self.non_reparam_nodes = set(guide_trace.nonreparam_stochastic_nodes)
+        if self.non_reparam_nodes:
+            self._compute_downstream_structure(model_trace, guide_trace)
+
+    def _compute_downstream_structure(self, model_trace, guide_trace):
+        # recursively compute downstream cost nodes for all sample sites in model and guide
+        # (even though ultimately just need for non-reparameterizable sample sites)
+        # 1. downstream costs used for rao-blackwellization
+        # 2. model observe sites (as well as terms that arise from the model and guide having different
+        # dependency structures) are taken care of via 'children_in_model' below
+        topo_sort_guide_nodes = list(reversed(list(networkx.topological_sort(guide_trace.to_networkx()))))
+        self.topo_sort_guide_nodes = [x for x in topo_sort_guide_nodes
+                                      if guide_trace.nodes[x]["type"] == "sample"]
+        downstream_guide_cost_nodes = {}
+        # children whose downstream costs are summed into those of a node,
+        # and the remaining downstream nodes whose costs are added individually
+        self.summed_children = {}
+        self.missing_downstream_nodes = {}
+
+        for node in self.topo_sort_guide_nodes:
+            nodes_included_in_sum = set([node])
+            downstream_guide_cost_nodes[node] = set([node])
+            summed_children = []
+            for child in guide_trace.successors(node):
+                child_cost_nodes = downstream_guide_cost_nodes[child]
+                downstream_guide_cost_nodes[node].update(child_cost_nodes)
+                if nodes_included_in_sum.isdisjoint(child_cost_nodes):  # avoid duplicates
+                    summed_children.append(child)
+                    nodes_included_in_sum.update(child_cost_nodes)
+            self.summed_children[node] = summed_children
+            # include terms we missed because we had to avoid duplicates
+            self.missing_downstream_nodes[node] = list(downstream_guide_cost_nodes[node] - nodes_included_in_sum)
+
+        # the above may be missing terms from the model
+        self.children_in_model = {}
+        for site in self.non_reparam_nodes:
+            children_in_model = set()
+            for node in downstream_guide_cost_nodes[site]:
+                children_in_model.update(model_trace.successors(node))
+            # remove terms accounted for above
+            children_in_model.difference_update(downstream_guide_cost_nodes[site])
+            assert all(model_trace.nodes[child]["type"] == "sample" for child in children_in_model)
+            self.children_in_model[site] = list(children_in_model)
+
+
+class _StructureCache(object):
+    """
+    Least recently used cache of :class:`_TraceGraphStructure` objects keyed
+    by the structure of the model and guide traces.
+
+    :param int max_size: maximum number of structures to keep
+
+    The ``hits`` and ``misses`` counters record how often a structure was
+    reused or had to be computed.
+    """
+    def __init__(self, max_size=16):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._structures = OrderedDict()
+
+    def get(self, model_trace, guide_trace):
+        """
+        :returns: the structure of the given pruned model and guide traces
+        :rtype: _TraceGraphStructure
+        """
+        key = (_structure_key(model_trace), _structure_key(guide_trace))
+        structure = self._structures.pop(key, None)
+        if structure is None:
+            self.misses += 1
+            structure = _TraceGraphStructure(model_trace, guide_trace)
+        else:
+            self.hits += 1
+        self._structures[key] = structure
+        while len(self._structures) > self.max_size:
+            self._structures.popitem(last=False)
+        return structure
+
+    def clear(self):
+        """
+        Drops all cached structures and resets the counters.
+        """
+        self.hits = 0
+        self.misses = 0
+        self._structures.clear()
+
+    def __len__(self):
+        return len(self._structures)
+
+
+def _compute_downstream_costs(model_trace, guide_trace, structure):
+    guide_vec_md_nodes = structure.guide_vec_md_nodes
+    model_vec_md_nodes = structure.model_vec_md_nodes
     downstream_costs = {}
 
-    for node in topo_sort_guide_nodes:
+    for node in structure.topo_sort_guide_nodes:
         node_log_pdf_key = 'batch_log_pdf' if node in guide_vec_md_nodes else 'log_pdf'
         downstream_costs[node] = model_trace.nodes[node][node_log_pdf_key] - \
             guide_trace.nodes[node][node_log_pdf_key]
-        nodes_included_in_sum = set([node])
-        downstream_guide_cost_nodes[node] = set([node])
-        for child in guide_trace.successors(node):
-            child_cost_nodes = downstream_guide_cost_nodes[child]
-            downstream_guide_cost_nodes[node].update(child_cost_nodes)
-            if nodes_included_in_sum.isdisjoint(child_cost_nodes):  # avoid duplicates
-                if node_log_pdf_key == 'log_pdf':
-                    downstream_costs[node] += downstream_costs[child].sum()
-                else:
-                    downstream_costs[node] += downstream_costs[child]
-                nodes_included_in_sum.update(child_cost_nodes)
-        missing_downstream_costs = downstream_guide_cost_nodes[node] - nodes_included_in_sum
-        # include terms we missed because we had to avoid duplicates
-        for missing_node in missing_downstream_costs:
+        for child in structure.summed_children[node]:
+            if node_log_pdf_key == 'log_pdf':
+                downstream_costs[node] += downstream_costs[child].sum()
+            else:
+                downstream_costs[node] += downstream_costs[child]
+        for missing_node in structure.missing_downstream_nodes[node]:
             mn_log_pdf_key = 'batch_log_pdf' if missing_node in guide_vec_md_nodes else 'log_pdf'
             if node_log_pdf_key == 'log_pdf':
                 downstream_costs[node] += (model_trace.nodes[missing_node][mn_log_pdf_key] -
@@ -71,18 +190,11 @@ def _compute_downstream_costs(model_trace, guide_trace,  #
                                           guide_trace.nodes[missing_node][mn_log_pdf_key]
 
     # finish assembling complete downstream costs
-    # (the above computation may be missing terms from model)
     # XXX can we cache some of the sums over children_in_model to make things more efficient?
-    for site in non_reparam_nodes:
-        children_in_model = set()
-        for node in downstream_guide_cost_nodes[site]:
-            children_in_model.update(model_trace.successors(node))
-        # remove terms accounted for above
-        children_in_model.difference_update(downstream_guide_cost_nodes[site])
-        for child in children_in_model:
+    for site in structure.non_reparam_nodes:
+        site_log_pdf_key = 'batch_log_pdf' if site in guide_vec_md_nodes else 'log_pdf'
+        for child in structure.children_in_model[site]:
             child_log_pdf_key = 'batch_log_pdf' if child in model_vec_md_nodes else 'log_pdf'
-            site_log_pdf_key = 'batch_log_pdf' if site in guide_vec_md_nodes else 'log_pdf'
-            assert (model_trace.nodes[child]["type"] == "sample")
             if site_log_pdf_key == 'log_pdf':
                 downstream_costs[site] += model_trace.nodes[child][child_log_pdf_key].sum()
             else:
@@ -92,27 +204,29 @@ def _compute_downstream_costs(model_trace, guide_trace,  #
 
 
 def _compute_elbo_reparam(model_trace, guide_trace, non_reparam_nodes):
-    elbo = 0.0
-    surrogate_elbo = 0.0
+    # the terms are collected and summed with a single reduction each
+    model_terms = []
+    guide_terms = []
+    entropy_terms = []
     for name, model_site in model_trace.nodes.items():
         if model_site["type"] == "sample":
-            if model_site["is_observed"]:
-                elbo += model_site["log_pdf"]
-                surrogate_elbo += model_site["log_pdf"]
-            else:
-                # deal with log p(z|...) term
-                elbo += model_site["log_pdf"]
-                surrogate_elbo += model_site["log_pdf"]
+            model_terms.append(model_site["log_pdf"])
+            if not model_site["is_observed"]:
                 # deal with log q(z|...) term, if present
                 guide_site = guide_trace.nodes[name]
-                elbo -= guide_site["log_pdf"]
+                guide_terms.append(guide_site["log_pdf"])
                 entropy_term = guide_site["score_parts"].entropy_term
                 if not is_identically_zero(entropy_term):
-                    surrogate_elbo -= entropy_term.sum()
+                    entropy_terms.append(entropy_term.sum())
 
     # elbo is never differentiated, surragate_elbo is
+    model_log_pdf = sum_terms(model_terms)
+    elbo = model_log_pdf - sum_terms(guide_terms)
+    surrogate_elbo = model_log_pdf - sum_terms(entropy_terms)
+    if isinstance(elbo, Variable):
+        elbo = elbo.detach()
 
-    return torch_data_sum(elbo), surrogate_elbo
+    return elbo, surrogate_elbo
 
 
 def _compute_elbo_non_reparam(guide_trace, guide_vec_md_nodes,  #
@@ -181,8 +295,19 @@ class TraceGraph_ELBO(ELBO):
 
     [2] `Neural Variational Inference and Learning in Belief Networks`
         Andriy Mnih, Karol Gregor
+
+    The analysis of the dependency structure of the model and guide is
+    cached across steps for as long as their site layout is unchanged; see
+    the ``hits`` and ``misses`` counters of ``structure_cache``.
     """
 
+    def __init__(self,
+                 num_particles=1,
+                 enum_discrete=False):
+        super(TraceGraph_ELBO, self).__init__(num_particles=num_particles,
+                                              enum_discrete=enum_discrete)
+        self.structure_cache = _StructureCache()
+
     def _get_traces(self, model, guide, *args, **kwargs):
         """
         runs the guide and runs the model against the guide with
@@ -193,10 +318,10 @@ class TraceGraph_ELBO(ELBO):
             if self.enum_discrete:
                 raise NotImplementedError("https://github.com/uber/pyro/issues/220")
 
-            guide_trace = poutine.trace(guide,
-                                        graph_type="dense").get_trace(*args, **kwargs)
-            model_trace = poutine.trace(poutine.replay(model, guide_trace),
-                                        graph_type="dense").get_trace(*args, **kwargs)
+            # dense edges are only added when the structure of the traces is first seen,
+            # see _StructureCache
+            guide_trace = poutine.trace(guide).get_trace(*args, **kwargs)
+            model_trace = poutine.trace(poutine.replay(model, guide_trace)).get_trace(*args, **kwargs)
 
             check_model_guide_match(model_trace, guide_trace)
             guide_trace = prune_subsample_sites(guide_trace)
@@ -212,23 +337,23 @@ class TraceGraph_ELBO(ELBO):
 
         Evaluates the ELBO with an estimator that uses num_particles many samples/particles.
         """
-        elbo = 0.0
+        elbo_terms = []
         for weight, model_trace, guide_trace in self._get_traces(model, guide, *args, **kwargs):
-            guide_trace.log_pdf(), model_trace.log_pdf()
+            model_trace.compute_batch_log_pdf()
+            guide_trace.compute_batch_log_pdf()
 
-            elbo_particle = 0.0
+            model_terms, guide_terms = [], []
+            for name, model_site in model_trace.nodes.items():
+                if model_site["type"] == "sample":
+                    model_terms.append(model_site["log_pdf"])
+                    if not model_site["is_observed"]:
+                        guide_terms.append(guide_trace.nodes[name]["log_pdf"])
+            elbo_particle = sum_terms(model_terms) - sum_terms(guide_terms)
 
-            for name in model_trace.nodes.keys():
-                if model_trace.nodes[name]["type"] == "sample":
-                    if model_trace.nodes[name]["is_observed"]:
-                        elbo_particle += model_trace.nodes[name]["log_pdf"]
-                    else:
-                        elbo_particle += model_trace.nodes[name]["log_pdf"]
-                        elbo_particle -= guide_trace.nodes[name]["log_pdf"]
+            elbo_terms.append(weight * elbo_particle)
 
-            elbo += torch_data_sum(weight * elbo_particle)
-
-        loss = -elbo
+        # a single sync and NAN check for all particles
+        loss = -torch_data_sum(sum_terms(elbo_terms))
         if is_nan(loss):
             warnings.warn('Encountered NAN loss')
         return loss
@@ -242,26 +367,24 @@ class TraceGraph_ELBO(ELBO):
         Performs backward on the latter. Num_particle many samples are used to form the estimators.
         If baselines are present, a baseline loss is also constructed and differentiated.
         """
-        loss = 0.0
+        loss_terms = []
         for weight, model_trace, guide_trace in self._get_traces(model, guide, *args, **kwargs):
-            loss += self._loss_and_grads_particle(weight, model_trace, guide_trace)
+            loss_terms.append(self._loss_and_grads_particle(weight, model_trace, guide_trace))
+
+        # a single sync and NAN check for all particles
+        loss = torch_data_sum(sum_terms(loss_terms))
+        if is_nan(loss):
+            warnings.warn('Encountered NAN loss')
         return loss
 
     def _loss_and_grads_particle(self, weight, model_trace, guide_trace):
-        # get info regarding rao-blackwellization of vectorized map_data
-        guide_vec_md_info = guide_trace.graph["vectorized_map_data_info"]
-        model_vec_md_info = model_trace.graph["vectorized_map_data_info"]
-        guide_vec_md_condition = guide_vec_md_info['rao-blackwellization-condition']
-        model_vec_md_condition = model_vec_md_info['rao-blackwellization-condition']
-        do_vec_rb = guide_vec_md_condition and model_vec_md_condition
-        if not do_vec_rb:
+        structure = self.structure_cache.get(model_trace, guide_trace)
+        if not structure.do_vec_rb:
             warnings.warn(
                 "Unable to do fully-vectorized Rao-Blackwellization in TraceGraph_ELBO. "
                 "Falling back to higher-variance gradient estimator. "
                 "Try to avoid these issues in your model and guide:\n{}".format("\n".join(
-                    guide_vec_md_info["warnings"] | model_vec_md_info["warnings"])))
-        guide_vec_md_nodes = guide_vec_md_info['nodes'] if do_vec_rb else set()
-        model_vec_md_nodes = model_vec_md_info['nodes'] if do_vec_rb else set()
+                    structure.vec_md_warnings)))
 
         # have the trace compute all the individual (batch) log pdf terms
         # and score function terms (if present) so that they are available below
@@ -269,16 +392,15 @@ class TraceGraph_ELBO(ELBO):
         guide_trace.compute_score_parts()
 
         # compute elbo for reparameterized nodes
-        non_reparam_nodes = set(guide_trace.nonreparam_stochastic_nodes)
+        non_reparam_nodes = structure.non_reparam_nodes
         elbo, surrogate_elbo = _compute_elbo_reparam(model_trace, guide_trace, non_reparam_nodes)
 
         # the following computations are only necessary if we have non-reparameterizable nodes
         baseline_loss = 0.0
         if non_reparam_nodes:
-            downstream_costs = _compute_downstream_costs(
-                    model_trace, guide_trace,  model_vec_md_nodes, guide_vec_md_nodes, non_reparam_nodes)
+            downstream_costs = _compute_downstream_costs(model_trace, guide_trace, structure)
             surrogate_elbo_term, baseline_loss = _compute_elbo_non_reparam(
-                    guide_trace, guide_vec_md_nodes, non_reparam_nodes, downstream_costs)
+                    guide_trace, structure.guide_vec_md_nodes, non_reparam_nodes, downstream_costs)
             surrogate_elbo += surrogate_elbo_term
 
         # collect parameters to train from model and guide
@@ -292,7 +414,4 @@ class TraceGraph_ELBO(ELBO):
             torch_backward(weight * (surrogate_loss + baseline_loss))
             pyro.get_param_store().mark_params_active(trainable_params)
 
-        loss = -elbo
-        if is_nan(loss):
-            warnings.warn('Encountered NAN loss')
-        return weight * loss
+        return weight * -elbo
@@ -7,71 +7,71 @@ from .adagrad_rmsprop import AdagradRMSProp as pt_AdagradRMSProp
 from .optim import PyroOptim
 
 
-def Adam(optim_args):
+def Adam(optim_args, grouped=False):
     """
     A wrapper for torch.optim.Adam
     """
-    return PyroOptim(torch.optim.Adam, optim_args)
+    return PyroOptim(torch.optim.Adam, optim_args, grouped=grouped)
 
 
-def Adadelta(optim_args):
+def Adadelta(optim_args, grouped=False):
     """
     A wrapper for torch.optim.Adadelta
     """
-    return PyroOptim(torch.optim.Adadelta, optim_args)
+    return PyroOptim(torch.optim.Adadelta, optim_args, grouped=grouped)
 
 
-def Adagrad(optim_args):
+def Adagrad(optim_args, grouped=False):
     """
     A wrapper for torch.optim.Adagrad
     """
-    return PyroOptim(torch.optim.Adagrad, optim_args)
+    return PyroOptim(torch.optim.Adagrad, optim_args, grouped=grouped)
 
 
-def AdagradRMSProp(optim_args):
+def AdagradRMSProp(optim_args, grouped=False):
     """
     A wrapper for an optimizer that is a mash-up of Adagrad and RMSProp
     """
-    return PyroOptim(pt_AdagradRMSProp, optim_args)
+    return PyroOptim(pt_AdagradRMSProp, optim_args, grouped=grouped)
 
 
-def Adamax(optim_args):
+def Adamax(optim_args, grouped=False):
     """
     A wrapper for torch.optim.Adamax
     """
-    return PyroOptim(torch.optim.Adamax, optim_args)
+    return PyroOptim(torch.optim.Adamax, optim_args, grouped=grouped)
 
 
-def ASGD(optim_args):
+def ASGD(optim_args, grouped=False):
     """
     A wrapper for torch.optim.ASGD
     """
-    return PyroOptim(torch.optim.ASGD, optim_args)
+    return PyroOptim(torch.optim.ASGD, optim_args, grouped=grouped)
 
 
-def RMSprop(optim_args):
+def RMSprop(optim_args, grouped=False):
     """
     A wrapper for torch.optim.RMSprop
     """
-    return PyroOptim(torch.optim.RMSprop, optim_args)
+    return PyroOptim(torch.optim.RMSprop, optim_args, grouped=grouped)
 
 
-def Rprop(optim_args):
+def Rprop(optim_args, grouped=False):
     """
     A wrapper for torch.optim.Rprop
     """
-    return PyroOptim(torch.optim.Rprop, optim_args)
+    return PyroOptim(torch.optim.Rprop, optim_args, grouped=grouped)
 
 
-def SGD(optim_args):
+def SGD(optim_args, grouped=False):
     """
     A wrapper for torch.optim.SGD
     """
-    return PyroOptim(torch.optim.SGD, optim_args)
+    return PyroOptim(torch.optim.SGD, optim_args, grouped=grouped)
 
 
-def ClippedAdam(optim_args):
+def ClippedAdam(optim_args, grouped=False):
     """
     A wrapper for a modification of the Adam optimization algorithm that supports gradient clipping
     """
-    return PyroOptim(pt_ClippedAdam, optim_args)
+    return PyroOptim(pt_ClippedAdam, optim_args, grouped=grouped)
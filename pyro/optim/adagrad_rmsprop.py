@@ -3,6 +3,8 @@ from __future__ import absolute_import, division, print_function
 import torch
 from torch.optim.optimizer import Optimizer
 
+from pyro.optim.multi_tensor import FlatStateCache, copy_flat_, flatten, step_buckets
+
 
 class AdagradRMSProp(Optimizer):
     """
@@ -27,17 +29,28 @@ class AdagradRMSProp(Optimizer):
     :type t: float
     :param delta: modulates the exponent that controls how the step size scales (optional: default: 1e-16)
     :type delta: float
+    :param multi_tensor: whether to update the parameters of all groups with the same arguments at once, with a
+        few operations on their concatenation, rather than one parameter at a time (optional; default: False)
+    :type multi_tensor: bool
     """
 
-    def __init__(self, params, eta=1.0, delta=1.0e-16, t=0.1):
-        defaults = dict(eta=eta, delta=delta, t=t)
+    def __init__(self, params, eta=1.0, delta=1.0e-16, t=0.1, multi_tensor=False):
+        defaults = dict(eta=eta, delta=delta, t=t, multi_tensor=multi_tensor)
         super(AdagradRMSProp, self).__init__(params, defaults)
+        self._flat_state = FlatStateCache()
 
         for group in self.param_groups:
             for p in group['params']:
-                state = self.state[p]
-                state['step'] = 0
-                state['sum'] = torch.zeros_like(p.data)
+                self._init_state(p)
+
+    def __setstate__(self, state):
+        super(AdagradRMSProp, self).__setstate__(state)
+        self._flat_state = FlatStateCache()
+
+    def _init_state(self, p):
+        state = self.state[p]
+        state['step'] = 0
+        state['sum'] = torch.zeros_like(p.data)
 
     def share_memory(self):
         for group in self.param_groups:
@@ -55,7 +68,12 @@ class AdagradRMSProp(Optimizer):
         if closure is not None:
             loss = closure()
 
+        multi_tensor_groups = []
         for group in self.param_groups:
+            if group.get('multi_tensor'):
+                multi_tensor_groups.append(group)
+                continue
+
             for p in group['params']:
                 if p.grad is None:
                     continue
@@ -66,6 +84,9 @@ class AdagradRMSProp(Optimizer):
                     raise NotImplementedError
 
                 state = self.state[p]
+                # params added with add_param_group
+                if len(state) == 0:
+                    self._init_state(p)
                 state['step'] += 1
                 if state['step'] == 1:
                     # if first step, initialize variance bit to grad^2
@@ -78,4 +99,29 @@ class AdagradRMSProp(Optimizer):
                 std = state['sum'].sqrt()
                 p.data.addcdiv_(-lr, grad, 1.0 + std)
 
+        if multi_tensor_groups:
+            self._multi_tensor_step(multi_tensor_groups)
+
         return loss
+
+    def _multi_tensor_step(self, groups):
+        for group in groups:
+            for p in group['params']:
+                if p.grad is not None and p.grad.data.is_sparse:
+                    raise NotImplementedError
+        buckets = step_buckets(self.state, groups, self._init_state)
+        for i, (group, step, params) in enumerate(buckets):
+            grad = flatten([p.grad.data for p in params])
+            data = flatten([p.data for p in params])
+            sum_ = self._flat_state(self.state, params, 'sum', i)
+            if step == 1:
+                # if first step, initialize variance bit to grad^2
+                sum_.copy_(grad * grad)
+            else:
+                sum_ *= (1.0 - group['t'])
+                sum_ += group['t'] * grad * grad
+
+            lr = group['eta'] * (step ** (-0.5 + group['delta']))
+            std = sum_.sqrt()
+            data.addcdiv_(-lr, grad, 1.0 + std)
+            copy_flat_([p.data for p in params], data)
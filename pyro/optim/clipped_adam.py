@@ -4,6 +4,8 @@ import math
 
 from torch.optim.optimizer import Optimizer
 
+from pyro.optim.multi_tensor import FlatStateCache, copy_flat_, flatten, step_buckets
+
 
 class ClippedAdam(Optimizer):
     """
@@ -16,6 +18,11 @@ class ClippedAdam(Optimizer):
     :param weight_decay: weight decay (L2 penalty) (default: 0)
     :param clip_norm: magnitude of norm to which gradients are clipped (default: 10.0)
     :param lrd: rate at which learning rate decays (default: 1.0)
+    :param bool multi_tensor: whether to update the parameters of all groups
+        with the same arguments at once, with a few operations on their
+        concatenation, rather than one parameter at a time (default: False).
+        The updates are the same, but the gradients of the parameters are not
+        clipped in place.
 
     Small modification to the Adam algorithm implemented in torch.optim.Adam
     to include gradient clipping and learning rate decay.
@@ -26,11 +33,17 @@ class ClippedAdam(Optimizer):
     https://arxiv.org/abs/1412.6980
     """
     def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-8,
-                 weight_decay=0, clip_norm=10.0, lrd=1.0):
+                 weight_decay=0, clip_norm=10.0, lrd=1.0, multi_tensor=False):
         defaults = dict(lr=lr, betas=betas, eps=eps,
                         weight_decay=weight_decay,
-                        clip_norm=clip_norm, lrd=lrd)
+                        clip_norm=clip_norm, lrd=lrd,
+                        multi_tensor=multi_tensor)
         super(ClippedAdam, self).__init__(params, defaults)
+        self._flat_state = FlatStateCache()
+
+    def __setstate__(self, state):
+        super(ClippedAdam, self).__setstate__(state)
+        self._flat_state = FlatStateCache()
 
     def step(self, closure=None):
         """
@@ -42,9 +55,14 @@ class ClippedAdam(Optimizer):
         if closure is not None:
             loss = closure()
 
+        multi_tensor_groups = []
         for group in self.param_groups:
             group['lr'] *= group['lrd']
 
+            if group.get('multi_tensor'):
+                multi_tensor_groups.append(group)
+                continue
+
             for p in group['params']:
                 if p.grad is None:
                     continue
@@ -80,4 +98,39 @@ class ClippedAdam(Optimizer):
 
                 p.data.addcdiv_(-step_size, exp_avg, denom)
 
+        if multi_tensor_groups:
+            self._multi_tensor_step(multi_tensor_groups)
+
         return loss
+
+    def _init_state(self, p):
+        grad = p.grad.data
+        state = self.state[p]
+        state['step'] = 0
+        state['exp_avg'] = grad.new().resize_as_(grad).zero_()
+        state['exp_avg_sq'] = grad.new().resize_as_(grad).zero_()
+
+    def _multi_tensor_step(self, groups):
+        buckets = step_buckets(self.state, groups, self._init_state)
+        for i, (group, step, params) in enumerate(buckets):
+            beta1, beta2 = group['betas']
+            grad = flatten([p.grad.data for p in params])
+            grad.clamp_(-group['clip_norm'], group['clip_norm'])
+            data = flatten([p.data for p in params])
+            exp_avg = self._flat_state(self.state, params, 'exp_avg', i)
+            exp_avg_sq = self._flat_state(self.state, params, 'exp_avg_sq', i)
+
+            if group['weight_decay'] != 0:
+                grad = grad.add(group['weight_decay'], data)
+
+            exp_avg.mul_(beta1).add_(1 - beta1, grad)
+            exp_avg_sq.mul_(beta2).addcmul_(1 - beta2, grad, grad)
+
+            denom = exp_avg_sq.sqrt().add_(group['eps'])
+
+            bias_correction1 = 1 - beta1 ** step
+            bias_correction2 = 1 - beta2 ** step
+            step_size = group['lr'] * math.sqrt(bias_correction2) / bias_correction1
+
+            data.addcdiv_(-step_size, exp_avg, denom)
+            copy_flat_([p.data for p in params], data)
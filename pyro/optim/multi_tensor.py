@@ -0,0 +1,121 @@
+from __future__ import absolute_import, division, print_function
+
+from collections import OrderedDict
+
+import torch
+
+
+def flatten(tensors):
+    """
+    Concatenates tensors into a new one dimensional tensor.
+
+    :param list tensors: tensors of the same type
+    :returns: the concatenation of the flattened tensors
+    :rtype: torch.Tensor
+    """
+    return torch.cat([t.contiguous().view(-1) for t in tensors])
+
+
+def unflatten(flat, tensors):
+    """
+    Splits a flat tensor into views shaped like tensors, i.e. the inverse of
+    :func:`flatten`.
+
+    :param torch.Tensor flat: a one dimensional tensor
+    :param list tensors: tensors whose shapes give the layout of flat
+    :returns: a list of views into flat
+    """
+    views = []
+    offset = 0
+    for t in tensors:
+        numel = t.numel()
+        views.append(flat.narrow(0, offset, numel).view(t.size()))
+        offset += numel
+    return views
+
+
+def copy_flat_(tensors, flat):
+    """
+    Copies the elements of a flat tensor back into tensors, in place.
+
+    :param list tensors: tensors laid out in flat as by :func:`flatten`
+    :param torch.Tensor flat: a one dimensional tensor
+    """
+    for t, view in zip(tensors, unflatten(flat, tensors)):
+        t.copy_(view)
+
+
+def _hyperparams_key(group):
+    return tuple(sorted((name, tuple(value) if isinstance(value, list) else value)
+                        for name, value in group.items() if name != 'params'))
+
+
+def step_buckets(state, groups, init_state):
+    """
+    Counts a step for every param with a gradient in groups, and buckets these params so that each
+    bucket can be updated at once: by the hyperparameters of their group, since e.g.
+    :class:`~pyro.optim.optim.PyroOptim` puts each param in a group of its own, and by their step count.
+
+    :param dict state: the state of the optimizer, from param to dict
+    :param list groups: param groups of the optimizer
+    :param callable init_state: initializes the (empty) state of a param seen for the first time
+    :returns: a list of ``(group, step, params)`` triples, where group is the first param group of the
+        bucket
+    """
+    buckets = OrderedDict()
+    for group in groups:
+        key = _hyperparams_key(group)
+        for p in group['params']:
+            if p.grad is None:
+                continue
+            param_state = state[p]
+            if len(param_state) == 0:
+                init_state(p)
+            param_state['step'] += 1
+            bucket = buckets.setdefault((key, param_state['step']), (group, []))
+            bucket[1].append(p)
+    return [(group, key[1], params) for key, (group, params) in buckets.items()]
+
+
+class FlatStateCache(object):
+    """
+    Keeps an entry of the per-parameter state of an optimizer, e.g. a moment
+    estimate, in one flat tensor for a list of parameters, so that it can be
+    updated in place with a single operation. The state entries of the
+    parameters are replaced by views into the flat tensor, so that the state
+    of the optimizer is still saved and loaded per parameter.
+
+    The flat tensor is reused from step to step as long as the list of
+    parameters is the same and their state entries are still its views, e.g.
+    until :meth:`~torch.optim.Optimizer.load_state_dict` replaces them.
+    """
+    def __init__(self):
+        self._cache = {}  # key -> (params, flat, views)
+
+    def __call__(self, state, params, name, key=None):
+        """
+        :param dict state: the state of the optimizer, from param to dict
+        :param list params: the params to gather, in order
+        :param str name: the name of the state entry
+        :param key: an additional key to tell apart lists of params that are
+            updated in the same step, e.g. the index of their bucket
+        :returns: the flat tensor whose views are ``state[p][name]``
+        :rtype: torch.Tensor
+        """
+        key = name, key
+        cached = self._cache.get(key)
+        if cached is not None:
+            cached_params, flat, views = cached
+            if len(cached_params) == len(params) and \
+                    all(p is q and state[p][name] is view for p, q, view in zip(params, cached_params, views)):
+                return flat
+        entries = [state[p][name] for p in params]
+        flat = flatten(entries)
+        views = unflatten(flat, entries)
+        for p, view in zip(params, views):
+            state[p][name] = view
+        self._cache[key] = (list(params), flat, views)
+        return flat
+
+    def clear(self):
+        self._cache.clear()
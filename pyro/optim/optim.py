@@ -1,11 +1,29 @@
 from __future__ import absolute_import, division, print_function
 
+import copy
+
 import cloudpickle
+import torch
 
 import pyro
 from pyro.params import module_from_param_with_module_name, user_param_name
 
 
+def _optim_args_key(optim_args):
+    """
+    Hashable key of a dictionary of optimizer arguments. Unhashable values
+    are compared by identity.
+    """
+    key = []
+    for name, value in sorted(optim_args.items()):
+        try:
+            hash(value)
+        except TypeError:
+            value = id(value)
+        key.append((name, value))
+    return tuple(key)
+
+
 class PyroOptim(object):
     """
     A wrapper for torch.optim.Optimizer objects that helps managing with dynamically generated parameters
@@ -13,8 +31,13 @@ class PyroOptim(object):
     :param optim_constructor: a torch.optim.Optimizer
     :param optim_args: a dictionary of learning arguments for the optimizer or a callable that returns
         such dictionaries
+    :param bool grouped: Whether parameters with the same optimizer arguments should share a single
+        torch optimizer, with one param group per parameter, rather than each having its own optimizer.
+        This avoids a Python loop over optimizers at each step when there are many parameters. New
+        parameters are added lazily as new param groups. The state is still saved and loaded per
+        parameter name, in the same format in both modes.
     """
-    def __init__(self, optim_constructor, optim_args):
+    def __init__(self, optim_constructor, optim_args, grouped=False):
         self.pt_optim_constructor = optim_constructor
 
         # must be callable or dict
@@ -27,6 +50,12 @@ class PyroOptim(object):
         # holds the torch optimizer objects
         self.optim_objs = {}
 
+        self.grouped = grouped
+        # in grouped mode: the shared torch optimizer of each distinct optim_args,
+        # and the param group of each param
+        self._grouped_optims = {}
+        self._param_groups = {}
+
         # any optimizer state that's waiting to be consumed (because that parameter hasn't been seen before)
         self._state_waiting_to_be_consumed = {}
 
@@ -38,6 +67,9 @@ class PyroOptim(object):
         Do an optimization step for each param in params. If a given param has never been seen before,
         initialize an optimizer for it.
         """
+        if self.grouped:
+            self._grouped_step(params, *args, **kwargs)
+            return
 
         for p in params:
             # if we have not seen this param before, we instantiate and optim object to deal with it
@@ -56,15 +88,79 @@ class PyroOptim(object):
             # actually perform the step for the optim object
             self.optim_objs[p].step(*args, **kwargs)
 
+    def _add_grouped_param(self, p):
+        """
+        Adds a new param to the shared optimizer of its optim_args, as a new param group.
+        """
+        def_optim_dict = self._get_optim_args(p)
+        key = _optim_args_key(def_optim_dict)
+        optim = self._grouped_optims.get(key)
+        if optim is None:
+            optim = self.pt_optim_constructor([p], **def_optim_dict)
+            self._grouped_optims[key] = optim
+        else:
+            optim.add_param_group({"params": [p]})
+        group = optim.param_groups[-1]
+        self.optim_objs[p] = optim
+        self._param_groups[p] = group
+
+        # set state from _state_waiting_to_be_consumed if present
+        param_name = pyro.get_param_store().param_name(p)
+        if param_name in self._state_waiting_to_be_consumed:
+            state = self._state_waiting_to_be_consumed.pop(param_name)
+            # same as optim.load_state_dict() for a single param group
+            saved_group = state["param_groups"][0]
+            group.update((name, value) for name, value in saved_group.items() if name != "params")
+            saved_state = state["state"].get(saved_group["params"][0])
+            if saved_state is not None:
+                optim.state[p] = {name: value.type_as(p.data) if torch.is_tensor(value) else copy.deepcopy(value)
+                                  for name, value in saved_state.items()}
+
+    def _grouped_step(self, params, *args, **kwargs):
+        """
+        Steps each shared optimizer once, restricted to the param groups of the given params.
+        """
+        active_groups = {}
+        for p in params:
+            if p not in self._param_groups:
+                self._add_grouped_param(p)
+            active_groups.setdefault(self.optim_objs[p], []).append(self._param_groups[p])
+        for optim, groups in active_groups.items():
+            if len(groups) == len(optim.param_groups):
+                optim.step(*args, **kwargs)
+                continue
+            # other params must not be updated by their (zero) gradients
+            all_groups = optim.param_groups
+            optim.param_groups = groups
+            try:
+                optim.step(*args, **kwargs)
+            finally:
+                optim.param_groups = all_groups
+
     def get_state(self):
         """
         Get state associated with all the optimizers in the form of a dictionary with
         key-value pairs (parameter name, optim state dicts)
         """
+        param_store = pyro.get_param_store()
         state_dict = {}
-        for param in self.optim_objs:
-            param_name = pyro.get_param_store().param_name(param)
-            state_dict[param_name] = self.optim_objs[param].state_dict()
+        if not self.grouped:
+            for param in self.optim_objs:
+                param_name = param_store.param_name(param)
+                state_dict[param_name] = self.optim_objs[param].state_dict()
+            return state_dict
+
+        # split the state of each shared optimizer into the state dicts
+        # that an optimizer of a single param would have
+        for optim in self._grouped_optims.values():
+            optim_state = optim.state_dict()
+            for group, saved_group in zip(optim.param_groups, optim_state["param_groups"]):
+                param_name = param_store.param_name(group["params"][0])
+                packed_id = saved_group["params"][0]
+                state = {}
+                if packed_id in optim_state["state"]:
+                    state[packed_id] = optim_state["state"][packed_id]
+                state_dict[param_name] = {"state": state, "param_groups": [saved_group]}
         return state_dict
 
     def set_state(self, state_dict):
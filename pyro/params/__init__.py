@@ -1,14 +1,60 @@
 from __future__ import absolute_import, division, print_function
 
+import contextlib
+
+from pyro.shim import ContextVar
+
 from .param_store import ParamStoreDict
 
-# the global ParamStore
+# the global ParamStore, used in contexts that are not in a param_store_scope
 _PYRO_PARAM_STORE = ParamStoreDict()
 
+# the ParamStore of the current context (thread or asyncio task), if any
+_CONTEXT_PARAM_STORE = ContextVar("pyro_param_store", default=None)
+
 # used to create fully-formed param names, e.g. mymodule$$$mysubmodule.weight
 _MODULE_NAMESPACE_DIVIDER = "$$$"
 
 
+def get_current_param_store():
+    """
+    :returns: the param store of the current context if it is in a :func:`param_store_scope`,
+        else the global param store
+    :rtype: ParamStoreDict
+    """
+    param_store = _CONTEXT_PARAM_STORE.get()
+    return _PYRO_PARAM_STORE if param_store is None else param_store
+
+
+@contextlib.contextmanager
+def param_store_scope(param_store=None):
+    """
+    Context manager that makes a param store the param store of the current context, i.e. of the
+    current thread, or of the current asyncio task and the tasks it creates, within its block:
+    ``pyro.param``, ``pyro.get_param_store`` and ``pyro.clear_param_store`` use it instead of the
+    global param store. This allows independent inference or prediction jobs to run concurrently in
+    one process, e.g. in a thread pool::
+
+        def job(data):
+            with pyro.param_store_scope() as param_store:
+                svi = SVI(model, guide, optim, loss="ELBO")
+                for _ in range(num_steps):
+                    svi.step(data)
+                return param_store.get_state()
+
+    :param ParamStoreDict param_store: the param store to use; defaults to a new, empty one
+    :returns: a context manager yielding the param store
+    """
+    if param_store is None:
+        param_store = ParamStoreDict()
+    previous = _CONTEXT_PARAM_STORE.get()
+    _CONTEXT_PARAM_STORE.set(param_store)
+    try:
+        yield param_store
+    finally:
+        _CONTEXT_PARAM_STORE.set(previous)
+
+
 def param_with_module_name(pyro_name, param_name):
     return _MODULE_NAMESPACE_DIVIDER.join([pyro_name, param_name])
 
@@ -0,0 +1,319 @@
+from __future__ import absolute_import, division, print_function
+
+import json
+import numbers
+import os
+import struct
+
+import numpy as np
+import six
+import torch
+from torch.autograd import Variable
+
+MAGIC = b"PYROCKPT"
+VERSION = 1
+ALIGNMENT = 64  # bytes; payloads are aligned so that they can be mapped as arrays of any dtype
+_PREAMBLE = struct.Struct("<8sIQ")  # magic, version, header size
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _to_numpy(tensor):
+    if isinstance(tensor, Variable):
+        tensor = tensor.data
+    return tensor.cpu().contiguous().numpy()
+
+
+def _json_value(value, what):
+    if isinstance(value, (list, tuple)):
+        return [_json_value(v, what) for v in value]
+    if value is None or isinstance(value, (bool, numbers.Number) + six.string_types):
+        return value
+    raise ValueError("cannot save {} of type {} in a checkpoint".format(what, type(value).__name__))
+
+
+def _entry(payloads, array, reference=None):
+    """
+    Appends an array to the payloads and returns its header entry. Offsets are filled in later. If a
+    reference to the same data in another checkpoint is given, the entry points there instead.
+    """
+    if reference is not None:
+        return {key: reference[key] for key in ("dtype", "shape", "offset", "file")}
+    entry = {"dtype": array.dtype.name, "shape": list(array.shape)}
+    payloads.append((entry, array))
+    return entry
+
+
+def write_checkpoint(filename, params, optim_state=None, extra=None, references=None):
+    """
+    Writes parameters, and optionally the state of their optimizers, to a binary checkpoint file.
+
+    The file starts with a small JSON header that indexes the name, tags, dtype, shape and offset of every
+    tensor, followed by the raw tensor payloads, each aligned to 64 bytes. The payloads are written straight
+    from the tensors, so no serialized copy of the whole state is built in memory. The file is written
+    next to its destination and then renamed, so that a reader never sees a partially written checkpoint.
+
+    :param params: an iterable of ``(name, param, tags)`` triples
+    :param dict optim_state: optimizer state by param name, as returned by
+        :meth:`~pyro.optim.optim.PyroOptim.get_state`, or None
+    :param dict extra: JSON serializable metadata to store in the header, or None
+    :param dict references: header entries, as returned by :func:`header_entries`, of tensors that were
+        already written to other checkpoints in the same directory. These tensors are not written again;
+        their entries point to the other checkpoints instead.
+    :returns: the header of the checkpoint
+    :rtype: dict
+    """
+    references = {} if references is None else references
+    payloads = []
+    header = {"params": [], "optim": {}, "extra": extra if extra is not None else {}}
+    for name, param, tags in params:
+        entry = _entry(payloads, _to_numpy(param), references.get(("param", name)))
+        entry.update(name=name, tags=sorted(tags), requires_grad=bool(param.requires_grad))
+        header["params"].append(entry)
+    for name, state_dict in (optim_state or {}).items():
+        saved = {"param_groups": [], "state": {}}
+        for group in state_dict["param_groups"]:
+            saved["param_groups"].append({key: _json_value(value, "optimizer argument " + key)
+                                          for key, value in group.items()})
+        for packed_id, state in state_dict["state"].items():
+            saved_state = {}
+            for key, value in state.items():
+                if torch.is_tensor(value):
+                    reference = references.get(("optim", name, key))
+                    saved_state[key] = {"tensor": _entry(payloads, _to_numpy(value), reference)}
+                else:
+                    saved_state[key] = {"value": _json_value(value, "optimizer state " + key)}
+            saved["state"][str(packed_id)] = saved_state
+        header["optim"][name] = saved
+
+    # offsets are relative to the start of the payloads, so the header size does not depend on them
+    offset = 0
+    for entry, array in payloads:
+        entry["offset"] = offset
+        offset = _aligned(offset + array.nbytes)
+    header_bytes = json.dumps(header, sort_keys=True).encode("utf-8")
+
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        data_start = _aligned(f.tell())
+        for entry, array in payloads:
+            f.seek(data_start + entry["offset"])
+            array.tofile(f)
+        f.truncate(data_start + offset)
+    os.rename(tmp_filename, filename)
+    return header
+
+
+def header_entries(filename, header):
+    """
+    :param str filename: the file name of a checkpoint
+    :param dict header: the header of the checkpoint
+    :returns: the header entries of all the tensors of the checkpoint, by key, i.e. ``("param", name)``
+        for params and ``("optim", name, key)`` for the optimizer state of a param. Each entry names the
+        file its tensor is in, so that it can be passed as a reference to :func:`write_checkpoint`.
+    :rtype: dict
+    """
+    basename = os.path.basename(filename)
+    entries = {}
+
+    def add(key, entry):
+        entry = dict(entry)
+        entry.setdefault("file", basename)
+        entries[key] = entry
+
+    for entry in header["params"]:
+        add(("param", entry["name"]), entry)
+    for name, saved in header["optim"].items():
+        for saved_state in saved["state"].values():
+            for key, value in saved_state.items():
+                if "tensor" in value:
+                    add(("optim", name, key), value["tensor"])
+    return entries
+
+
+class Checkpoint(object):
+    """
+    Reads a checkpoint written by :func:`write_checkpoint`. Only the header is read when the checkpoint is
+    opened; tensors are read on demand, from the other checkpoints they refer to if need be. With
+    ``mmap=True`` the tensors are copy-on-write views of the memory mapped file, so that reading them does
+    not copy them and only the pages that are used are loaded from disk. Changes to these tensors are not
+    written back to the file.
+
+    :param str filename: the checkpoint file
+    :param bool mmap: whether to memory map the file rather than read the tensors into memory
+    """
+    def __init__(self, filename, mmap=True):
+        self.filename = filename
+        self.mmap = mmap
+        with open(filename, "rb") as f:
+            magic, version, header_size = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError("{} is not a pyro checkpoint".format(filename))
+            if version > VERSION:
+                raise ValueError("{} has an unsupported checkpoint version {}".format(filename, version))
+            self.header = json.loads(f.read(header_size).decode("utf-8"))
+            self._data_start = _aligned(_PREAMBLE.size + header_size)
+        self._params = {entry["name"]: entry for entry in self.header["params"]}
+        self._map = None
+        self._references = {}  # file name -> Checkpoint
+
+    def referenced_files(self):
+        """
+        :returns: the file names of the other checkpoints this checkpoint refers to
+        :rtype: set
+        """
+        files = set(entry["file"] for entry in header_entries(self.filename, self.header).values())
+        files.discard(os.path.basename(self.filename))
+        return files
+
+    @property
+    def extra(self):
+        """
+        The metadata stored with the checkpoint.
+        """
+        return self.header["extra"]
+
+    def param_names(self, names=None, tags=None):
+        """
+        :param names: names of params to select, or None
+        :param tags: a tag or an iterable of tags of params to select, or None
+        :returns: the names of the params in the checkpoint, in the order they were written, that are in
+            names or carry any of the tags. All the names are returned if both names and tags are None.
+        :rtype: list
+        """
+        if names is None and tags is None:
+            return [entry["name"] for entry in self.header["params"]]
+        names = set() if names is None else set(names)
+        tags = set() if tags is None else set([tags]) if isinstance(tags, six.string_types) else set(tags)
+        return [entry["name"] for entry in self.header["params"]
+                if entry["name"] in names or tags.intersection(entry["tags"])]
+
+    def param_tags(self, name):
+        """
+        :returns: the tags of a param in the checkpoint
+        :rtype: set
+        """
+        return set(self._params[name]["tags"])
+
+    def _read(self, entry):
+        if "file" in entry:
+            referenced = self._references.get(entry["file"])
+            if referenced is None:
+                filename = os.path.join(os.path.dirname(self.filename), entry["file"])
+                referenced = Checkpoint(filename, mmap=self.mmap)
+                self._references[entry["file"]] = referenced
+            return referenced._read({key: value for key, value in entry.items() if key != "file"})
+        dtype = np.dtype(str(entry["dtype"]))
+        shape = tuple(entry["shape"])
+        count = int(np.prod(shape))
+        offset = self._data_start + entry["offset"]
+        if self.mmap:
+            if self._map is None:
+                self._map = np.memmap(self.filename, dtype=np.uint8, mode="c")
+            array = self._map[offset:offset + count * dtype.itemsize].view(dtype)
+        else:
+            with open(self.filename, "rb") as f:
+                f.seek(offset)
+                array = np.fromfile(f, dtype=dtype, count=count)
+        return torch.from_numpy(array.reshape(shape))
+
+    def tensor(self, name):
+        """
+        :returns: the data of a param in the checkpoint
+        :rtype: torch.Tensor
+        """
+        return self._read(self._params[name])
+
+    def load_params(self, param_store, names=None, tags=None):
+        """
+        Loads params from the checkpoint into a param store, with their tags. Params of the param store
+        with the same names are replaced.
+
+        :param pyro.params.param_store.ParamStoreDict param_store: the param store to load into
+        :param names: names of params to load, or None
+        :param tags: a tag or an iterable of tags of params to load, or None
+        :returns: the names of the loaded params
+        :rtype: list
+        """
+        loaded_names = self.param_names(names, tags)
+        params = {}
+        for name in loaded_names:
+            entry = self._params[name]
+            params[str(name)] = Variable(self._read(entry), requires_grad=entry["requires_grad"])
+        param_store.set_state((params, {}))
+        for name in loaded_names:
+            tags = [str(tag) for tag in self._params[name]["tags"]]
+            if tags:
+                param_store.tag_params(str(name), tags)
+        return loaded_names
+
+    def optim_state(self, names=None, tags=None):
+        """
+        :param names: names of params whose optimizer state to read, or None
+        :param tags: a tag or an iterable of tags of params whose optimizer state to read, or None
+        :returns: the optimizer state by param name, as taken by
+            :meth:`~pyro.optim.optim.PyroOptim.set_state`
+        :rtype: dict
+        """
+        selected = set(self.param_names(names, tags))
+        state_dicts = {}
+        for name, saved in self.header["optim"].items():
+            if name not in selected and (names is not None or tags is not None):
+                continue
+            state = {}
+            for packed_id, saved_state in saved["state"].items():
+                state[int(packed_id)] = {key: self._read(value["tensor"]) if "tensor" in value else value["value"]
+                                         for key, value in saved_state.items()}
+            state_dicts[name] = {"state": state, "param_groups": saved["param_groups"]}
+        return state_dicts
+
+
+def save_checkpoint(filename, param_store=None, optim=None, extra=None):
+    """
+    Saves the params of a param store, with their tags, and optionally the state of an optimizer, to a
+    binary checkpoint file that can be loaded in part and memory mapped, see :func:`write_checkpoint`.
+
+    :param str filename: file name to save to
+    :param param_store: the param store to save; defaults to the global param store
+    :type param_store: pyro.params.param_store.ParamStoreDict
+    :param optim: the optimizer whose state to save, or None
+    :type optim: pyro.optim.optim.PyroOptim
+    :param dict extra: JSON serializable metadata to store in the header, or None
+    """
+    if param_store is None:
+        import pyro
+        param_store = pyro.get_param_store()
+    params = [(name, param, param_store.get_param_tags(name)) for name, param in param_store.named_parameters()]
+    optim_state = None if optim is None else optim.get_state()
+    write_checkpoint(filename, params, optim_state, extra)
+
+
+def load_checkpoint(filename, param_store=None, optim=None, names=None, tags=None, mmap=True):
+    """
+    Loads params, and optionally optimizer state, from a checkpoint saved with :func:`save_checkpoint`.
+    If names or tags are given, only the params with these names or any of these tags, and their
+    optimizer state, are loaded.
+
+    :param str filename: file name to load from
+    :param param_store: the param store to load into; defaults to the global param store
+    :type param_store: pyro.params.param_store.ParamStoreDict
+    :param optim: the optimizer to set the state of, or None
+    :type optim: pyro.optim.optim.PyroOptim
+    :param names: names of params to load, or None
+    :param tags: a tag or an iterable of tags of params to load, or None
+    :param bool mmap: whether to memory map the file rather than read the params into memory
+    :returns: the checkpoint
+    :rtype: Checkpoint
+    """
+    if param_store is None:
+        import pyro
+        param_store = pyro.get_param_store()
+    checkpoint = Checkpoint(filename, mmap=mmap)
+    checkpoint.load_params(param_store, names, tags)
+    if optim is not None:
+        optim.set_state(checkpoint.optim_state(names, tags))
+    return checkpoint
@@ -0,0 +1,245 @@
+from __future__ import absolute_import, division, print_function
+
+import copy
+import os
+import re
+import threading
+import time
+
+import torch
+from six.moves import queue
+from torch.autograd import Variable
+
+from pyro.params.checkpoint import Checkpoint, header_entries, write_checkpoint
+
+_FILENAME = "checkpoint_{:08d}.ckpt"
+_FILENAME_RE = re.compile(r"^checkpoint_(\d+)\.ckpt$")
+
+
+def _snapshot_optim_state(optim_state):
+    snapshot = {}
+    for name, state_dict in optim_state.items():
+        state = {packed_id: {key: value.clone() if torch.is_tensor(value) else copy.deepcopy(value)
+                             for key, value in param_state.items()}
+                 for packed_id, param_state in state_dict["state"].items()}
+        snapshot[name] = {"state": state, "param_groups": copy.deepcopy(state_dict["param_groups"])}
+    return snapshot
+
+
+def _snapshot_tensors(params, optim_state):
+    tensors = {}
+    for name, param, _ in params:
+        tensors["param", name] = param.data
+    for name, state_dict in optim_state.items():
+        for param_state in state_dict["state"].values():
+            for key, value in param_state.items():
+                if torch.is_tensor(value):
+                    tensors["optim", name, key] = value
+    return tensors
+
+
+class CheckpointManager(object):
+    """
+    Saves checkpoints of the param store, and optionally of the state of an optimizer, in the binary
+    format of :mod:`pyro.params.checkpoint`, without blocking training for the serialization.
+
+    :meth:`save` only takes a snapshot, i.e. an in-memory copy of the params and of the optimizer state,
+    and leaves the checkpoint to be written to disk by a background thread. Checkpoints are written to
+    ``directory/checkpoint_<step>.ckpt``. With ``incremental=True``, tensors that did not change since
+    the previous checkpoint are not written again, and the new checkpoint refers to the file they were
+    written to instead; this keeps a copy of the previous snapshot in memory.
+
+    After each checkpoint, the checkpoints in the directory that are neither among the last ``keep_last``
+    nor at a step that is a multiple of ``keep_every`` are deleted, unless a retained checkpoint refers
+    to them. The latest checkpoint is always retained. If both are None, all checkpoints are retained.
+
+    Example::
+
+        manager = CheckpointManager("checkpoints", optim=adam, keep_last=3, interval_seconds=300)
+        for step in range(num_steps):
+            svi.step(data)
+            manager.maybe_save(step)
+        manager.close()
+
+    :param str directory: the directory to write checkpoints to
+    :param param_store: the param store to save; defaults to the global param store
+    :type param_store: pyro.params.param_store.ParamStoreDict
+    :param optim: the optimizer whose state to save, or None
+    :type optim: pyro.optim.optim.PyroOptim
+    :param int keep_last: the number of most recent checkpoints to retain, or None
+    :param int keep_every: retain the checkpoints of steps that are multiples of this, or None
+    :param bool incremental: whether to only write the tensors that changed since the last checkpoint
+    :param int interval_steps: the minimum number of steps between checkpoints saved by :meth:`maybe_save`
+    :param float interval_seconds: the minimum time between checkpoints saved by :meth:`maybe_save`
+    :param int max_pending: the number of snapshots that may wait to be written; :meth:`save` blocks
+        while there are more
+    """
+    def __init__(self, directory, param_store=None, optim=None, keep_last=None, keep_every=None,
+                 incremental=True, interval_steps=None, interval_seconds=None, max_pending=1):
+        if param_store is None:
+            import pyro
+            param_store = pyro.get_param_store()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.param_store = param_store
+        self.optim = optim
+        self.keep_last = keep_last
+        self.keep_every = keep_every
+        self.incremental = incremental
+        self.interval_steps = interval_steps
+        self.interval_seconds = interval_seconds
+        self._last_save = None  # (step, time) of the last call to save()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._error = None
+        self._lock = threading.Lock()
+        # the checkpoints in the directory, from step to the files they refer to
+        self._checkpoints = {}
+        for filename in os.listdir(directory):
+            match = _FILENAME_RE.match(filename)
+            if match is not None:
+                checkpoint = Checkpoint(os.path.join(directory, filename))
+                self._checkpoints[int(match.group(1))] = checkpoint.referenced_files()
+        # the previous snapshot and the header entries it was written to, for incremental writes
+        self._last_tensors = {}
+        self._last_entries = {}
+
+    def filename(self, step):
+        """
+        :returns: the file name of the checkpoint of a step
+        :rtype: str
+        """
+        return os.path.join(self.directory, _FILENAME.format(step))
+
+    def steps(self):
+        """
+        :returns: the steps of the checkpoints that have been written and not deleted, in increasing order
+        :rtype: list
+        """
+        with self._lock:
+            return sorted(self._checkpoints)
+
+    def latest(self):
+        """
+        :returns: the file name of the latest checkpoint that has been written, or None
+        :rtype: str
+        """
+        steps = self.steps()
+        return self.filename(steps[-1]) if steps else None
+
+    def save(self, step, extra=None):
+        """
+        Takes a snapshot of the params and optimizer state, to be written as the checkpoint of a step in
+        the background.
+
+        :param int step: the step of the checkpoint
+        :param dict extra: JSON serializable metadata to store with the checkpoint, or None
+        """
+        self._raise_error()
+        params = [(name, Variable(param.data.clone(), requires_grad=param.requires_grad),
+                   self.param_store.get_param_tags(name))
+                  for name, param in self.param_store.named_parameters()]
+        optim_state = {} if self.optim is None else _snapshot_optim_state(self.optim.get_state())
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+        self._last_save = step, time.time()
+        self._queue.put((step, params, optim_state, extra))
+
+    def maybe_save(self, step, extra=None):
+        """
+        Calls :meth:`save` if this is the first call, or if ``interval_steps`` steps or
+        ``interval_seconds`` seconds passed since the last checkpoint.
+
+        :param int step: the current step
+        :param dict extra: JSON serializable metadata to store with the checkpoint, or None
+        :returns: whether a checkpoint was saved
+        :rtype: bool
+        """
+        if self._last_save is not None:
+            last_step, last_time = self._last_save
+            due_steps = self.interval_steps is not None and step - last_step >= self.interval_steps
+            due_seconds = self.interval_seconds is not None and time.time() - last_time >= self.interval_seconds
+            if not (due_steps or due_seconds):
+                return False
+        self.save(step, extra)
+        return True
+
+    def wait(self):
+        """
+        Waits until all the snapshots have been written. Errors of the background thread are raised here,
+        or by the next call to :meth:`save`.
+        """
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """
+        Waits until all the snapshots have been written and stops the background thread.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self._raise_error()
+
+    def _raise_error(self):
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _write(self, step, params, optim_state, extra):
+        filename = self.filename(step)
+        tensors = _snapshot_tensors(params, optim_state)
+        references = {}
+        if self.incremental:
+            for key, tensor in tensors.items():
+                last = self._last_tensors.get(key)
+                if last is not None and last.type() == tensor.type() and last.size() == tensor.size() and \
+                        last.equal(tensor):
+                    references[key] = self._last_entries[key]
+        header = write_checkpoint(filename, params, optim_state, extra, references)
+        entries = header_entries(filename, header)
+        if self.incremental:
+            self._last_tensors = tensors
+            self._last_entries = entries
+        referenced_files = set(entry["file"] for entry in entries.values())
+        referenced_files.discard(os.path.basename(filename))
+        with self._lock:
+            self._checkpoints[step] = referenced_files
+        self._apply_retention()
+
+    def _apply_retention(self):
+        with self._lock:
+            steps = sorted(self._checkpoints)
+            if self.keep_last is None and self.keep_every is None:
+                return
+            retained = set(steps[-1:])
+            if self.keep_last is not None:
+                retained.update(steps[max(0, len(steps) - self.keep_last):])
+            if self.keep_every is not None:
+                retained.update(step for step in steps if step % self.keep_every == 0)
+            # the latest checkpoint is retained, so the files the next one may refer to are kept
+            referenced = set()
+            for step in retained:
+                referenced.update(self._checkpoints[step])
+            deleted = [step for step in steps
+                       if step not in retained and os.path.basename(self.filename(step)) not in referenced]
+            for step in deleted:
+                del self._checkpoints[step]
+        for step in deleted:
+            os.remove(self.filename(step))
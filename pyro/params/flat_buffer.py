@@ -0,0 +1,115 @@
+from __future__ import absolute_import, division, print_function
+
+from pyro.shim import grad_variable
+
+
+def flat_buffer_key(param):
+    """
+    :returns: the key of the flat buffer that can hold a param, i.e. its
+        tensor type and its device
+    """
+    data = param.data
+    return data.type(), data.get_device() if data.is_cuda else -1
+
+
+class FlatParamBuffer(object):
+    """
+    Contiguous storage for the data and the gradients of parameters of the
+    same tensor type and device. The ``.data`` and ``.grad`` of each
+    parameter in the buffer are views into :attr:`data` and :attr:`grad`, so
+    that all the parameters can be copied, zeroed or reduced with a single
+    operation on the buffer.
+
+    Parameters are laid out in the order they were added. The storage grows
+    geometrically as parameters are added. The space of removed parameters is
+    reclaimed when a parameter is added that does not fit, by moving the
+    remaining parameters to the front of the storage before growing it, so
+    that replacing parameters, e.g. by ``set_state``, does not grow the
+    storage. When it is reallocated, the views of all parameters are updated
+    in place, so the parameter objects stay the same.
+
+    :param torch.Tensor template: a tensor of the type and device of the buffer
+    """
+    def __init__(self, template):
+        self.data = template.new(0)
+        self.grad = template.new(0)
+        self.numel = 0  # number of elements in use
+        self.params = []
+        self._slices = {}  # param -> (offset, numel, size)
+
+    def __contains__(self, param):
+        return param in self._slices
+
+    def __len__(self):
+        return len(self.params)
+
+    def _view(self, flat, param):
+        offset, numel, size = self._slices[param]
+        return flat.narrow(0, offset, numel).view(size)
+
+    def _attach(self, param):
+        param.data = self._view(self.data, param)
+        param.grad = grad_variable(self._view(self.grad, param))
+
+    def _relayout(self, capacity):
+        # moves the params that are in use to the front of new storage, dropping the space of removed ones
+        data = self.data.new(capacity).zero_()
+        grad = self.grad.new(capacity).zero_()
+        offset = 0
+        for param in self.params:
+            old_offset, numel, size = self._slices[param]
+            data.narrow(0, offset, numel).copy_(self.data.narrow(0, old_offset, numel))
+            grad.narrow(0, offset, numel).copy_(self.grad.narrow(0, old_offset, numel))
+            self._slices[param] = (offset, numel, size)
+            offset += numel
+        self.data, self.grad = data, grad
+        self.numel = offset
+        for param in self.params:
+            self._attach(param)
+
+    def add(self, param):
+        """
+        Moves the data and the gradient (if any) of a parameter into the buffer.
+
+        :param torch.autograd.Variable param: a parameter of the type and
+            device of the buffer
+        """
+        numel = param.data.numel()
+        if self.numel + numel > self.data.numel():
+            # reclaim the space of removed params before growing
+            live = sum(self._slices[p][1] for p in self.params)
+            capacity = self.data.numel()
+            self._relayout(capacity if live + numel <= capacity else max(live + numel, 2 * capacity))
+        self._slices[param] = (self.numel, numel, param.data.size())
+        self.numel += numel
+        self.params.append(param)
+        self._view(self.data, param).copy_(param.data)
+        if param.grad is not None:
+            self._view(self.grad, param).copy_(param.grad.data)
+        self._attach(param)
+
+    def remove(self, param):
+        """
+        Moves a parameter out of the buffer, into storage of its own. Its
+        space in the buffer is reclaimed by the next :meth:`add` that needs it.
+
+        :param torch.autograd.Variable param: a parameter in the buffer
+        """
+        data = self._view(self.data, param).clone()
+        grad = self._view(self.grad, param).clone()
+        del self._slices[param]
+        self.params = [p for p in self.params if p is not param]
+        param.data = data
+        param.grad = grad_variable(grad)
+
+    def zero_grad(self):
+        """
+        Zeros the gradients of all parameters in the buffer with a single fill.
+        The gradients of parameters that were replaced, e.g. by
+        :func:`pyro.util.zero_grads`, are set back to views into the buffer.
+        """
+        self.grad.zero_()
+        for param in self.params:
+            grad = param.grad
+            if grad is None or grad.data.data_ptr() != self._view(self.grad, param).data_ptr():
+                param.grad = grad_variable(self._view(self.grad, param))
@@ -1,8 +1,12 @@
 from __future__ import absolute_import, division, print_function
 
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 
 import cloudpickle
+from torch.autograd import Variable
+from torch.nn import Parameter
+
+from pyro.params.flat_buffer import FlatParamBuffer, flat_buffer_key
 
 
 class ParamStoreDict(object):
@@ -30,6 +34,8 @@ class ParamStoreDict(object):
       learning rates for different tags. for an example where this is useful see the tutorial
       `SVI Part III <http://pyro.ai/examples/svi_part_iii.html>`_.
     - parameters can be saved and loaded from disk using `save` and `load`.
+    - optionally, see `set_flat_buffers`, the data and gradients of all parameters can be kept in one
+      contiguous buffer per tensor type and device, so that they can be copied, zeroed or reduced in bulk.
     """
 
     def __init__(self):
@@ -41,6 +47,8 @@ class ParamStoreDict(object):
         self._active_params = set()  # set of all currently active params
         self._param_tags = defaultdict(lambda: set())  # dictionary from tag to param names
         self._tag_params = defaultdict(lambda: set())  # dictionary from param name to tags
+        self._flat_buffers = None  # dictionary from (tensor type, device) to FlatParamBuffer, if enabled
+        self._epoch_permutations = {}  # dictionary from subsample site name to the epoch state of its iarange
 
     def clear(self):
         """
@@ -51,6 +59,97 @@ class ParamStoreDict(object):
         self._active_params = set()
         self._param_tags = defaultdict(lambda: set())
         self._tag_params = defaultdict(lambda: set())
+        self._epoch_permutations = {}
+        if self._flat_buffers is not None:
+            self._flat_buffers = OrderedDict()
+
+    def set_flat_buffers(self, enabled=True):
+        """
+        Enables or disables the flat buffer layout. When enabled, the ``.data`` and ``.grad`` of every
+        parameter are views into one contiguous :class:`~pyro.params.flat_buffer.FlatParamBuffer` per
+        tensor type and device. Existing parameters are moved into the buffers, and new parameters are
+        added to them as they are registered; the parameter objects themselves do not change. When
+        disabled, each parameter is moved back into storage of its own.
+
+        :param bool enabled: whether to use flat buffers
+        """
+        if enabled and self._flat_buffers is None:
+            self._flat_buffers = OrderedDict()
+            for param in self._params.values():
+                self._add_to_flat_buffer(param)
+        elif not enabled and self._flat_buffers is not None:
+            for buffer in self._flat_buffers.values():
+                for param in list(buffer.params):
+                    buffer.remove(param)
+            self._flat_buffers = None
+
+    def get_flat_buffers(self):
+        """
+        :returns: the flat buffers holding the parameters, in order of creation, or an empty list if
+            flat buffers are disabled
+        :rtype: list of :class:`~pyro.params.flat_buffer.FlatParamBuffer`
+        """
+        if self._flat_buffers is None:
+            return []
+        return list(self._flat_buffers.values())
+
+    def _add_to_flat_buffer(self, param):
+        key = flat_buffer_key(param)
+        if key not in self._flat_buffers:
+            self._flat_buffers[key] = FlatParamBuffer(param.data)
+        self._flat_buffers[key].add(param)
+
+    def _remove_from_flat_buffer(self, param):
+        for buffer in self._flat_buffers.values():
+            if param in buffer:
+                buffer.remove(param)
+                return
+
+    def share_memory(self):
+        """
+        Moves the data of all the parameters to shared memory, so that processes forked afterwards, e.g.
+        the workers of :class:`~pyro.infer.hogwild.HogwildSVI`, read and update the same parameters in
+        place. Gradients are not shared. With flat buffers, the data of each buffer is moved as a whole.
+        Parameters registered afterwards are not shared.
+        """
+        if self._flat_buffers is not None:
+            for buffer in self._flat_buffers.values():
+                buffer.data.share_memory_()
+        for param in self._params.values():
+            param.data.share_memory_()
+
+    def is_shared(self):
+        """
+        :returns: whether the data of all the parameters are in shared memory
+        :rtype: bool
+        """
+        return all(param.data.is_shared() for param in self._params.values())
+
+    def zero_grads(self, params):
+        """
+        Sets the gradients of params to zero in place, like `pyro.util.zero_grads`. With flat buffers, each
+        buffer holding any of the params is zeroed with a single fill, which also zeros the gradients of the
+        other params in that buffer.
+
+        :param params: iterable of params
+        """
+        from pyro.util import zero_grads
+
+        if self._flat_buffers is None:
+            zero_grads(params)
+            return
+        others = []
+        buffers = set()
+        for param in params:
+            for key, buffer in self._flat_buffers.items():
+                if param in buffer:
+                    buffers.add(key)
+                    break
+            else:
+                others.append(param)
+        for key in buffers:
+            self._flat_buffers[key].zero_grad()
+        zero_grads(others)
 
     def named_parameters(self):
         """
@@ -200,6 +299,9 @@ class ParamStoreDict(object):
         self._params[param_name] = new_param
         self._param_to_name[new_param] = param_name
         self._param_to_name.pop(old_param)
+        if self._flat_buffers is not None:
+            self._remove_from_flat_buffer(old_param)
+            self._add_to_flat_buffer(new_param)
 
     def get_param(self, name, init_tensor=None, tags="default"):
         """
@@ -231,6 +333,9 @@ class ParamStoreDict(object):
             # keep track of each tensor and it's name
             self._param_to_name[self._params[name]] = name
 
+            if self._flat_buffers is not None:
+                self._add_to_flat_buffer(self._params[name])
+
             # keep track of param tags
             self.tag_params(name, tags)
 
@@ -249,12 +354,36 @@ class ParamStoreDict(object):
 
         return self._param_to_name[p]
 
+    def get_epoch_permutation(self, site_name, size):
+        """
+        Gets the epoch state of an ``iarange`` with ``subsample_mode="epoch"``, i.e. the permutation of
+        ``range(size)`` that its subsamples are drawn from, creating it if the subsample site has none
+        yet or the size of the range changed. The epoch state is reset by :meth:`clear`, but it is not
+        part of :meth:`get_state`, so it is not saved by :meth:`save`: a restored param store starts new
+        epochs.
+
+        :param str site_name: the name of the subsample site of the ``iarange``
+        :param int size: the size of the range
+        :returns: the epoch state, whose ``next_chunk(subsample_size)`` method returns the next subsample
+        """
+        from pyro import _EpochPermutation
+        permutation = self._epoch_permutations.get(site_name)
+        if permutation is None or permutation.size != size:
+            permutation = _EpochPermutation(size)
+            self._epoch_permutations[site_name] = permutation
+        return permutation
+
     def get_state(self):
         """
-        Get the ParamStore state.
+        Get the ParamStore state. The epoch state of iaranges is not included, see
+        :meth:`get_epoch_permutation`.
         """
         param_tags = {k: list(tags) for k, tags in self._param_tags.items()}
-        state = (self._params, param_tags)
+        params = self._params
+        if self._flat_buffers is not None:
+            # views would be saved together with the whole buffer
+            params = {name: _clone_param(param) for name, param in params.items()}
+        state = (params, param_tags)
         return state
 
     def set_state(self, state):
@@ -265,6 +394,13 @@ class ParamStoreDict(object):
         loaded_params, loaded_param_tags = state
 
         for param_name, param in loaded_params.items():
+            old_param = self._params.get(param_name)
+            if old_param is not None and old_param is not param:
+                self._param_to_name.pop(old_param, None)
+            if self._flat_buffers is not None:
+                if old_param is not None:
+                    self._remove_from_flat_buffer(old_param)
+                self._add_to_flat_buffer(param)
             self._params[param_name] = param
             self._param_to_name[param] = param_name
 
@@ -292,3 +428,8 @@ class ParamStoreDict(object):
         with open(filename, "rb") as input_file:
             state = cloudpickle.loads(input_file.read())
         self.set_state(state)
+
+
+def _clone_param(param):
+    cls = Parameter if isinstance(param, Parameter) else Variable
+    return cls(param.data.clone(), requires_grad=param.requires_grad)
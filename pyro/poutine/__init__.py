@@ -7,14 +7,17 @@ from pyro.poutine import util
 # poutines
 from .block_poutine import BlockPoutine
 from .condition_poutine import ConditionPoutine
+from .enumerate_poutine import EnumeratePoutine
 from .escape_poutine import EscapePoutine
 from .indep_poutine import IndepMessenger  # noqa: F401
 from .infer_config_poutine import InferConfigPoutine
 from .lift_poutine import LiftPoutine
 from .poutine import _PYRO_STACK, Poutine  # noqa: F401
+from .prefix_poutine import PrefixPoutine
 from .replay_poutine import ReplayPoutine
 from .scale_poutine import ScaleMessenger
 from .trace import Trace  # noqa: F401
+from .trace_prefix import TracePrefix
 from .trace_poutine import TracePoutine
 
 ############################################
@@ -124,6 +127,25 @@ def condition(fn, data):
     return ConditionPoutine(fn, data=data)
 
 
+def enum(fn, first_available_dim):
+    """
+    :param fn: a stochastic function (callable containing pyro primitive calls)
+    :param int first_available_dim: the first dimension to enumerate along,
+        counted from the right of the batch dimensions, e.g. ``-2`` if the
+        sites have at most one batch dimension
+    :returns: stochastic function wrapped in an EnumeratePoutine
+    :rtype: pyro.poutine.EnumeratePoutine
+
+    Alias for EnumeratePoutine constructor.
+
+    Given a stochastic function with discrete sample statements, set the value
+    of each of them to the whole support of its distribution, along a fresh
+    tensor dimension, so that all the discrete choices are enumerated in a
+    single run of the function.
+    """
+    return EnumeratePoutine(fn, first_available_dim)
+
+
 def infer_config(fn, config_fn):
     """
     :param fn: a stochastic function (callable containing pyro primitive calls)
@@ -191,7 +213,8 @@ def queue(fn, queue, max_tries=None,
           extend_fn=None, escape_fn=None, num_samples=None):
     """
     :param fn: a stochastic function (callable containing pyro primitive calls)
-    :param queue: a queue data structure like multiprocessing.Queue to hold partial traces
+    :param queue: a queue data structure like multiprocessing.Queue to hold partial traces,
+        i.e. :class:`~pyro.poutine.Trace` or :class:`~pyro.poutine.TracePrefix` objects
     :param max_tries: maximum number of attempts to compute a single complete trace
     :param extend_fn: function (possibly stochastic) that takes a partial trace and a site
     and returns a list of extended traces
@@ -202,6 +225,11 @@ def queue(fn, queue, max_tries=None,
 
     Given a stochastic function and a queue,
     return a return value from a complete trace in the queue
+
+    A partial :class:`~pyro.poutine.Trace` is replayed, and copied for each of
+    its extensions. A partial :class:`~pyro.poutine.TracePrefix` is resumed by
+    a :class:`~pyro.poutine.PrefixPoutine` instead, which continues the
+    execution with one of its extensions and shares the prefix between them.
     """
 
     if max_tries is None:
@@ -223,6 +251,12 @@ def queue(fn, queue, max_tries=None,
                 "trying to get() from an empty queue will deadlock"
 
             next_trace = queue.get()
+            if isinstance(next_trace, TracePrefix):
+                try:
+                    return PrefixPoutine(fn, next_trace, queue, escape_fn, extend_fn, num_samples)(*args, **kwargs)
+                except util.NonlocalExit as site_container:
+                    site_container.reset_stack()
+                    continue
             try:
                 ftr = trace(escape(replay(fn, next_trace),
                                    functools.partial(escape_fn, next_trace)))
@@ -21,9 +21,9 @@ class BlockMessenger(Messenger):
         Default behavior: block everything (hide_all == True)
 
         A site is hidden if at least one of the following holds:
-        1. msg["name"] in hide
-        2. msg["type"] in hide_types
-        3. msg["name"] not in expose and msg["type"] not in expose_types
+        1. msg.name in hide
+        2. msg.type in hide_types
+        3. msg.name not in expose and msg.type not in expose_types
         4. hide_all == True and hide, hide_types, and expose_types are all None
         """
         super(BlockMessenger, self).__init__()
@@ -74,22 +74,22 @@ class BlockMessenger(Messenger):
         :returns: boolean decision to hide or expose site.
 
         A site is hidden if at least one of the following holds:
-        1. msg["name"] in self.hide
-        2. msg["type"] in self.hide_types
-        3. msg["name"] not in self.expose and msg["type"] not in self.expose_types
+        1. msg.name in self.hide
+        2. msg.type in self.hide_types
+        3. msg.name not in self.expose and msg.type not in self.expose_types
         4. self.hide_all == True and hide, hide_types, and expose_types are all None
         """
         # handle observes
-        if msg["type"] == "sample" and msg["is_observed"]:
+        if msg.type == "sample" and msg.is_observed:
             msg_type = "observe"
         else:
-            msg_type = msg["type"]
+            msg_type = msg.type
 
-        is_not_exposed = (msg["name"] not in self.expose) and \
+        is_not_exposed = (msg.name not in self.expose) and \
                          (msg_type not in self.expose_types)
 
         # decision rule for hiding:
-        if (msg["name"] in self.hide) or \
+        if (msg.name in self.hide) or \
            (msg_type in self.hide_types) or \
            (is_not_exposed and self.hide_all):  # noqa: E129
 
@@ -99,7 +99,7 @@ class BlockMessenger(Messenger):
             return False
 
     def _process_message(self, msg):
-        msg["stop"] = self._block_up(msg)
+        msg.stop = self._block_up(msg)
         return None
 
 
@@ -146,9 +146,9 @@ class BlockPoutine(Poutine):
         Default behavior: block everything (hide_all == True)
 
         A site is hidden if at least one of the following holds:
-        1. msg["name"] in hide
-        2. msg["type"] in hide_types
-        3. msg["name"] not in expose and msg["type"] not in expose_types
+        1. msg.name in hide
+        2. msg.type in hide_types
+        3. msg.name not in expose and msg.type not in expose_types
         4. hide_all == True
         """
         msngr = BlockMessenger(hide_all, expose_all, hide, expose, hide_types, expose_types)
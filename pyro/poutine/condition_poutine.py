@@ -23,23 +23,23 @@ class ConditionMessenger(Messenger):
         :param msg: current message at a trace site.
         :returns: a sample from the stochastic function at the site.
 
-        If msg["name"] appears in self.data,
+        If msg.name appears in self.data,
         convert the sample site into an observe site
-        whose observed value is the value from self.data[msg["name"]].
+        whose observed value is the value from self.data[msg.name].
 
         Otherwise, implements default sampling behavior
         with no additional effects.
         """
-        name = msg["name"]
+        name = msg.name
 
         if name in self.data:
-            assert not msg["is_observed"], \
+            assert not msg.is_observed, \
                 "should not change values of existing observes"
             if isinstance(self.data, Trace):
-                msg["value"] = self.data.nodes[name]["value"]
+                msg.value = self.data.nodes[name]["value"]
             else:
-                msg["value"] = self.data[name]
-            msg["is_observed"] = True
+                msg.value = self.data[name]
+            msg.is_observed = True
         return None
 
     def _pyro_param(self, msg):
@@ -0,0 +1,77 @@
+from __future__ import absolute_import, division, print_function
+
+from .poutine import Messenger, Poutine
+
+
+class EnumerateMessenger(Messenger):
+    """
+    Enumerates in parallel the values of the discrete sample sites, i.e. of
+    the unobserved sample sites whose distribution is ``enumerable``.
+
+    The value of such a site is the whole support of its distribution, from
+    ``enumerate_support()``, along a fresh tensor dimension to the left of the
+    batch dimensions of all sites. The first enumerated site uses dimension
+    ``first_available_dim``, the next one the dimension to its left, and so
+    on, so that values that depend on several enumerated sites broadcast to
+    the joint enumeration. The dimension of each site is recorded as
+    ``site["infer"]["_enum_dim"]``. Downstream code must broadcast against
+    these extra dimensions, e.g. index tensors with ``[..., i]``.
+
+    :param int first_available_dim: the first dimension to enumerate along,
+        counted from the right of the batch dimensions. It must be to the left
+        of the batch dimensions of all sites, e.g. ``-2`` if the sites have at
+        most one batch dimension.
+    """
+    def __init__(self, first_available_dim):
+        super(EnumerateMessenger, self).__init__()
+        if first_available_dim >= 0:
+            raise ValueError("first_available_dim must be negative, got {}".format(first_available_dim))
+        self.first_available_dim = first_available_dim
+        self.next_available_dim = first_available_dim
+
+    def __enter__(self):
+        self.next_available_dim = self.first_available_dim
+        return super(EnumerateMessenger, self).__enter__()
+
+    def _reset(self):
+        self.next_available_dim = self.first_available_dim
+
+    def _pyro_sample(self, msg):
+        """
+        :param msg: current message at a trace site.
+
+        Sets the value of an enumerable site that does not have a value yet
+        to the support of its distribution, along the next available dimension.
+        """
+        if msg.is_observed or msg.done or msg.value is not None or \
+                not getattr(msg.fn, "enumerable", False):
+            return None
+        support = msg.fn.enumerate_support()
+        num_batch_dims = support.dim() - 1 - len(getattr(msg.fn, "event_shape", ()))
+        max_batch_dims = -self.first_available_dim - 1
+        # batch dimensions to the left of the available dims come from upstream
+        # enumerated sites, along which the support does not change
+        while num_batch_dims > max_batch_dims:
+            support = support[:, 0]
+            num_batch_dims -= 1
+        dim = self.next_available_dim
+        self.next_available_dim -= 1
+        shape = support.size()
+        support = support.contiguous().view(shape[:1] + (1,) * (-dim - 1 - num_batch_dims) + shape[1:])
+        msg.value = support
+        msg.done = True
+        msg.infer = dict(msg.infer, _enum_dim=dim)
+        return None
+
+
+class EnumeratePoutine(Poutine):
+    """
+    Poutine for enumerating the discrete sample sites of a stochastic function
+    in parallel, see :class:`EnumerateMessenger`.
+    """
+    def __init__(self, fn, first_available_dim):
+        """
+        :param fn: a stochastic function (callable containing pyro primitive calls)
+        :param int first_available_dim: the first dimension to enumerate along
+        """
+        super(EnumeratePoutine, self).__init__(EnumerateMessenger(first_available_dim), fn)
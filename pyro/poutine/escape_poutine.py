@@ -30,12 +30,12 @@ class EscapeMessenger(Messenger):
         Else, implements default _pyro_sample behavior with no additional effects.
         """
         if self.escape_fn(msg):
-            msg["done"] = True
-            msg["stop"] = True
+            msg.done = True
+            msg.stop = True
 
             def cont(m):
                 raise NonlocalExit(m)
-            msg["continuation"] = cont
+            msg.continuation = cont
         return None
 
 
@@ -22,12 +22,12 @@ class InferConfigMessenger(Messenger):
         :param msg: current message at a trace site.
 
         If self.config_fn is not None, calls self.config_fn on msg
-        and stores the result in msg["infer"].
+        and stores the result in msg.infer.
 
         Otherwise, implements default sampling behavior
         with no additional effects.
         """
-        msg["infer"].update(self.config_fn(msg))
+        msg.infer.update(self.config_fn(msg))
         return None
 
     def _pyro_param(self, msg):
@@ -35,12 +35,12 @@ class InferConfigMessenger(Messenger):
         :param msg: current message at a trace site.
 
         If self.config_fn is not None, calls self.config_fn on msg
-        and stores the result in msg["infer"].
+        and stores the result in msg.infer.
 
         Otherwise, implements default param behavior
         with no additional effects.
         """
-        msg["infer"].update(self.config_fn(msg))
+        msg.infer.update(self.config_fn(msg))
         return None
 
 
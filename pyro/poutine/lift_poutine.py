@@ -37,34 +37,34 @@ class LiftMessenger(Messenger):
         on the param names. If the param name does not match the
         name the keys in the prior, that param name is unchanged.
         """
-        name = msg["name"]
+        name = msg.name
         param_name = params.user_param_name(name)
         if isinstance(self.prior, dict):
             # prior is a dict of distributions
             if param_name in self.prior.keys():
-                msg["fn"] = self.prior[param_name]
-                if isinstance(msg['fn'], Distribution):
-                    msg["args"] = ()
-                    msg["kwargs"] = {}
-                    msg["infer"] = {}
+                msg.fn = self.prior[param_name]
+                if isinstance(msg.fn, Distribution):
+                    msg.args = ()
+                    msg.kwargs = {}
+                    msg.infer = {}
             else:
                 return None
         elif isinstance(self.prior, Distribution):
             # prior is a distribution
-            msg["fn"] = self.prior
-            msg["args"] = ()
-            msg["kwargs"] = {}
-            msg["infer"] = {}
+            msg.fn = self.prior
+            msg.args = ()
+            msg.kwargs = {}
+            msg.infer = {}
         elif callable(self.prior):
             if not isinstance(self.prior, Distribution):
                 # prior is a stochastic fn. block sample
-                msg["stop"] = True
-            msg["fn"] = self.prior
+                msg.stop = True
+            msg.fn = self.prior
         else:
             # otherwise leave as is
             return None
-        msg["type"] = "sample"
-        msg["is_observed"] = False
+        msg.type = "sample"
+        msg.is_observed = False
         return self._pyro_sample(msg)
 
 
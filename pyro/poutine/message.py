@@ -0,0 +1,178 @@
+from __future__ import absolute_import, division, print_function
+
+_REQUIRED_FIELDS = ("type", "name", "fn", "is_observed", "args", "kwargs", "value", "infer", "scale",
+                    "cond_indep_stack", "done", "stop", "continuation")
+# memoized by pyro.poutine.Trace; a value of None means the field is unset
+_OPTIONAL_FIELDS = ("log_pdf", "batch_log_pdf", "score_parts")
+_FIELDS = _REQUIRED_FIELDS + _OPTIONAL_FIELDS
+_FIELD_SET = frozenset(_FIELDS)
+_OPTIONAL_FIELD_SET = frozenset(_OPTIONAL_FIELDS)
+
+
+class Message(object):
+    """
+    Record of a single pyro primitive site, passed up and down the poutine
+    stack by :func:`pyro.util.apply_stack` and stored as a site of a
+    :class:`~pyro.poutine.Trace`.
+
+    The standard fields are stored in slots, so that allocating a message per
+    site is cheap and the poutine machinery can use attribute access
+    (``msg.value``). For backwards compatibility a message also behaves like a
+    ``dict``: ``msg["value"]``, ``"log_pdf" in msg``, ``msg.get(...)``,
+    ``msg.update(...)`` etc. all work, unset fields raise ``KeyError``,
+    and keys that are not standard fields are kept in a side dictionary.
+    """
+    __slots__ = _FIELDS + ("_extra",)
+
+    def __init__(self, type, name, fn=None, is_observed=False, args=(), kwargs=None, value=None,
+                 infer=None, scale=1.0, cond_indep_stack=None, done=False, stop=False,
+                 continuation=None, **extra):
+        """
+        :param str type: site type, e.g. "sample" or "param"
+        :param name: site name
+
+        Any further keyword arguments that are not standard fields
+        are stored as extra keys.
+        """
+        self.type = type
+        self.name = name
+        self.fn = fn
+        self.is_observed = is_observed
+        self.args = args
+        self.kwargs = {} if kwargs is None else kwargs
+        self.value = value
+        self.infer = {} if infer is None else infer
+        self.scale = scale
+        self.cond_indep_stack = [] if cond_indep_stack is None else cond_indep_stack
+        self.done = done
+        self.stop = stop
+        self.continuation = continuation
+        self.log_pdf = None
+        self.batch_log_pdf = None
+        self.score_parts = None
+        self._extra = None
+        if extra:
+            self.update(extra)
+
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            value = getattr(self, key)
+            if value is None and key in _OPTIONAL_FIELD_SET:
+                raise KeyError(key)
+            return value
+        try:
+            return self._extra[key]
+        except TypeError:
+            # no extra keys at all
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in _FIELD_SET:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in _REQUIRED_FIELDS:
+            raise KeyError("cannot delete required message field {}".format(key))
+        if key in _OPTIONAL_FIELD_SET:
+            if getattr(self, key) is None:
+                raise KeyError(key)
+            setattr(self, key, None)
+            return
+        try:
+            del self._extra[key]
+        except TypeError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in _OPTIONAL_FIELD_SET:
+            return getattr(self, key) is not None
+        if key in _FIELD_SET:
+            return True
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self):
+        for key in _REQUIRED_FIELDS:
+            yield key
+        for key in _OPTIONAL_FIELDS:
+            if getattr(self, key) is not None:
+                yield key
+        if self._extra is not None:
+            for key in self._extra:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __eq__(self, other):
+        if not isinstance(other, (Message, dict)):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "Message({})".format(", ".join("{}={!r}".format(k, v) for k, v in self.items()))
+
+    def __getstate__(self):
+        return dict(self.items())
+
+    def __setstate__(self, state):
+        self.log_pdf = None
+        self.batch_log_pdf = None
+        self.score_parts = None
+        self._extra = None
+        self.update(state)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def pop(self, key, *default):
+        try:
+            value = self[key]
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        del self[key]
+        return value
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def copy(self):
+        """
+        :returns: a shallow copy of this message
+        :rtype: Message
+
+        Field values are shared, as with ``dict.copy``.
+        """
+        msg = Message(self.type, self.name, self.fn, self.is_observed, self.args, self.kwargs,
+                      self.value, self.infer, self.scale, self.cond_indep_stack, self.done,
+                      self.stop, self.continuation)
+        msg.log_pdf = self.log_pdf
+        msg.batch_log_pdf = self.batch_log_pdf
+        msg.score_parts = self.score_parts
+        if self._extra is not None:
+            msg._extra = self._extra.copy()
+        return msg
@@ -1,7 +1,146 @@
 from __future__ import absolute_import, division, print_function
 
-# the global pyro stack
-_PYRO_STACK = []
+from pyro.shim import ContextVar
+
+
+class _PyroStack(object):
+    """
+    The Pyro stack of the current context, i.e. of the current thread or
+    asyncio task, with the interface of a list of frames, bottom first.
+
+    Each context has a stack of its own: a new thread starts with an empty
+    stack, and an asyncio task starts with the stack of the context that
+    created it, to which it can add frames without affecting that context.
+    The frames are stored in a tuple, together with their classes, which is
+    replaced whenever the stack is modified, so that contexts never share a
+    mutable stack.
+    """
+    def __init__(self):
+        self._state = ContextVar("pyro_stack", default=((), ()))
+
+    def state(self):
+        """
+        :returns: the frames of the stack and their classes, bottom first
+        :rtype: tuple
+        """
+        return self._state.get()
+
+    def _set(self, frames):
+        self._state.set((frames, tuple(type(frame) for frame in frames)))
+
+    def insert(self, index, frame):
+        frames = self._state.get()[0]
+        index = len(frames) + index if index < 0 else index
+        self._set(frames[:index] + (frame,) + frames[index:])
+
+    def pop(self, index=-1):
+        frames = self._state.get()[0]
+        index = len(frames) + index if index < 0 else index
+        frame = frames[index]
+        self._set(frames[:index] + frames[index + 1:])
+        return frame
+
+    def index(self, frame):
+        return self._state.get()[0].index(frame)
+
+    def __getitem__(self, index):
+        return self._state.get()[0][index]
+
+    def __contains__(self, frame):
+        return frame in self._state.get()[0]
+
+    def __iter__(self):
+        return iter(self._state.get()[0])
+
+    def __len__(self):
+        return len(self._state.get()[0])
+
+    def __repr__(self):
+        return repr(list(self._state.get()[0]))
+
+
+# the pyro stack of the current context
+_PYRO_STACK = _PyroStack()
+
+# compiled handler chains keyed by message type and the classes of the frames of the stack
+_DISPATCH_CACHE = {}
+_MAX_DISPATCH_CACHE_SIZE = 1024
+
+
+def _get_func(method):
+    return getattr(method, "__func__", method)
+
+
+def _overrides(cls, method_name):
+    """
+    Checks whether ``cls`` overrides the :class:`Messenger`
+    implementation of ``method_name``.
+    """
+    return _get_func(getattr(cls, method_name)) is not _get_func(getattr(Messenger, method_name))
+
+
+class HandlerChain(object):
+    """
+    A compiled dispatch table for one message type and one configuration
+    of the Pyro stack, consumed by :func:`pyro.util.apply_stack`.
+
+    ``process[i]`` and ``postprocess[i]`` are the handlers of the class of the
+    ``i``-th frame of the stack (bottom first), to be called with the frame and
+    the message, or ``None`` where the frame would fall through to the no-op
+    :class:`Messenger` default. Since chains only depend on the classes of the
+    frames, they can be reused by every stack of the same shape, e.g. by each
+    iteration of an ``irange``.
+    """
+    __slots__ = ("msg_type", "process", "postprocess")
+
+    def __init__(self, msg_type, frame_types):
+        """
+        :param str msg_type: the message type, e.g. "sample" or "param"
+        :param tuple frame_types: the classes of the frames of the Pyro stack, bottom first
+        """
+        self.msg_type = msg_type
+        handler_name = "_pyro_{}".format(msg_type)
+        process = []
+        postprocess = []
+        for cls in frame_types:
+            if _overrides(cls, "_process_message"):
+                process.append(cls._process_message)
+            elif _overrides(cls, handler_name):
+                process.append(getattr(cls, handler_name))
+            else:
+                process.append(None)
+            if _overrides(cls, "_postprocess_message"):
+                postprocess.append(cls._postprocess_message)
+            else:
+                postprocess.append(None)
+        self.process = tuple(process)
+        self.postprocess = tuple(postprocess)
+
+    def __len__(self):
+        return len(self.process)
+
+
+def get_handler_chain(msg_type, stack_types=None):
+    """
+    :param str msg_type: the message type, e.g. "sample" or "param"
+    :param tuple stack_types: the classes of the frames of the stack, bottom
+        first; defaults to those of the stack of the current context
+    :returns: the compiled handler chain for the current Pyro stack
+    :rtype: HandlerChain
+
+    Looks up the handler chain for ``msg_type`` and the classes of the frames
+    of ``_PYRO_STACK`` in the dispatch cache, compiling it if necessary.
+    """
+    if stack_types is None:
+        stack_types = _PYRO_STACK.state()[1]
+    key = (msg_type, stack_types)
+    chain = _DISPATCH_CACHE.get(key)
+    if chain is None:
+        if len(_DISPATCH_CACHE) >= _MAX_DISPATCH_CACHE_SIZE:
+            _DISPATCH_CACHE.clear()
+        chain = HandlerChain(msg_type, stack_types)
+        _DISPATCH_CACHE[key] = chain
+    return chain
 
 
 class Messenger(object):
@@ -99,7 +238,7 @@ class Messenger(object):
         Process the message by calling appropriate method of itself based
         on message type. The message is updated in place.
         """
-        return getattr(self, "_pyro_{}".format(msg["type"]))(msg)
+        return getattr(self, "_pyro_{}".format(msg.type))(msg)
 
     def _postprocess_message(self, msg):
         return None
@@ -0,0 +1,95 @@
+from __future__ import absolute_import, division, print_function
+
+from .poutine import Messenger, Poutine
+from .util import NonlocalExit
+
+
+class PrefixMessenger(Messenger):
+    """
+    Messenger that resumes the execution of a stochastic function from a
+    :class:`~pyro.poutine.trace_prefix.TracePrefix`, for ``poutine.queue``.
+
+    The values of the sites of the prefix are replayed, and the values of the
+    other unobserved sample sites are memoized as they are sampled. At the
+    first site for which ``escape_fn`` returns True, the prefix executed so far
+    is extended by ``extend_fn``. Rather than exiting and re-executing each
+    extension from scratch, all the extensions but the first are put in the
+    queue, and the execution continues with the value of the first extension.
+    A run thus completes one trace, and only the runs of the other extensions
+    replay the prefix, which they share without copying it.
+
+    :param TracePrefix prefix: the partial trace to resume
+    :param queue: the queue to put the other extensions of the prefix in
+    :param escape_fn: function that takes a partial trace and a message and
+        returns whether to extend the partial trace at that site
+    :param extend_fn: function that takes a partial trace and a message and
+        returns a list of partial traces extending it with the site
+    :param num_samples: the number of extensions for ``extend_fn`` to return
+    """
+    def __init__(self, prefix, queue, escape_fn, extend_fn, num_samples=-1):
+        super(PrefixMessenger, self).__init__()
+        self.start = prefix
+        self.queue = queue
+        self.escape_fn = escape_fn
+        self.extend_fn = extend_fn
+        self.num_samples = num_samples
+        self._reset()
+
+    def _reset(self):
+        self.prefix = self.start
+        self.replayed = self.start.values()
+        self.segment = {}  # the values sampled since self.prefix
+
+    def _pyro_sample(self, msg):
+        """
+        :param msg: current message at a trace site
+
+        Replays the value of a site of the prefix, or extends the prefix at a
+        site for which ``escape_fn`` returns True and continues with the first
+        extension. Raises a :class:`~pyro.poutine.util.NonlocalExit` if there
+        are no extensions.
+        """
+        if msg.is_observed:
+            return None
+        if msg.name in self.replayed:
+            msg.value = self.replayed[msg.name]
+            msg.done = True
+            return None
+        if self.escape_fn(self.prefix, msg):
+            base = self.prefix.extend(self.segment) if self.segment else self.prefix
+            extensions = self.extend_fn(base, msg, num_samples=self.num_samples)
+            if not extensions:
+                raise NonlocalExit(msg)
+            for extension in extensions[1:]:
+                self.queue.put(extension)
+            self.prefix = extensions[0]
+            self.segment = {}
+            msg.value = self.prefix.sites[msg.name]
+            msg.done = True
+        return None
+
+    def _postprocess_message(self, msg):
+        if msg.type == "sample" and not msg.is_observed and \
+                msg.name not in self.replayed and msg.name not in self.prefix.sites:
+            self.segment[msg.name] = msg.value
+        return None
+
+
+class PrefixPoutine(Poutine):
+    """
+    Poutine that resumes the execution of a stochastic function from a
+    partial trace, see :class:`PrefixMessenger`.
+    """
+    def __init__(self, fn, prefix, queue, escape_fn, extend_fn, num_samples=-1):
+        """
+        :param fn: a stochastic function (callable containing pyro primitive calls)
+        :param TracePrefix prefix: the partial trace to resume
+        :param queue: the queue to put the other extensions of the prefix in
+        :param escape_fn: function that takes a partial trace and a message and
+            returns whether to extend the partial trace at that site
+        :param extend_fn: function that takes a partial trace and a message and
+            returns a list of partial traces extending it with the site
+        :param num_samples: the number of extensions for ``extend_fn`` to return
+        """
+        super(PrefixPoutine, self).__init__(
+            PrefixMessenger(prefix, queue, escape_fn, extend_fn, num_samples), fn)
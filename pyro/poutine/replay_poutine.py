@@ -36,10 +36,10 @@ class ReplayMessenger(Messenger):
                 "unrecognized type {} for sites".format(str(type(sites))))
 
     def _process_message(self, msg):
-        if msg["name"] in self.sites:
-            if msg["type"] == "sample" and not msg["is_observed"]:
-                msg["done"] = True
-                msg["value"] = self.guide_trace.nodes[self.sites[msg["name"]]]["value"]
+        if msg.name in self.sites:
+            if msg.type == "sample" and not msg.is_observed:
+                msg.done = True
+                msg.value = self.guide_trace.nodes[self.sites[msg.name]]["value"]
 
         return super(ReplayMessenger, self)._process_message(msg)
 
@@ -54,10 +54,10 @@ class ReplayMessenger(Messenger):
         At a sample site that does not appear in self.guide_trace,
         reverts to default Poutine._pyro_sample behavior with no additional side effects.
         """
-        name = msg["name"]
+        name = msg.name
         # case 1: dict, positive: sample from guide
         if name in self.sites:
-            if msg["is_observed"]:
+            if msg.is_observed:
                 raise RuntimeError("site {} is observed and should not be overwritten".format(name))
             g_name = self.sites[name]
             if g_name not in self.guide_trace:
@@ -65,8 +65,8 @@ class ReplayMessenger(Messenger):
             if self.guide_trace.nodes[g_name]["type"] != "sample" or \
                     self.guide_trace.nodes[g_name]["is_observed"]:
                 raise RuntimeError("site {} must be sample in guide_trace".format(g_name))
-            msg["done"] = True
-            msg["value"] = self.guide_trace.nodes[g_name]["value"]
+            msg.done = True
+            msg.value = self.guide_trace.nodes[g_name]["value"]
         return None
 
     def _pyro_param(self, msg):
@@ -18,5 +18,5 @@ class ScaleMessenger(Messenger):
         self.scale = scale
 
     def _process_message(self, msg):
-        msg["scale"] = self.scale * msg["scale"]
+        msg.scale = self.scale * msg.scale
         return None
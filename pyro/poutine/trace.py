@@ -1,12 +1,13 @@
 from __future__ import absolute_import, division, print_function
 
-import collections
+import numbers
 import warnings
+from collections import OrderedDict
 
-import networkx
 from torch.autograd import Variable
 
-from pyro.distributions.util import scale_tensor
+from pyro.distributions.util import scale_tensor, sum_terms
+from pyro.poutine.message import Message
 from pyro.util import is_nan, is_inf
 
 
@@ -20,104 +21,266 @@ def _warn_if_nan(name, value):
     # Note that -inf log_pdf is fine: it is merely a zero-probability event.
 
 
-class DiGraph(networkx.DiGraph):
-    node_dict_factory = collections.OrderedDict
+class NodeView(object):
+    """
+    Read-only ordered mapping from site names to sites of a :class:`Trace`.
+
+    Mirrors the parts of ``networkx.DiGraph.nodes`` used by Pyro: it supports
+    ``trace.nodes[name]``, ``.items()``, ``.keys()``, ``.values()``,
+    membership, iteration in insertion order and ``trace.nodes(data=False)``.
+    """
+    __slots__ = ("_nodes",)
+
+    def __init__(self, nodes):
+        self._nodes = nodes
+
+    def __getitem__(self, name):
+        return self._nodes[name]
+
+    def __contains__(self, name):
+        return name in self._nodes
+
+    def __iter__(self):
+        return iter(self._nodes)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __call__(self, data=False):
+        if data:
+            return list(self._nodes.items())
+        return list(self._nodes)
+
+    def get(self, name, default=None):
+        return self._nodes.get(name, default)
+
+    def keys(self):
+        return self._nodes.keys()
+
+    def values(self):
+        return self._nodes.values()
+
+    def items(self):
+        return self._nodes.items()
+
+
+class EdgeView(object):
+    """
+    Read-only view of the ``(parent, child)`` pairs of a :class:`Trace`,
+    mirroring the parts of ``networkx.DiGraph.edges`` used by Pyro.
+    """
+    __slots__ = ("_succ",)
+
+    def __init__(self, succ):
+        self._succ = succ
+
+    def __iter__(self):
+        for name, children in self._succ.items():
+            for child in children:
+                yield name, child
+
+    def __len__(self):
+        return sum(len(children) for children in self._succ.values())
+
+    def __contains__(self, edge):
+        name, child = edge
+        return child in self._succ.get(name, ())
+
+    def __call__(self, data=False):
+        return list(self)
 
 
 class Trace(object):
     """
     Execution trace data structure
+
+    Sites are stored as ordered records keyed by site name.
+    Dependency edges (only added for ``graph_type="dense"``) are stored in
+    plain adjacency dicts, and a ``networkx.DiGraph`` view is only built
+    on demand by :meth:`to_networkx`, so flat traces never touch networkx.
     """
 
     def __init__(self, *args, **kwargs):
         """
         :param string graph_type: string specifying the kind of trace graph to construct
 
-        Constructor. Currently identical to networkx.``DiGraph(\*args, \**kwargs)``,
-        except for storing the graph_type attribute
+        Constructor. Any keyword arguments are stored as graph attributes,
+        as in ``networkx.DiGraph(**attr)``.
         """
-        self._graph = DiGraph(*args, **kwargs)
+        assert not args, "Trace does not support initialization from graph data"
+        self.graph = dict(kwargs)
         graph_type = kwargs.pop("graph_type", "flat")
         assert graph_type in ("flat", "dense"), \
             "{} not a valid graph type".format(graph_type)
         self.graph_type = graph_type
-        super(Trace, self).__init__(*args, **kwargs)
+        self._nodes = OrderedDict()  # site name -> site
+        self._succ = {}  # site name -> OrderedDict of children, only for sites with children
+        self._pred = {}  # site name -> OrderedDict of parents, only for sites with parents
+        self._nx_graph = None  # networkx view, built lazily by to_networkx()
 
     def __del__(self):
         # Work around cyclic reference bugs in networkx.DiGraph
         # See https://github.com/uber/pyro/issues/798
-        self._graph.__dict__.clear()
+        nx_graph = getattr(self, "_nx_graph", None)
+        if nx_graph is not None:
+            nx_graph.__dict__.clear()
 
     @property
     def nodes(self):
-        return self._graph.nodes
+        return NodeView(self._nodes)
 
     @property
     def edges(self):
-        return self._graph.edges
-
-    @property
-    def graph(self):
-        return self._graph.graph
+        return EdgeView(self._succ)
 
-    @property
-    def remove_node(self):
-        return self._graph.remove_node
+    def remove_node(self, site_name):
+        """
+        :param string site_name: the name of the site to be removed
 
-    @property
-    def add_edge(self):
-        return self._graph.add_edge
+        Removes a site and all edges into or out of it.
+        """
+        del self._nodes[site_name]
+        for child in self._succ.pop(site_name, ()):
+            del self._pred[child][site_name]
+            if not self._pred[child]:
+                del self._pred[child]
+        for parent in self._pred.pop(site_name, ()):
+            del self._succ[parent][site_name]
+            if not self._succ[parent]:
+                del self._succ[parent]
+        self._nx_graph = None
+
+    def add_edge(self, site_name1, site_name2):
+        """
+        Adds a dependency edge from ``site_name1`` to ``site_name2``,
+        adding empty sites for names that are not yet in the trace.
+        """
+        for name in (site_name1, site_name2):
+            if name not in self._nodes:
+                self._nodes[name] = {}
+        self._succ.setdefault(site_name1, OrderedDict())[site_name2] = None
+        self._pred.setdefault(site_name2, OrderedDict())[site_name1] = None
+        self._nx_graph = None
 
-    @property
     def is_directed(self):
-        return self._graph.is_directed
+        return True
 
-    @property
-    def in_degree(self):
-        return self._graph.in_degree
+    def in_degree(self, site_name=None):
+        """
+        :returns: the number of parents of ``site_name``,
+            or a list of ``(name, in_degree)`` pairs if ``site_name`` is None
+        """
+        if site_name is None:
+            return [(name, len(self._pred.get(name, ()))) for name in self._nodes]
+        return len(self._pred.get(site_name, ()))
 
-    @property
-    def successors(self):
-        return self._graph.successors
+    def successors(self, site_name):
+        """
+        :returns: an iterator over the children of ``site_name``
+        """
+        if site_name not in self._nodes:
+            raise KeyError("site {} not in trace".format(site_name))
+        return iter(self._succ.get(site_name, ()))
+
+    def predecessors(self, site_name):
+        """
+        :returns: an iterator over the parents of ``site_name``
+        """
+        if site_name not in self._nodes:
+            raise KeyError("site {} not in trace".format(site_name))
+        return iter(self._pred.get(site_name, ()))
+
+    def to_networkx(self):
+        """
+        :returns: a ``networkx.DiGraph`` with the sites and edges of this trace
+        :rtype: networkx.DiGraph
+
+        Builds a networkx view of the trace for dense-graph algorithms and
+        visualization. Node attributes are shallow copies of the sites.
+        The view is cached until the structure of the trace changes
+        and should be treated as read-only.
+        """
+        if self._nx_graph is None:
+            import networkx
+
+            class DiGraph(networkx.DiGraph):
+                node_dict_factory = OrderedDict
+
+            g = DiGraph(**self.graph)
+            g.add_nodes_from(self._nodes.items())
+            g.add_edges_from(self.edges)
+            self._nx_graph = g
+        return self._nx_graph
 
     def __contains__(self, site_name):
-        return site_name in self._graph
+        return site_name in self._nodes
 
     def __iter__(self):
-        return iter(self._graph)
+        return iter(self._nodes)
 
     def __len__(self):
-        return len(self._graph)
+        return len(self._nodes)
 
     def add_node(self, site_name, *args, **kwargs):
         """
         :param string site_name: the name of the site to be added
 
-        Adds a site to the trace.
+        Adds a site to the trace. The site is given either as a single
+        :class:`~pyro.poutine.message.Message`, which is stored as is,
+        or as ``dict``-style arguments, from which a new message is built.
 
-        Identical to super(Trace, self).add_node,
-        but raises an error when attempting to add a duplicate node
+        Raises an error when attempting to add a duplicate node
         instead of silently overwriting.
         """
+        if len(args) == 1 and not kwargs and isinstance(args[0], Message):
+            site = args[0]
+        else:
+            site = dict(*args, **kwargs)
+            site.setdefault("name", site_name)
+            site = Message(**site)
+
         # XXX should do more validation than this
-        if kwargs["type"] != "param":
+        if site.type != "param":
             assert site_name not in self, \
                 "site {} already in trace".format(site_name)
 
-        # XXX should copy in case site gets mutated, or dont bother?
-        self._graph.add_node(site_name, *args, **kwargs)
+        if site_name in self._nodes:
+            self._nodes[site_name].update(site)
+        else:
+            self._nodes[site_name] = site
+            self._nx_graph = None
 
     def copy(self):
         """
         Makes a shallow copy of self with nodes and edges preserved.
-        Identical to super(Trace, self).copy(), but preserves the type
-        and the self.graph_type attribute
+        Each site is copied, but the values stored at the sites are shared.
+        Preserves the type and the self.graph_type attribute
         """
         trace = Trace()
-        trace._graph = self._graph.copy()
+        trace.graph = self.graph.copy()
         trace.graph_type = self.graph_type
+        trace._nodes = OrderedDict((name, site.copy()) for name, site in self._nodes.items())
+        trace._succ = {name: children.copy() for name, children in self._succ.items()}
+        trace._pred = {name: parents.copy() for name, parents in self._pred.items()}
         return trace
 
+    def _check_log_pdf(self, log_p, log_pdf_key):
+        """
+        Checks the total log-probability once, and only looks for the sites
+        responsible if it contains NAN or +inf values, so that the sites are
+        not synced one by one.
+        """
+        if isinstance(log_p, Variable):
+            log_p = log_p.data
+        if isinstance(log_p, numbers.Number):
+            bad = log_p != log_p or log_p == float('inf')
+        else:
+            bad = ((log_p != log_p) | (log_p == float('inf'))).any()
+        if bad:
+            for name, site in self.nodes.items():
+                if site["type"] == "sample" and log_pdf_key in site:
+                    _warn_if_nan(name, site[log_pdf_key].sum())
+
     def log_pdf(self, site_filter=lambda name, site: True):
         """
         Compute the local and overall log-probabilities of the trace.
@@ -127,7 +290,7 @@ class Trace(object):
         :returns: total log probability.
         :rtype: torch.autograd.Variable
         """
-        log_p = 0.0
+        terms = []
         for name, site in self.nodes.items():
             if site["type"] == "sample" and site_filter(name, site):
                 try:
@@ -137,8 +300,9 @@ class Trace(object):
                     site_log_p = site["fn"].log_prob(site["value"], *args, **kwargs)
                     site_log_p = scale_tensor(site_log_p, site["scale"]).sum()
                     site["log_pdf"] = site_log_p
-                    _warn_if_nan(name, site_log_p)
-                log_p += site_log_p
+                terms.append(site_log_p)
+        log_p = sum_terms(terms)
+        self._check_log_pdf(log_p, "log_pdf")
         return log_p
 
     # XXX This only makes sense when all tensors have compatible shape.
@@ -148,7 +312,7 @@ class Trace(object):
 
         The local computation is memoized, and also stores the local `.log_pdf()`.
         """
-        log_p = 0.0
+        terms = []
         for name, site in self.nodes.items():
             if site["type"] == "sample" and site_filter(name, site):
                 try:
@@ -159,9 +323,10 @@ class Trace(object):
                     site_log_p = scale_tensor(site_log_p, site["scale"])
                     site["batch_log_pdf"] = site_log_p
                     site["log_pdf"] = site_log_p.sum()
-                    _warn_if_nan(name, site["log_pdf"])
                 # Here log_p may be broadcast to a larger tensor:
-                log_p = log_p + site_log_p
+                terms.append(site_log_p)
+        log_p = sum_terms(terms)
+        self._check_log_pdf(log_p, "batch_log_pdf")
         return log_p
 
     def compute_batch_log_pdf(self, site_filter=lambda name, site: True):
@@ -169,6 +334,8 @@ class Trace(object):
         Compute the batched local log-probabilities at each site of the trace.
 
         The local computation is memoized, and also stores the local `.log_pdf()`.
+        Sites are not checked for NAN values; this is left to the consumer of
+        the log-probabilities, e.g. a single check of the ELBO.
         """
         for name, site in self.nodes.items():
             if site["type"] == "sample" and site_filter(name, site):
@@ -180,11 +347,13 @@ class Trace(object):
                     site_log_p = scale_tensor(site_log_p, site["scale"])
                     site["batch_log_pdf"] = site_log_p
                     site["log_pdf"] = site_log_p.sum()
-                    _warn_if_nan(name, site["log_pdf"])
 
     def compute_score_parts(self):
         """
         Compute the batched local score parts at each site of the trace.
+
+        As with :meth:`compute_batch_log_pdf`, sites are not checked for NAN
+        values.
         """
         for name, site in self.nodes.items():
             if site["type"] == "sample" and "score_parts" not in site:
@@ -194,7 +363,6 @@ class Trace(object):
                 site["score_parts"] = value
                 site["batch_log_pdf"] = value[0]
                 site["log_pdf"] = value[0].sum()
-                _warn_if_nan(name, site["log_pdf"])
 
     @property
     def observation_nodes(self):
@@ -5,6 +5,78 @@ from .trace import Trace
 from .util import site_is_subsample
 
 
+class _IndexNode(object):
+    __slots__ = ("sites", "children")
+
+    def __init__(self):
+        self.sites = []
+        # frame name -> frame counter -> _IndexNode
+        self.children = {}
+
+
+class CondIndepStackIndex(object):
+    """
+    Index of trace sites by the frames of their ``cond_indep_stack``.
+
+    Two sites are independent if at some position of their stacks there are
+    frames with the same name but different counters, e.g. two iterations of
+    an ``irange``. Sites are stored in a trie keyed by ``(name, counter)`` at
+    each position, so that looking up the sites a new site depends on prunes
+    independent branches whole instead of comparing against every site in
+    them.
+    """
+
+    def __init__(self):
+        self._root = _IndexNode()
+        self._num_sites = 0
+
+    def add(self, name, cond_indep_stack):
+        """
+        :param name: name of the site
+        :param cond_indep_stack: the ``cond_indep_stack`` of the site
+
+        Adds a site to the index.
+        """
+        node = self._root
+        for frame in cond_indep_stack:
+            by_counter = node.children.setdefault(frame.name, {})
+            child = by_counter.get(frame.counter)
+            if child is None:
+                child = by_counter[frame.counter] = _IndexNode()
+            node = child
+        node.sites.append((self._num_sites, name))
+        self._num_sites += 1
+
+    def find_dependent(self, cond_indep_stack):
+        """
+        :param cond_indep_stack: a ``cond_indep_stack``
+        :returns: names of the indexed sites that are not independent of the
+            given stack, in the order in which they were added
+        :rtype: list
+        """
+        depth = len(cond_indep_stack)
+        found = []
+        pending = [(self._root, 0)]
+        while pending:
+            node, i = pending.pop()
+            found.extend(node.sites)
+            if i < depth:
+                frame = cond_indep_stack[i]
+                for name, by_counter in node.children.items():
+                    if name == frame.name:
+                        # only the same iteration of this frame is dependent
+                        child = by_counter.get(frame.counter)
+                        if child is not None:
+                            pending.append((child, i + 1))
+                    else:
+                        pending.extend((child, i + 1) for child in by_counter.values())
+            else:
+                for by_counter in node.children.values():
+                    pending.extend((child, i + 1) for child in by_counter.values())
+        found.sort()
+        return [name for _, name in found]
+
+
 def get_vectorized_map_data_info(trace):
     """
     This determines whether the vectorized map_datas are rao-blackwellizable by
@@ -41,22 +113,15 @@ def get_vectorized_map_data_info(trace):
 
     # enforce that if there are multiple vectorized map_datas, they are all
     # independent of one another because of enclosing list map_datas
-    # (step 2: explicitly check this)
+    # (step 2: explicitly check this, only comparing stacks in the same branches)
     if vectorized_map_data_info['rao-blackwellization-condition']:
-        vec_md_stacks = list(vec_md_stacks)
-        for i, stack_i in enumerate(vec_md_stacks):
-            for j, stack_j in enumerate(vec_md_stacks):
-                # only check unique pairs
-                if i <= j:
-                    continue
-                ij_independent = False
-                for md_i, md_j in zip(stack_i, stack_j):
-                    if md_i.name == md_j.name and md_i.counter != md_j.counter:
-                        ij_independent = True
-                if not ij_independent:
-                    vectorized_map_data_info['rao-blackwellization-condition'] = False
-                    vectorized_map_data_info['warnings'].add('there exist dependent iaranges')
-                    break
+        index = CondIndepStackIndex()
+        for stack in vec_md_stacks:
+            if index.find_dependent(stack):
+                vectorized_map_data_info['rao-blackwellization-condition'] = False
+                vectorized_map_data_info['warnings'].add('there exist dependent iaranges')
+                break
+            index.add(stack, stack)
 
     # construct data structure consumed by tracegraph_kl_qp
     if vectorized_map_data_info['rao-blackwellization-condition']:
@@ -76,23 +141,12 @@ def identify_dense_edges(trace):
     Modifies a trace in-place by adding all edges based on the
     `cond_indep_stack` information stored at each site.
     """
+    index = CondIndepStackIndex()
     for name, node in trace.nodes.items():
-        if site_is_subsample(node):
-            continue
-        if node["type"] == "sample":
-            for past_name, past_node in trace.nodes.items():
-                if site_is_subsample(node):
-                    continue
-                if past_node["type"] == "sample":
-                    if past_name == name:
-                        break
-                    past_node_independent = False
-                    for query, target in zip(node["cond_indep_stack"], past_node["cond_indep_stack"]):
-                        if query.name == target.name and query.counter != target.counter:
-                            past_node_independent = True
-                            break
-                    if not past_node_independent:
-                        trace.add_edge(past_name, name)
+        if node["type"] == "sample" and not site_is_subsample(node):
+            for past_name in index.find_dependent(node["cond_indep_stack"]):
+                trace.add_edge(past_name, name)
+            index.add(name, node["cond_indep_stack"])
 
 
 class TraceMessenger(Messenger):
@@ -117,14 +171,20 @@ class TraceMessenger(Messenger):
             graph_type = "flat"
         assert graph_type in ("flat", "dense")
         self.graph_type = graph_type
+        self._edge_index = None
+
+    def __enter__(self):
+        if self.graph_type == "dense":
+            self._edge_index = CondIndepStackIndex()
+        return super(TraceMessenger, self).__enter__()
 
     def __exit__(self, *args, **kwargs):
         """
-        Adds appropriate edges based on cond_indep_stack information
+        Adds the vectorized map_data information of dense traces
         upon exiting the context.
         """
         if self.graph_type == "dense":
-            identify_dense_edges(self.trace)
+            self._edge_index = None
             self.trace.graph["vectorized_map_data_info"] = \
                 get_vectorized_map_data_info(self.trace)
         return super(TraceMessenger, self).__exit__(*args, **kwargs)
@@ -146,6 +206,8 @@ class TraceMessenger(Messenger):
                     args=self.trace.nodes["_INPUT"]["args"],
                     kwargs=self.trace.nodes["_INPUT"]["kwargs"])
         self.trace = tr
+        if self.graph_type == "dense":
+            self._edge_index = CondIndepStackIndex()
         super(TraceMessenger, self)._reset()
 
     def _pyro_sample(self, msg):
@@ -161,7 +223,7 @@ class TraceMessenger(Messenger):
         then store the return value in self.trace
         and return the return value.
         """
-        name = msg["name"]
+        name = msg.name
         if name in self.trace:
             site = self.trace.nodes[name]
             if site['type'] == 'param':
@@ -185,16 +247,21 @@ class TraceMessenger(Messenger):
         If it does exist, grab it from the parameter store.
         Store the parameter in self.trace, and then return the parameter.
         """
-        if msg["name"] in self.trace:
-            if self.trace.nodes[msg['name']]['type'] == "sample":
-                raise RuntimeError("{} is already in the trace as a sample".format(msg['name']))
+        if msg.name in self.trace:
+            if self.trace.nodes[msg.name]['type'] == "sample":
+                raise RuntimeError("{} is already in the trace as a sample".format(msg.name))
         return None
 
     def _postprocess_message(self, msg):
-        val = msg["value"]
-        site = msg.copy()
-        site.update(value=val)
-        self.trace.add_node(msg["name"], **site)
+        # the message is final once it has been processed, so it is stored
+        # without copying; get_trace() hands out copies of the sites
+        self.trace.add_node(msg.name, msg)
+        # dense traces get their edges as sites are added,
+        # with the same result as identify_dense_edges()
+        if self._edge_index is not None and msg.type == "sample" and not site_is_subsample(msg):
+            for past_name in self._edge_index.find_dependent(msg.cond_indep_stack):
+                self.trace.add_edge(past_name, msg.name)
+            self._edge_index.add(msg.name, msg.cond_indep_stack)
         return None
 
 
@@ -0,0 +1,55 @@
+from __future__ import absolute_import, division, print_function
+
+
+class TracePrefix(object):
+    """
+    A partial trace, stored as a node of a trie of executed prefixes.
+
+    A node holds the values of the sample sites that were executed after the
+    prefix of its parent, and refers to its parent rather than copying it, so
+    that the extensions of a partial trace share its prefix. Extending a
+    partial trace with a site thus costs one node, regardless of the length of
+    the prefix. The values of the prefix are memoized in the nodes, so that
+    they can be replayed without re-sampling them.
+
+    :param TracePrefix parent: the node of the prefix this node extends, or None
+        for an empty prefix
+    :param dict sites: the values of the sites of this node, by name
+    """
+    __slots__ = ("parent", "sites")
+
+    def __init__(self, parent=None, sites=None):
+        self.parent = parent
+        self.sites = {} if sites is None else sites
+
+    def extend(self, sites):
+        """
+        :param dict sites: the values of the extra sites, by name
+        :returns: a partial trace extending this one with some sites
+        :rtype: TracePrefix
+        """
+        return TracePrefix(self, sites)
+
+    def values(self):
+        """
+        :returns: the values of all the sites of the partial trace, by name
+        :rtype: dict
+        """
+        values = {}
+        node = self
+        while node is not None:
+            for name, value in node.sites.items():
+                values.setdefault(name, value)
+            node = node.parent
+        return values
+
+    def __contains__(self, name):
+        node = self
+        while node is not None:
+            if name in node.sites:
+                return True
+            node = node.parent
+        return False
+
+    def __len__(self):
+        return len(self.values())
@@ -1,6 +1,7 @@
 from __future__ import absolute_import, division, print_function
 
 from .poutine import _PYRO_STACK
+from .trace_prefix import TracePrefix
 
 
 def site_is_subsample(site):
@@ -54,6 +55,7 @@ def enum_extend(trace, msg, num_samples=None):
 
     Utility function to copy and extend a trace with sites based on the input site
     whose values are enumerated from the support of the input site's distribution.
+    A :class:`~pyro.poutine.trace_prefix.TracePrefix` is extended without copying.
 
     Used for exact inference and integrating out discrete variables.
     """
@@ -61,13 +63,16 @@ def enum_extend(trace, msg, num_samples=None):
         num_samples = -1
 
     extended_traces = []
-    for i, s in enumerate(msg["fn"].enumerate_support(*msg["args"], **msg["kwargs"])):
+    for i, s in enumerate(msg.fn.enumerate_support(*msg.args, **msg.kwargs)):
         if i > num_samples and num_samples >= 0:
             break
+        if isinstance(trace, TracePrefix):
+            extended_traces.append(trace.extend({msg.name: s}))
+            continue
         msg_copy = msg.copy()
-        msg_copy.update(value=s)
+        msg_copy.value = s
         tr_cp = trace.copy()
-        tr_cp.add_node(msg["name"], **msg_copy)
+        tr_cp.add_node(msg.name, msg_copy)
         extended_traces.append(tr_cp)
     return extended_traces
 
@@ -81,6 +86,7 @@ def mc_extend(trace, msg, num_samples=None):
 
     Utility function to copy and extend a trace with sites based on the input site
     whose values are sampled from the input site's function.
+    A :class:`~pyro.poutine.trace_prefix.TracePrefix` is extended without copying.
 
     Used for Monte Carlo marginalization of individual sample sites.
     """
@@ -89,10 +95,13 @@ def mc_extend(trace, msg, num_samples=None):
 
     extended_traces = []
     for i in range(num_samples):
+        if isinstance(trace, TracePrefix):
+            extended_traces.append(trace.extend({msg.name: msg.fn(*msg.args, **msg.kwargs)}))
+            continue
         msg_copy = msg.copy()
-        msg_copy["value"] = msg_copy["fn"](*msg_copy["args"], **msg_copy["kwargs"])
+        msg_copy.value = msg_copy.fn(*msg_copy.args, **msg_copy.kwargs)
         tr_cp = trace.copy()
-        tr_cp.add_node(msg_copy["name"], **msg_copy)
+        tr_cp.add_node(msg_copy.name, msg_copy)
         extended_traces.append(tr_cp)
     return extended_traces
 
@@ -108,10 +117,10 @@ def discrete_escape(trace, msg):
     Used by EscapePoutine to decide whether to do a nonlocal exit at a site.
     Subroutine for integrating out discrete variables for variance reduction.
     """
-    return (msg["type"] == "sample") and \
-        (not msg["is_observed"]) and \
-        (msg["name"] not in trace) and \
-        (getattr(msg["fn"], "enumerable", False))
+    return (msg.type == "sample") and \
+        (not msg.is_observed) and \
+        (msg.name not in trace) and \
+        (getattr(msg.fn, "enumerable", False))
 
 
 def all_escape(trace, msg):
@@ -125,6 +134,6 @@ def all_escape(trace, msg):
     Used by EscapePoutine to decide whether to do a nonlocal exit at a site.
     Subroutine for approximately integrating out variables for variance reduction.
     """
-    return (msg["type"] == "sample") and \
-        (not msg["is_observed"]) and \
-        (msg["name"] not in trace)
+    return (msg.type == "sample") and \
+        (not msg.is_observed) and \
+        (msg.name not in trace)
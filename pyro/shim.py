@@ -2,8 +2,10 @@ from __future__ import absolute_import, division, print_function
 
 import contextlib
 import re
+import threading
 
 import torch
+from torch.autograd import Variable
 
 
 def parse_torch_version():
@@ -27,6 +29,9 @@ try:
     def is_volatile(variable):
         return False
 
+    def grad_variable(tensor):
+        return Variable(tensor)
+
 except AttributeError:
     # These work in PyTorch 0.3 and earlier.
 
@@ -36,3 +41,29 @@ except AttributeError:
 
     def is_volatile(variable):
         return variable.volatile
+
+    def grad_variable(tensor):
+        # backward accumulates into volatile gradients in place
+        return Variable(tensor, volatile=True)
+
+
+# Polyfill for contextvars, which is new in Python 3.7.
+try:
+    from contextvars import ContextVar
+except ImportError:
+    class ContextVar(object):
+        """
+        Thread-local stand-in for ``contextvars.ContextVar``, supporting
+        :meth:`get` and :meth:`set`. Without contextvars, asyncio tasks of the
+        same thread share their context.
+        """
+        def __init__(self, name, default=None):
+            self.name = name
+            self._default = default
+            self._local = threading.local()
+
+        def get(self):
+            return getattr(self._local, "value", self._default)
+
+        def set(self, value):
+            self._local.value = value
@@ -8,9 +8,9 @@ import graphviz
 import numpy as np
 
 import torch
-from pyro.params import _PYRO_PARAM_STORE
+from pyro.params import get_current_param_store
 
-from pyro.poutine.poutine import _PYRO_STACK
+from pyro.poutine.poutine import _PYRO_STACK, get_handler_chain
 from pyro.poutine.util import site_is_subsample
 from pyro.shim import is_volatile
 from torch.autograd import Variable
@@ -22,8 +22,8 @@ def validate_message(msg):
     Asserts that the message has a valid format.
     :returns: None
     """
-    assert msg["type"] in ("sample", "param"), \
-        "{} is an invalid site type, how did that get there?".format(msg["type"])
+    assert msg.type in ("sample", "param"), \
+        "{} is an invalid site type, how did that get there?".format(msg.type)
 
 
 def default_process_message(msg):
@@ -33,45 +33,45 @@ def default_process_message(msg):
     :returns: None
     """
     validate_message(msg)
-    if msg["type"] == "sample":
+    if msg.type == "sample":
         fn, args, kwargs = \
-            msg["fn"], msg["args"], msg["kwargs"]
+            msg.fn, msg.args, msg.kwargs
 
-        # msg["done"] enforces the guarantee in the poutine execution model
+        # msg.done enforces the guarantee in the poutine execution model
         # that a site's non-effectful primary computation should only be executed once:
         # if the site already has a stored return value,
         # don't reexecute the function at the site,
         # and do any side effects using the stored return value.
-        if msg["done"]:
+        if msg.done:
             return msg
 
-        if msg["is_observed"]:
-            assert msg["value"] is not None
-            val = msg["value"]
+        if msg.is_observed:
+            assert msg.value is not None
+            val = msg.value
         else:
             val = fn(*args, **kwargs)
 
         # after fn has been called, update msg to prevent it from being called again.
-        msg["done"] = True
-        msg["value"] = val
-    elif msg["type"] == "param":
+        msg.done = True
+        msg.value = val
+    elif msg.type == "param":
         name, args, kwargs = \
-            msg["name"], msg["args"], msg["kwargs"]
+            msg.name, msg.args, msg.kwargs
 
-        # msg["done"] enforces the guarantee in the poutine execution model
+        # msg.done enforces the guarantee in the poutine execution model
         # that a site's non-effectful primary computation should only be executed once:
         # if the site already has a stored return value,
         # don't reexecute the function at the site,
         # and do any side effects using the stored return value.
-        if msg["done"]:
+        if msg.done:
             return msg
 
-        ret = _PYRO_PARAM_STORE.get_param(name, *args, **kwargs)
+        ret = get_current_param_store().get_param(name, *args, **kwargs)
 
-        # after the param store has been queried, update msg["done"]
+        # after the param store has been queried, update msg.done
         # to prevent it from being queried again.
-        msg["done"] = True
-        msg["value"] = ret
+        msg.done = True
+        msg.value = ret
     else:
         assert False
     return None
@@ -222,7 +222,7 @@ def zero_grads(tensors):
 
 def apply_stack(initial_msg):
     """
-    :param dict initial_msg: the starting version of the trace site
+    :param Message initial_msg: the starting version of the trace site
     :returns: an updated message that is the final version of the trace site
 
     Execute the poutine stack at a single site according to the following scheme:
@@ -233,31 +233,48 @@ def apply_stack(initial_msg):
            If the message field "stop" is True, stop;
            Otherwise, continue
     3. Return the updated message
-    """
-    stack = _PYRO_STACK
-    # TODO check at runtime if stack is valid
 
+    The handlers of each frame are looked up once per stack configuration and
+    message type (see :func:`pyro.poutine.poutine.get_handler_chain`),
+    and frames that would only run the default no-op handlers are skipped.
+    """
     # msg is used to pass information up and down the stack
     msg = initial_msg
+    validate_message(msg)
+
+    msg_type = msg.type
+    stack, stack_types = _PYRO_STACK.state()
+    chain = get_handler_chain(msg_type, stack_types)
+    process = chain.process
 
     counter = 0
+    depth = len(process)
     # go until time to stop?
-    for frame in stack:
-        validate_message(msg)
-
+    while counter < depth:
+        handler = process[counter]
         counter = counter + 1
+        if handler is not None:
+            handler(stack[counter - 1], msg)
 
-        frame._process_message(msg)
+            if msg.stop:
+                break
 
-        if msg["stop"]:
-            break
+            # some frames change the type of a message (e.g. LiftMessenger turns params into samples),
+            # in which case the remaining frames dispatch on the new type
+            if msg.type != msg_type:
+                validate_message(msg)
+                msg_type = msg.type
+                process = get_handler_chain(msg_type, stack_types).process
 
     default_process_message(msg)
 
-    for frame in reversed(stack[0:counter]):
-        frame._postprocess_message(msg)
+    postprocess = chain.postprocess
+    for i in range(counter - 1, -1, -1):
+        handler = postprocess[i]
+        if handler is not None:
+            handler(stack[i], msg)
 
-    cont = msg["continuation"]
+    cont = msg.continuation
     if cont is not None:
         cont(msg)
 
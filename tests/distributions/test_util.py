@@ -5,7 +5,7 @@ import pytest
 
 import torch
 
-from pyro.distributions.util import broadcast_shape, sum_leftmost
+from pyro.distributions.util import broadcast_shape, sum_leftmost, sum_terms
 
 
 @pytest.mark.parametrize('shapes', [
@@ -83,3 +83,11 @@ def test_sum_leftmost():
     assert sum_leftmost(x, 2).shape == (4,)
     assert sum_leftmost(x, -1).shape == (4,)
     assert sum_leftmost(x, -2).shape == (3, 4)
+
+
+def test_sum_terms():
+    assert sum_terms([]) == 0
+    assert sum_terms([1, 2.5]) == 3.5
+    x, y = torch.ones(3), torch.Tensor([1, 2, 3])
+    assert (sum_terms([x, 2, y]) == torch.Tensor([4, 5, 6])).all()
+    assert (sum_terms([torch.ones(2, 1), y]) == torch.Tensor([[2, 3, 4], [2, 3, 4]])).all()
@@ -0,0 +1,96 @@
+from __future__ import absolute_import, division, print_function
+
+import pytest
+import torch
+from torch.autograd import Variable
+
+from pyro.infer.contract import contract, contract_plates, einsum
+from tests.common import assert_equal
+
+
+def naive_einsum(equation, *operands):
+    inputs, output = equation.split("->")
+    inputs = inputs.split(",")
+    letters = sorted(set("".join(inputs)))
+    sizes = {}
+    for letters_in, operand in zip(inputs, operands):
+        sizes.update(zip(letters_in, operand.size()))
+    product = Variable(torch.ones(*[sizes[letter] for letter in letters]))
+    for letters_in, operand in zip(inputs, operands):
+        # align the operand with the sorted letters
+        order = sorted(letters_in)
+        operand = operand.permute(*[letters_in.index(letter) for letter in order])
+        shape = [sizes[letter] if letter in letters_in else 1 for letter in letters]
+        product = product * operand.contiguous().view(*shape)
+    for letter in reversed(letters):
+        if letter not in output:
+            product = product.sum(letters.index(letter))
+    remaining = [letter for letter in letters if letter in output]
+    if not remaining:
+        return product
+    return product.permute(*[remaining.index(letter) for letter in output])
+
+
+@pytest.mark.parametrize("equation", [
+    "a,a->",
+    "a,b->ab",
+    "ab,bc->ac",
+    "ab,bc->ca",
+    "ab,bc,cd->",
+    "abc,cd,db->ba",
+    "ab,bc,ca->",
+    "ab,ac,ad,ae->a",
+])
+@pytest.mark.parametrize("log", [False, True])
+def test_einsum(equation, log):
+    sizes = dict(zip("abcde", [2, 3, 4, 5, 6]))
+    inputs = equation.split("->")[0].split(",")
+    operands = [Variable(torch.rand(*[sizes[letter] for letter in letters]) + 0.5) for letters in inputs]
+    expected = naive_einsum(equation, *operands)
+    if log:
+        actual = einsum(equation, *[x.log() for x in operands], log=True).exp()
+    else:
+        actual = einsum(equation, *operands)
+    assert actual.size() == expected.size()
+    assert_equal(actual, expected, prec=1e-4)
+
+
+def test_contract_chain_is_linear():
+    # a chain of 40 binary variables, whose joint enumeration has 2 ** 40 values
+    num_steps = 40
+    init = Variable(torch.Tensor([0.3, 0.7]))
+    trans = Variable(torch.Tensor([[0.9, 0.1], [0.2, 0.8]]))
+    factors = [init.view((2,) + (1,) * (num_steps - 1))]
+    for t in range(1, num_steps):
+        shape = [1] * num_steps
+        shape[num_steps - t - 1] = 2
+        shape[num_steps - t] = 2
+        factors.append(trans.contiguous().view(*shape))
+    result = contract(factors, range(-num_steps, 0), log=False)
+    assert max(f.numel() for f in result) == 1
+    # the chain is normalized
+    assert_equal(float(result[0].sum()), 1.0, prec=1e-5)
+
+
+def test_contract_plates_local_and_global():
+    # a global variable c along dim -3, and local variables z along dim -2 in an iarange along dim -1
+    n = 4
+    log_pc = Variable(torch.Tensor([0.4, 0.6]).log()).view(2, 1, 1)
+    log_pz = Variable(torch.rand(2, 3, 1) + 0.1).log()
+    log_pz = log_pz - log_pz.exp().sum(1, keepdim=True).log()
+    log_px = Variable(torch.randn(1, 3, n))
+    terms = contract_plates([log_pc, log_pz, log_px],
+                            [frozenset(), frozenset(["data"]), frozenset(["data"])],
+                            sum_dims=[-3, -2],
+                            dim_ordinals={-3: frozenset(), -2: frozenset(["data"])})
+    actual = sum(term.sum() for _, term in terms)
+
+    pz = log_pz.exp().squeeze(-1)
+    px = log_px.exp().squeeze(0)
+    expected = 0
+    for c in range(2):
+        likelihood = 1
+        for i in range(n):
+            likelihood = likelihood * (pz[c] * px[:, i]).sum()
+        expected = expected + log_pc.exp().view(-1)[c] * likelihood
+    assert_equal(actual, expected.log(), prec=1e-5)
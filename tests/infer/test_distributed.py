@@ -0,0 +1,123 @@
+from __future__ import absolute_import, division, print_function
+
+import multiprocessing
+import threading
+
+import pytest
+import torch
+import torch.distributed as dist
+from torch.autograd import Variable
+
+import pyro
+import pyro.poutine as poutine
+from pyro.distributions import Normal
+from pyro.infer import SVI
+from pyro.infer.distributed import DataParallelSVI, DistributedSVI, ShardMessenger, _free_port
+from pyro.optim import SGD
+from tests.common import assert_equal
+
+pytestmark = pytest.mark.skipif(not dist.is_available(), reason="torch.distributed is not available")
+
+
+def make_model(data, subsample_size=None):
+    def model():
+        mu = pyro.param("mu", Variable(torch.zeros(1), requires_grad=True))
+        with pyro.iarange("data", len(data), subsample_size=subsample_size) as ind:
+            pyro.observe("obs", Normal(mu.expand(len(ind)), Variable(torch.ones(len(ind)))),
+                         data.index_select(0, ind))
+
+    def guide():
+        pass
+
+    return model, guide
+
+
+@pytest.mark.parametrize("subsample_mode", ["random", "epoch"])
+def test_shards_partition_subsample(subsample_mode):
+    def model():
+        with pyro.iarange("data", 100, subsample_size=10, subsample_mode=subsample_mode) as ind:
+            pyro.sample("x", Normal(Variable(torch.zeros(len(ind))), Variable(torch.ones(len(ind)))))
+        return ind
+
+    torch.manual_seed(0)
+    rng_state = torch.get_rng_state()
+    traces = []
+    for rank in range(3):
+        torch.manual_seed(rank + 1)  # the workers draw the other sites independently
+        with ShardMessenger("data", rank, 3, rng_state):
+            traces.append(poutine.trace(model).get_trace())
+    shards = [tr.nodes["_RETURN"]["value"].data for tr in traces]
+    assert [len(shard) for shard in shards] == [3, 3, 4]
+    assert len(set(torch.cat(shards).tolist())) == 10
+    for shard, tr in zip(shards, traces):
+        assert_equal(tr.nodes["x"]["scale"], 100.0 / len(shard))
+    assert not traces[0].nodes["x"]["value"].data.equal(traces[1].nodes["x"]["value"].data[:3])
+
+
+def test_shard_is_local_to_its_context():
+    def model():
+        with pyro.iarange("data", 100, subsample_size=10) as ind:
+            pyro.sample("x", Normal(Variable(torch.zeros(len(ind))), Variable(torch.ones(len(ind)))))
+
+    traces = []
+    with ShardMessenger("data", 0, 2, torch.get_rng_state()):
+        thread = threading.Thread(target=lambda: traces.append(poutine.trace(model).get_trace()))
+        thread.start()
+        thread.join()
+    assert traces[0].nodes["x"]["value"].size(0) == 10
+    assert_equal(traces[0].nodes["x"]["scale"], 10.0)
+
+
+def test_matches_full_batch_svi():
+    data = Variable(torch.arange(0, 6).float())
+    model, guide = make_model(data)
+
+    pyro.clear_param_store()
+    svi = SVI(model, guide, SGD({"lr": 0.01}), "ELBO")
+    expected_losses = [float(svi.step()) for _ in range(3)]
+    expected_mu = pyro.param("mu").data.clone()
+
+    pyro.clear_param_store()
+    svi = DataParallelSVI(model, guide, SGD({"lr": 0.01}), "ELBO", iarange_name="data", num_workers=2)
+    losses = svi.run(3)
+    assert_equal(losses, expected_losses, prec=1e-4)
+    assert_equal(pyro.param("mu").data, expected_mu, prec=1e-5)
+
+
+def _lazy_param_worker(rank, init_method, result_queue):
+    dist.init_process_group("gloo", init_method=init_method, world_size=2, rank=rank)
+    pyro.clear_param_store()
+    torch.manual_seed(rank)
+    data = Variable(torch.arange(0, 8).float())
+
+    def model():
+        mu = pyro.param("mu", Variable(torch.randn(1), requires_grad=True))
+        with pyro.iarange("data", len(data), subsample_size=4) as ind:
+            pyro.observe("obs", Normal(mu.expand(len(ind)), Variable(torch.ones(len(ind)))),
+                         data.index_select(0, ind))
+        if rank == 1:
+            # only touched on one worker
+            pyro.param("extra", Variable(torch.randn(2), requires_grad=True))
+
+    def guide():
+        pass
+
+    svi = DistributedSVI(model, guide, SGD({"lr": 0.01}), "ELBO", iarange_name="data")
+    for _ in range(3):
+        svi.step()
+    result_queue.put((rank, {name: param.data.tolist() for name, param in pyro.get_param_store().named_parameters()}))
+
+
+def test_lazy_params_stay_consistent():
+    init_method = "tcp://127.0.0.1:{}".format(_free_port())
+    context = multiprocessing.get_context("fork")
+    result_queue = context.Queue()
+    workers = [context.Process(target=_lazy_param_worker, args=(rank, init_method, result_queue))
+               for rank in range(2)]
+    for worker in workers:
+        worker.start()
+    results = dict(result_queue.get(timeout=60) for _ in workers)
+    for worker in workers:
+        worker.join()
+    assert set(results[0]) == set(results[1]) == set(["mu", "extra"])
+    assert results[0] == results[1]
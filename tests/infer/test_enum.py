@@ -3,6 +3,7 @@ from __future__ import absolute_import, division, print_function
 import itertools
 import logging
 import math
+import warnings
 
 import pytest
 import torch
@@ -11,8 +12,9 @@ from torch.autograd import Variable
 import pyro
 import pyro.distributions as dist
 import pyro.optim
+import pyro.poutine as poutine
 from pyro.infer import SVI
-from pyro.infer.enum import iter_discrete_traces
+from pyro.infer.enum import iter_discrete_traces, log_marginal_likelihood
 from pyro.infer.trace_elbo import Trace_ELBO
 from pyro.infer.tracegraph_elbo import TraceGraph_ELBO
 from tests.common import assert_equal, xfail_if_not_implemented
@@ -274,3 +276,176 @@ def test_gmm_elbo_gradient(model, guide, enum_discrete, trace_graph):
             "  actual = {}".format(actual_grads[name].data.cpu().numpy()),
         ]))
     assert_equal(actual_grads, expected_grads, prec=0.5)
+
+
+def test_enum_poutine_shapes():
+
+    def model():
+        p = Variable(torch.Tensor([0.3]))
+        x = pyro.sample("x", dist.Bernoulli(p))
+        with pyro.iarange("data", 3):
+            ps = Variable(torch.ones(3, 4)) / 4
+            y = pyro.sample("y", dist.Categorical(ps))
+            z = pyro.sample("z", dist.Bernoulli(0.1 + 0.5 * x.expand(2, 3)))
+        return x, y, z
+
+    trace = poutine.trace(poutine.enum(model, first_available_dim=-2)).get_trace()
+    expected = {"x": ((2, 1), -2), "y": ((4, 1, 3), -3), "z": ((2, 1, 1, 3), -4)}
+    for name, (shape, dim) in expected.items():
+        site = trace.nodes[name]
+        assert site["value"].size() == shape
+        assert site["infer"]["_enum_dim"] == dim
+        values = site["value"].contiguous().view(shape[0], -1)[:, 0].float()
+        assert_equal(values, Variable(torch.arange(0, shape[0]).float()))
+
+
+def bern_model():
+    p = Variable(torch.Tensor([0.25]))
+    pyro.sample("z", dist.Bernoulli(p))
+
+
+def bern_guide():
+    p = pyro.param("p", Variable(torch.Tensor([0.5]), requires_grad=True))
+    pyro.sample("z", dist.Bernoulli(p))
+
+
+def chain_model():
+    x = pyro.sample("x", dist.Bernoulli(Variable(torch.Tensor([0.3]))))
+    pyro.sample("y", dist.Bernoulli(0.2 + 0.6 * x))
+
+
+def chain_guide():
+    px = pyro.param("px", Variable(torch.Tensor([0.4]), requires_grad=True))
+    py = pyro.param("py", Variable(torch.Tensor([0.3, 0.8]), requires_grad=True))
+    x = pyro.sample("x", dist.Bernoulli(px))
+    pyro.sample("y", dist.Bernoulli(py[0] * (1 - x) + py[1] * x))
+
+
+# A Gaussian mixture model that broadcasts against enumerated values.
+def gmm_broadcast_model(data):
+    p = pyro.param("p", Variable(torch.Tensor([0.3]), requires_grad=True))
+    p = torch.cat([p, 1 - p])
+    sigma = pyro.param("sigma", Variable(torch.Tensor([1.0]), requires_grad=True))
+    mus = Variable(torch.Tensor([-1, 1]))
+    with pyro.iarange("data", len(data)) as batch:
+        n = len(batch)
+        z = pyro.sample("z", dist.OneHotCategorical(p.unsqueeze(0).expand(n, 2)))
+        mu = (z * mus).sum(-1)
+        pyro.observe("x", dist.Normal(mu, sigma.expand(n)), data[batch])
+
+
+def gmm_broadcast_guide(data):
+    with pyro.iarange("data", len(data)) as batch:
+        n = len(batch)
+        ps = pyro.param("ps", Variable(torch.ones(n, 1) * 0.6, requires_grad=True))
+        ps = torch.cat([ps, 1 - ps], dim=1)
+        pyro.sample("z", dist.OneHotCategorical(ps))
+
+
+@pytest.mark.parametrize("model,guide,args", [
+    (bern_model, bern_guide, ()),
+    (chain_model, chain_guide, ()),
+    (gmm_broadcast_model, gmm_broadcast_guide, (Variable(torch.Tensor([-1, 1, 9])),)),
+], ids=["bern", "chain", "gmm"])
+def test_parallel_enum_matches_sequential(model, guide, args):
+    pyro.clear_param_store()
+    losses, grads = [], []
+    for enum_discrete in [True, "parallel"]:
+        elbo = Trace_ELBO(enum_discrete=enum_discrete)
+        expected_loss = elbo.loss(model, guide, *args)
+        losses.append(elbo.loss_and_grads(model, guide, *args))
+        assert_equal(losses[-1], expected_loss, prec=1e-5)
+        params = sorted(pyro.get_param_store().get_all_param_names())
+        grads.append({name: pyro.param(name).grad.clone() for name in params})
+        for name in params:
+            pyro.param(name).grad.data.zero_()
+    assert_equal(losses[0], losses[1], prec=1e-5)
+    assert_equal(grads[0], grads[1], prec=1e-5)
+
+
+def test_parallel_enum_svi_step_smoke():
+    pyro.clear_param_store()
+    data = Variable(torch.Tensor([0, 1, 9]))
+    optimizer = pyro.optim.Adam({"lr": .001})
+    inference = SVI(gmm_broadcast_model, gmm_broadcast_guide, optimizer, loss="ELBO", enum_discrete="parallel")
+    for _ in range(2):
+        inference.step(data)
+
+
+# A Gaussian mixture model as in the GMM tutorial, whose assignments are summed out of the model.
+def gmm_marginal_model(data):
+    ps = pyro.param("ps", Variable(torch.Tensor([0.3, 0.7]), requires_grad=True))
+    mus = pyro.param("mus", Variable(torch.Tensor([0.5, 11.0]), requires_grad=True))
+    sigma = pyro.param("sigma", Variable(torch.Tensor([1.0]), requires_grad=True))
+    with pyro.iarange("data", len(data)):
+        z = pyro.sample("z", dist.Categorical(ps.expand(len(data), 2)))
+        pyro.sample("x", dist.Normal(mus[z], sigma.expand(len(data))), obs=data)
+
+
+def gmm_marginal_guide(data):
+    pass
+
+
+def test_log_marginal_likelihood_gmm():
+    pyro.clear_param_store()
+    data = Variable(torch.Tensor([0, 1, 10, 11, 12]))
+    actual = log_marginal_likelihood(gmm_marginal_model, data)
+
+    ps, mus, sigma = pyro.param("ps"), pyro.param("mus"), pyro.param("sigma")
+    expected = 0
+    for x in data:
+        expected = expected + sum(ps[k] * dist.Normal(mus[k], sigma).log_prob(x).exp() for k in range(2)).log()
+    assert_equal(actual, expected.view(-1)[0], prec=1e-5)
+
+
+def test_log_marginal_likelihood_global_local():
+    pyro.clear_param_store()
+    data = Variable(torch.Tensor([0, 1, 3]))
+    pc = Variable(torch.Tensor([0.4, 0.6]))
+    pz = Variable(torch.Tensor([[0.1, 0.2, 0.7], [0.5, 0.3, 0.2]]))
+    mus = Variable(torch.Tensor([0.0, 1.0, 2.0]))
+
+    def model(data):
+        c = pyro.sample("c", dist.Categorical(pc))
+        with pyro.iarange("data", len(data)):
+            z = pyro.sample("z", dist.Categorical(pz[c].expand(pz[c].size()[:-2] + (len(data), 3))))
+            pyro.sample("x", dist.Normal(mus[z], Variable(torch.ones(len(data)))), obs=data)
+
+    actual = log_marginal_likelihood(model, data)
+    expected = 0
+    for c in range(2):
+        likelihood = 1
+        for x in data:
+            likelihood = likelihood * sum(pz[c, k] * dist.Normal(mus[k], Variable(torch.ones(1))).log_prob(x).exp()
+                                          for k in range(3))
+        expected = expected + pc[c] * likelihood
+    assert_equal(actual, expected.log().view(-1)[0], prec=1e-5)
+
+
+def test_log_marginal_likelihood_not_enumerable_error():
+
+    def model():
+        pyro.sample("x", dist.Normal(Variable(torch.zeros(1)), Variable(torch.ones(1))))
+
+    with pytest.raises(ValueError):
+        log_marginal_likelihood(model)
+
+
+def test_parallel_enum_sums_out_model_sites():
+    pyro.clear_param_store()
+    data = Variable(torch.Tensor([0, 1, 10, 11, 12]))
+    elbo = Trace_ELBO(enum_discrete="parallel")
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        loss = elbo.loss_and_grads(gmm_marginal_model, gmm_marginal_guide, data)
+    params = sorted(pyro.get_param_store().get_all_param_names())
+    actual_grads = {name: pyro.param(name).grad.clone() for name in params}
+    for name in params:
+        pyro.param(name).grad.data.zero_()
+
+    # without latent sites in the guide, the ELBO is the log marginal likelihood
+    expected = log_marginal_likelihood(gmm_marginal_model, data)
+    (-expected).backward()
+    expected_grads = {name: pyro.param(name).grad.clone() for name in params}
+    assert_equal(loss, -expected.data.view(-1)[0], prec=1e-4)
+    assert_equal(actual_grads, expected_grads, prec=1e-5)
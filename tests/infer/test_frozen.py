@@ -0,0 +1,113 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import pytest
+import torch
+from torch.autograd import Variable
+
+import pyro
+import pyro.poutine as poutine
+from pyro.distributions import Bernoulli, Normal
+from pyro.infer.frozen import FrozenPredictor, freeze
+
+
+def model(x):
+    w = pyro.sample("w", Normal(Variable(torch.zeros(1)), Variable(torch.ones(1))))
+    with pyro.iarange("data", x.size(0), subsample_size=3) as ind:
+        z = pyro.sample("z", Normal(x[ind], Variable(torch.ones(3, 1))))
+        c = pyro.sample("c", Bernoulli(Variable(0.5 * torch.ones(3, 1))))
+        return pyro.sample("y", Normal(z * w.expand_as(z) + c, Variable(torch.ones(3, 1))))
+
+
+def guide(x):
+    w_loc = pyro.param("w_loc", Variable(torch.Tensor([1.5]), requires_grad=True))
+    w_scale = pyro.param("w_scale", Variable(torch.Tensor([0.1]), requires_grad=True))
+    z_weight = pyro.param("z_weight", Variable(torch.Tensor([[2.0]]), requires_grad=True))
+    pyro.sample("w", Normal(w_loc, w_scale))
+    with pyro.iarange("data", x.size(0), subsample_size=3) as ind:
+        pyro.sample("z", Normal(x[ind].mm(z_weight), Variable(torch.ones(3, 1))))
+
+
+def traced_values(x, sites):
+    guide_trace = poutine.trace(guide).get_trace(x)
+    model_trace = poutine.trace(poutine.replay(model, guide_trace)).get_trace(x)
+    return {name: model_trace.nodes[name]["value"] for name in sites}
+
+
+def assert_identical(actual, expected):
+    assert set(actual) == set(expected)
+    for name in expected:
+        assert torch.equal(actual[name].data, expected[name].data), name
+
+
+@pytest.fixture
+def x():
+    return Variable(torch.Tensor([[float(i)] for i in range(10)]))
+
+
+def test_freeze_holds_params(x):
+    predict = freeze(guide, model, args=(x,))
+    assert list(predict.params) == ["w_loc", "w_scale", "z_weight"]
+    param_store = pyro.get_param_store()
+    for name, param in predict.params.items():
+        assert param is param_store.get_param(name)
+    assert predict.return_sites == ["w", "z", "c", "y"]
+
+
+def test_bit_identical(x):
+    predict = freeze(guide, model, args=(x,), return_sites=["w", "z", "y"])
+    for seed in range(3):
+        pyro.set_rng_seed(seed)
+        expected = traced_values(x, ["w", "z", "y"])
+        pyro.set_rng_seed(seed)
+        assert_identical(predict(x), expected)
+
+
+def test_guide_only(x):
+    predict = freeze(guide, args=(x,))
+    assert predict.return_sites == ["w", "z"]
+    pyro.set_rng_seed(0)
+    guide_trace = poutine.trace(guide).get_trace(x)
+    pyro.set_rng_seed(0)
+    assert_identical(predict(x), {name: guide_trace.nodes[name]["value"] for name in ["w", "z"]})
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_and_load(x, tmpdir, mmap):
+    filename = os.path.join(str(tmpdir), "predictor.ckpt")
+    freeze(guide, model, args=(x,)).save(filename)
+    pyro.clear_param_store()
+    predict = FrozenPredictor.load(filename, mmap=mmap)
+    assert predict.guide is guide and predict.model is model
+    assert list(pyro.get_param_store().get_all_param_names()) == []
+    pyro.set_rng_seed(1)
+    actual = predict(x)
+    guide(x)  # recreate the params at their trained values
+    pyro.set_rng_seed(1)
+    assert_identical(actual, traced_values(x, ["w", "z", "c", "y"]))
+
+
+def test_load_requires_local_guide(x, tmpdir):
+    filename = os.path.join(str(tmpdir), "predictor.ckpt")
+    freeze(lambda x: guide(x), args=(x,)).save(filename)
+    with pytest.raises(ValueError):
+        FrozenPredictor.load(filename)
+    predict = FrozenPredictor.load(filename, guide=guide)
+    assert set(predict(x)) == {"w", "z"}
+
+
+def test_unfrozen_param_error(x):
+    predict = freeze(guide, args=(x,))
+
+    def other_guide(x):
+        pyro.param("other", Variable(torch.zeros(1)))
+
+    with pytest.raises(ValueError):
+        FrozenPredictor(other_guide, predict.params)(x)
+
+
+def test_inside_poutine_error(x):
+    predict = freeze(guide, args=(x,))
+    with pytest.raises(RuntimeError):
+        poutine.trace(predict).get_trace(x)
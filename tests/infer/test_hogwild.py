@@ -0,0 +1,72 @@
+from __future__ import absolute_import, division, print_function
+
+import pytest
+import torch
+from torch.autograd import Variable
+
+import pyro
+from pyro.distributions import Normal
+from pyro.infer.hogwild import HogwildSVI
+from pyro.optim import SGD
+from tests.common import assert_equal
+
+
+def make_regression(num_data=200, subsample_size=20):
+    torch.manual_seed(0)
+    x = Variable(torch.randn(num_data, 2))
+    true_w = Variable(torch.Tensor([[1.5], [-0.5]]))
+    y = x.mm(true_w).squeeze(-1)
+
+    def model():
+        w = pyro.param("w", Variable(torch.zeros(2, 1), requires_grad=True))
+        with pyro.iarange("data", num_data, subsample_size=subsample_size) as ind:
+            ind = Variable(ind.data) if isinstance(ind, Variable) else ind
+            mean = x.index_select(0, ind).mm(w).squeeze(-1)
+            pyro.observe("obs", Normal(mean, Variable(torch.ones(len(ind)) * 0.1)), y.index_select(0, ind))
+
+    def guide():
+        pass
+
+    return model, guide, true_w
+
+
+def test_share_memory():
+    pyro.clear_param_store()
+    pyro.param("a", Variable(torch.zeros(3), requires_grad=True))
+    param_store = pyro.get_param_store()
+    assert not param_store.is_shared()
+    param_store.share_memory()
+    assert param_store.is_shared()
+
+
+@pytest.mark.parametrize("max_staleness", [None, 0, 2])
+def test_hogwild_regression(max_staleness):
+    model, guide, true_w = make_regression()
+    pyro.clear_param_store()
+    num_workers, num_steps = 2, 100
+    svi = HogwildSVI(model, guide, SGD({"lr": 1e-5}), "ELBO", num_workers=num_workers, max_staleness=max_staleness)
+    losses = svi.run(num_steps)
+    assert len(losses) == num_workers * num_steps
+    # the updates of the workers were applied to the params of this process
+    assert_equal(pyro.param("w").data, true_w.data, prec=0.05)
+    assert sum(svi.staleness.values()) == num_workers * num_steps
+    if max_staleness is not None:
+        assert svi.max_observed_staleness() <= (2 * max_staleness + 1) * (num_workers - 1)
+
+
+def test_hogwild_new_param_error():
+    def model():
+        pyro.param("a", Variable(torch.zeros(1), requires_grad=True))
+
+    calls = []
+
+    def guide():
+        # a param that is only created on the workers, after the first call creates the params
+        calls.append(None)
+        if len(calls) > 1:
+            pyro.param("b", Variable(torch.zeros(1), requires_grad=True))
+
+    pyro.clear_param_store()
+    svi = HogwildSVI(model, guide, SGD({"lr": 0.01}), "ELBO", num_workers=2)
+    with pytest.raises(RuntimeError):
+        svi.run(2)
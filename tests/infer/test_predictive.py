@@ -0,0 +1,107 @@
+from __future__ import absolute_import, division, print_function
+
+import math
+import os
+
+import numpy as np
+import pytest
+import torch
+from torch.autograd import Variable
+
+import pyro
+from pyro.distributions import Normal
+from pyro.infer.importance import Importance
+from pyro.infer.predictive import Predictive
+from tests.common import assert_equal
+
+x = Variable(torch.Tensor([-1.0, 0.0, 1.0, 2.0]))
+y = Variable(torch.Tensor([-2.1, 0.1, 1.9, 4.2]))
+
+
+def model(x, y=None):
+    w = pyro.sample("w", Normal(Variable(torch.zeros(1)), Variable(torch.ones(1))))
+    with pyro.iarange("data", x.size(0)):
+        z = pyro.sample("z", Normal(x * w, Variable(torch.ones(x.size()))))
+        return pyro.sample("y", Normal(z, Variable(0.1 * torch.ones(x.size()))), obs=y)
+
+
+def guide(x, y=None):
+    w_loc = pyro.param("w_loc", Variable(torch.Tensor([2.0]), requires_grad=True))
+    z_loc = pyro.param("z_loc", Variable(torch.Tensor([-2.0, 0.0, 2.0, 4.0]), requires_grad=True))
+    pyro.sample("w", Normal(w_loc, Variable(0.1 * torch.ones(1))))
+    with pyro.iarange("data", x.size(0)):
+        pyro.sample("z", Normal(z_loc, Variable(0.1 * torch.ones(x.size()))))
+
+
+@pytest.mark.parametrize("chunk_size", [None, 300, 1000])
+def test_guide_samples(chunk_size):
+    samples = Predictive(model, guide=guide, num_samples=1000, chunk_size=chunk_size)(x)
+    assert set(samples) == {"w", "z", "y"}
+    assert samples["w"].size() == (1000, 1)
+    assert samples["z"].size() == (1000, 4)
+    assert samples["y"].size() == (1000, 4)
+    assert_equal(samples["w"].mean(0), Variable(torch.Tensor([2.0])), prec=0.05)
+    assert_equal(samples["z"].mean(0), pyro.param("z_loc"), prec=0.05)
+    # the predictive sites depend on the sample of the same particle
+    assert_equal((samples["y"] - samples["z"]).std(0), Variable(0.1 * torch.ones(4)), prec=0.03)
+
+
+def test_stream_chunks():
+    starts = []
+    sizes = []
+
+    def callback(start, values):
+        starts.append(start)
+        sizes.append(values["y"].size(0))
+
+    Predictive(model, guide=guide, num_samples=250, chunk_size=100, return_sites=["y"]).stream(callback, x)
+    assert starts == [0, 100, 200]
+    assert sizes == [100, 100, 50]
+
+
+def test_to_memmap(tmpdir):
+    predictive = Predictive(model, guide=guide, num_samples=250, chunk_size=100)
+    pyro.set_rng_seed(0)
+    expected = predictive(x)
+    directory = os.path.join(str(tmpdir), "samples")
+    pyro.set_rng_seed(0)
+    arrays = predictive.to_memmap(directory, x)
+    assert sorted(os.listdir(directory)) == ["w.npy", "y.npy", "z.npy"]
+    for name in ["w", "z", "y"]:
+        loaded = np.load(os.path.join(directory, name + ".npy"), mmap_mode="r")
+        assert loaded.shape == tuple(expected[name].size())
+        assert np.array_equal(loaded, expected[name].data.numpy())
+        assert np.array_equal(arrays[name], loaded)
+
+
+def test_resamples_posterior():
+    posterior = []
+    for w, prob in [(-1.0, 0.1), (1.0, 0.9)]:
+        trace = pyro.poutine.trace(model).get_trace(x, y)
+        trace.nodes["w"]["value"] = Variable(torch.Tensor([w]))
+        posterior.append((trace, Variable(torch.Tensor([math.log(prob)]))))
+    samples = Predictive(model, posterior=posterior, num_samples=2000)(x)
+    w = samples["w"].data.view(-1)
+    assert ((w == 1.0) | (w == -1.0)).all()
+    assert abs(float((w == 1.0).float().mean()) - 0.9) < 0.03
+    # the latent sites of a sample come from the same trace
+    for i in [0, 1]:
+        z = posterior[i][0].nodes["z"]["value"]
+        assert_equal(samples["z"][w == posterior[i][0].nodes["w"]["value"].data[0]][0], z)
+    assert_equal((samples["y"] - samples["z"]).std(0), Variable(0.1 * torch.ones(4)), prec=0.03)
+
+
+def test_importance_posterior():
+    posterior = Importance(model, guide, num_samples=20).get_traces(x, y)
+    assert len(posterior) == 20
+    samples = Predictive(model, posterior=posterior, num_samples=500, chunk_size=200)(x)
+    values = set(float(trace.nodes["w"]["value"]) for trace, _ in posterior)
+    assert set(float(w) for w in samples["w"].data.view(-1)) <= values
+    assert samples["y"].size() == (500, 4)
+
+
+def test_guide_or_posterior_required():
+    with pytest.raises(ValueError):
+        Predictive(model)
+    with pytest.raises(ValueError):
+        Predictive(model, guide=guide, posterior=[])
@@ -8,6 +8,7 @@ from torch.autograd import Variable
 
 import pyro
 import pyro.infer
+import pyro.poutine as poutine
 from pyro.distributions import Bernoulli, Normal
 from tests.common import assert_equal
 
@@ -100,6 +101,34 @@ class SearchTest(HMMSamplingTestCase):
         for i in range(4):
             assert i + 1 in tr_rets
 
+    def test_parallel_matches_serial(self):
+        def weighted_latents(posterior):
+            result = []
+            for tr, log_weight in posterior._traces():
+                latents = tuple(float(tr.nodes[name]["value"].view(-1).data[0])
+                                for name in tr.nodes.keys()
+                                if tr.nodes[name]["type"] == "sample" and not tr.nodes[name]["is_observed"])
+                result.append((latents, float(log_weight.data[0])))
+            return sorted(result)
+
+        expected = weighted_latents(pyro.infer.Search(self.model))
+        actual = weighted_latents(pyro.infer.Search(self.model, num_workers=2))
+        assert len(actual) == 2 ** self.model_steps
+        assert [latents for latents, _ in actual] == [latents for latents, _ in expected]
+        for (_, actual_weight), (_, expected_weight) in zip(actual, expected):
+            assert_equal(actual_weight, expected_weight, prec=1e-5)
+
+    def test_max_tries(self):
+        # the model never completes a trace
+        model = poutine.escape(self.model, lambda msg: msg["type"] == "sample")
+        with pytest.raises(ValueError):
+            list(pyro.infer.Search(model, max_tries=1)._traces())
+
+    def test_parallel_max_tries(self):
+        model = poutine.escape(self.model, lambda msg: msg["type"] == "sample")
+        with pytest.raises(ValueError):
+            list(pyro.infer.Search(model, max_tries=1, num_workers=2)._traces())
+
 
 class ImportanceTest(NormalNormalSamplingTestCase):
 
@@ -122,3 +151,21 @@ class ImportanceTest(NormalNormalSamplingTestCase):
         posterior_stddev = torch.std(torch.cat(posterior_samples), 0)
         assert_equal(0, torch.norm(posterior_mean - self.mu_mean).data[0], prec=0.01)
         assert_equal(0, torch.norm(posterior_stddev - self.mu_stddev).data[0], prec=0.1)
+
+    def test_parallel_importance(self):
+        def draw():
+            pyro.set_rng_seed(0)
+            posterior = pyro.infer.Importance(self.model, guide=self.guide, num_samples=20, num_workers=3)
+            samples = []
+            for tr, log_weight in posterior._traces():
+                guide_trace = poutine.trace(poutine.replay(self.guide, tr)).get_trace()
+                assert_equal(log_weight, tr.log_pdf() - guide_trace.log_pdf(), prec=1e-4)
+                samples.append(float(tr.nodes["mu"]["value"].data[0]))
+            return sorted(samples)
+
+        samples = draw()
+        assert len(samples) == 20
+        # the workers have independent random number generators
+        assert len(set(samples)) == 20
+        # which are seeded from the random number generator of the parent
+        assert draw() == samples
@@ -0,0 +1,97 @@
+from __future__ import absolute_import, division, print_function
+
+import pytest
+import torch
+from torch.autograd import Variable
+
+import pyro
+from pyro.distributions import Normal
+from tests.common import assert_equal
+
+pytest.importorskip("asyncio")
+pytest.importorskip("concurrent.futures")
+
+from pyro.infer.serving import LATENCY_BUCKETS, LocalClient, PredictiveServer  # noqa: E402
+
+
+def model(x):
+    w = pyro.sample("w", Normal(Variable(torch.zeros(1)), Variable(torch.ones(1))))
+    with pyro.iarange("data", x.size(0)):
+        z = pyro.sample("z", Normal(x, Variable(1e-3 * torch.ones(x.size()))))
+        return pyro.sample("y", Normal(z + w.expand_as(z), Variable(1e-3 * torch.ones(x.size()))))
+
+
+def guide(x):
+    w_loc = pyro.param("w_loc", Variable(torch.zeros(1)))
+    pyro.sample("w", Normal(w_loc, Variable(1e-3 * torch.ones(1))))
+    with pyro.iarange("data", x.size(0)):
+        pyro.sample("z", Normal(x, Variable(1e-3 * torch.ones(x.size()))))
+
+
+def inputs(n):
+    return [Variable(torch.Tensor([[10.0 * i + j] for j in range(i + 1)])) for i in range(n)]
+
+
+def test_predict_batch_splits_local_sites():
+    pyro.param("w_loc", Variable(torch.Tensor([100.0])))
+    server = PredictiveServer(model, guide, return_sites=["w", "z", "y", "_RETURN"])
+    xs = inputs(3)
+    results = server.predict_batch([(x,) for x in xs])
+    server.close()
+    assert len(results) == 3
+    for x, result in zip(xs, results):
+        assert result["w"] is results[0]["w"]
+        assert_equal(result["z"], x, prec=0.1)
+        assert_equal(result["y"], x + 100.0, prec=0.1)
+        assert_equal(result["_RETURN"], result["y"])
+
+
+def test_default_return_sites():
+    server = PredictiveServer(model, guide)
+    results = server.predict_batch([(x,) for x in inputs(2)])
+    server.close()
+    assert set(results[0]) == {"w", "z", "y"}
+
+
+def test_client_batches_requests():
+    xs = inputs(8)
+    with LocalClient(PredictiveServer(model, guide, max_batch_size=4, max_latency=0.5)) as client:
+        futures = [client.submit(x) for x in xs]
+        results = [future.result() for future in futures]
+        server = client.server
+    for x, result in zip(xs, results):
+        assert_equal(result["y"], x, prec=0.1)
+    assert server.batch_sizes == {4: 2}
+    assert server.mean_batch_size() == 4.0
+    assert sum(server.latencies.values()) == 8
+    assert set(server.latencies) <= set(LATENCY_BUCKETS)
+
+
+def test_client_serves_late_requests():
+    with LocalClient(PredictiveServer(model, guide, max_batch_size=4, max_latency=0.001)) as client:
+        for x in inputs(3):
+            assert_equal(client.predict(x)["y"], x, prec=0.1)
+        server = client.server
+    assert sum(server.batch_sizes.values()) == 3
+
+
+def test_server_uses_its_param_store():
+    with pyro.param_store_scope():
+        pyro.param("w_loc", Variable(torch.Tensor([-5.0])))
+        server = PredictiveServer(model, guide)
+    with LocalClient(server) as client:
+        x = inputs(1)[0]
+        assert_equal(client.predict(x)["y"], x - 5.0, prec=0.1)
+    assert "w_loc" not in pyro.get_param_store().get_all_param_names()
+
+
+def test_errors_reach_all_requests():
+    def bad_guide(x):
+        raise ValueError("bad guide")
+
+    with LocalClient(PredictiveServer(model, bad_guide, max_latency=0.5)) as client:
+        futures = [client.submit(x) for x in inputs(3)]
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result()
+    assert client.server.batch_sizes == {3: 1}
@@ -0,0 +1,90 @@
+from __future__ import absolute_import, division, print_function
+
+import pytest
+import torch
+from torch.autograd import Variable
+
+import pyro
+import pyro.distributions as dist
+from pyro.distributions.testing import fakes
+from pyro.infer.trace_elbo import Trace_ELBO
+from pyro.infer.tracegraph_elbo import TraceGraph_ELBO
+from tests.common import assert_equal
+
+data = Variable(torch.Tensor([-0.5, 2.0, 1.0]))
+
+
+def model(extra=False):
+    with pyro.iarange("data", len(data), 2) as ind:
+        z = pyro.sample("z", fakes.NonreparameterizedNormal(Variable(torch.zeros(2)), Variable(torch.ones(2))))
+        pyro.sample("x", dist.Normal(z, Variable(torch.ones(2))), obs=data[ind])
+    if extra:
+        pyro.sample("y", dist.Normal(Variable(torch.zeros(1)), Variable(torch.ones(1))))
+
+
+def guide(extra=False):
+    mu = pyro.param("mu", Variable(torch.zeros(len(data)), requires_grad=True))
+    sigma = pyro.param("sigma", Variable(torch.ones(1), requires_grad=True))
+    with pyro.iarange("data", len(data), 2) as ind:
+        pyro.sample("z", fakes.NonreparameterizedNormal(mu[ind], sigma.expand(2)))
+    if extra:
+        pyro.sample("y", dist.Normal(mu[:1], sigma))
+
+
+def get_loss_and_grads(elbo, extra):
+    pyro.util.zero_grads(dict(pyro.get_param_store().named_parameters()).values())
+    pyro.set_rng_seed(0)
+    loss = elbo.loss_and_grads(model, guide, extra=extra)
+    params = dict(pyro.get_param_store().named_parameters())
+    return loss, {name: param.grad.data.clone() for name, param in params.items()}
+
+
+@pytest.mark.parametrize("num_particles", [1, 3])
+def test_static_structure_matches_default(num_particles):
+    pyro.clear_param_store()
+    default_elbo = Trace_ELBO(num_particles=num_particles)
+    static_elbo = Trace_ELBO(num_particles=num_particles, static_structure=True)
+    for extra in [False, False, True, True, False]:
+        expected_loss, expected_grads = get_loss_and_grads(default_elbo, extra)
+        actual_loss, actual_grads = get_loss_and_grads(static_elbo, extra)
+        assert_equal(actual_loss, expected_loss)
+        assert_equal(actual_grads, expected_grads)
+
+
+def test_structure_is_recorded_once():
+    pyro.clear_param_store()
+    elbo = Trace_ELBO(static_structure=True)
+    elbo.loss_and_grads(model, guide)
+    structure = elbo._static_structure
+    assert structure.replay_sites == {"data": "data", "z": "z"}
+    assert structure.model_subsample_sites == ["data"]
+    elbo.loss_and_grads(model, guide)
+    assert elbo._static_structure is structure
+
+    # a change of structure falls back to the full checks and is recorded again
+    elbo.loss_and_grads(model, guide, extra=True)
+    assert elbo._static_structure is not structure
+    assert elbo._static_structure.replay_sites == {"data": "data", "z": "z", "y": "y"}
+
+
+def test_tracegraph_structure_cache():
+    pyro.clear_param_store()
+    elbo = TraceGraph_ELBO()
+    uncached_elbo = TraceGraph_ELBO()
+    for step, extra in enumerate([False, False, True, True, False]):
+        uncached_elbo.structure_cache.clear()
+        expected_loss, expected_grads = get_loss_and_grads(uncached_elbo, extra)
+        actual_loss, actual_grads = get_loss_and_grads(elbo, extra)
+        assert_equal(actual_loss, expected_loss)
+        assert_equal(actual_grads, expected_grads)
+        assert uncached_elbo.structure_cache.misses == 1
+    # iarange subsampling does not change the structure
+    assert elbo.structure_cache.misses == 2
+    assert elbo.structure_cache.hits == 3
+    assert len(elbo.structure_cache) == 2
+
+    elbo.structure_cache.max_size = 1
+    get_loss_and_grads(elbo, True)
+    get_loss_and_grads(elbo, False)
+    assert elbo.structure_cache.misses == 3
+    assert len(elbo.structure_cache) == 1
@@ -0,0 +1,74 @@
+from __future__ import absolute_import, division, print_function
+
+import pytest
+import torch
+from torch.autograd import Variable
+
+import pyro
+import pyro.distributions as dist
+from pyro.distributions.testing import fakes
+from pyro.infer.trace_elbo import Trace_ELBO
+from tests.common import assert_equal
+
+data = Variable(torch.Tensor([[-0.5, 2.0], [1.0, 0.5], [0.0, -1.0]]))
+
+
+def model(reparameterized):
+    Normal = dist.Normal if reparameterized else fakes.NonreparameterizedNormal
+    mu = pyro.sample("mu", Normal(Variable(torch.zeros(1)), Variable(torch.ones(1))))
+    with pyro.iarange("data", len(data)) as ind:
+        z = pyro.sample("z", Normal(mu.unsqueeze(-1) + Variable(torch.zeros(3, 2)), Variable(torch.ones(3, 2))))
+        pyro.sample("x", dist.Normal(z, Variable(torch.ones(3, 2))), obs=data[ind])
+    # an observation that does not depend on the particles
+    pyro.sample("y", dist.Normal(pyro.param("loc", Variable(torch.zeros(1), requires_grad=True)),
+                                 Variable(torch.ones(1))), obs=Variable(torch.ones(1)))
+
+
+def guide(reparameterized):
+    Normal = dist.Normal if reparameterized else fakes.NonreparameterizedNormal
+    mu_loc = pyro.param("mu_loc", Variable(torch.zeros(1), requires_grad=True))
+    z_loc = pyro.param("z_loc", Variable(torch.zeros(len(data), 2), requires_grad=True))
+    mu = pyro.sample("mu", Normal(mu_loc, Variable(torch.ones(1))))
+    with pyro.iarange("data", len(data)) as ind:
+        # the second site depends on the particles through mu
+        pyro.sample("z", Normal(z_loc[ind] + mu.unsqueeze(-1), Variable(torch.ones(3, 2))))
+
+
+def get_loss_and_grads(elbo, reparameterized):
+    pyro.util.zero_grads(dict(pyro.get_param_store().named_parameters()).values())
+    pyro.set_rng_seed(0)
+    loss = elbo.loss_and_grads(model, guide, reparameterized)
+    params = dict(pyro.get_param_store().named_parameters())
+    return loss, {name: param.grad.data.clone() for name, param in params.items()}
+
+
+@pytest.mark.parametrize("reparameterized", [True, False])
+def test_single_vectorized_particle_matches_loop(reparameterized):
+    pyro.clear_param_store()
+    elbo = Trace_ELBO(vectorize_particles=True)
+    get_loss_and_grads(elbo, reparameterized)  # create the params and record the shapes
+    expected_loss, expected_grads = get_loss_and_grads(Trace_ELBO(), reparameterized)
+    for _ in range(2):
+        actual_loss, actual_grads = get_loss_and_grads(elbo, reparameterized)
+        assert_equal(actual_loss, expected_loss, prec=1e-5)
+        assert_equal(actual_grads, expected_grads, prec=1e-5)
+
+
+@pytest.mark.parametrize("reparameterized", [True, False])
+def test_vectorized_particles_match_loop(reparameterized):
+    pyro.clear_param_store()
+    num_particles = 2000
+    expected_loss, expected_grads = get_loss_and_grads(Trace_ELBO(num_particles=num_particles), reparameterized)
+    elbo = Trace_ELBO(num_particles=num_particles, vectorize_particles=True)
+    actual_loss, actual_grads = get_loss_and_grads(elbo, reparameterized)
+    assert elbo._particle_shapes.log_pdf_dims["model", "y"] == 1
+    assert_equal(actual_loss, expected_loss, prec=0.3)
+    assert_equal(elbo.loss(model, guide, reparameterized), expected_loss, prec=0.3)
+    # score function gradients are too noisy to compare
+    if reparameterized:
+        assert_equal(actual_grads, expected_grads, prec=0.3)
+
+
+def test_vectorized_particles_not_supported_with_enum_discrete():
+    with pytest.raises(NotImplementedError):
+        Trace_ELBO(num_particles=2, enum_discrete=True, vectorize_particles=True)
@@ -1,7 +1,10 @@
 from __future__ import absolute_import, division, print_function
 
+import copy
+import os
 from unittest import TestCase
 
+import pytest
 import torch
 from torch.autograd import Variable
 
@@ -9,10 +12,15 @@ import pyro
 import pyro.optim as optim
 from pyro.distributions import Normal
 from pyro.infer import SVI
+from tests.common import assert_equal
 
 
 class OptimTests(TestCase):
 
+    @pytest.fixture(autouse=True)
+    def _tmpdir(self, tmpdir):
+        self.tmpdir = str(tmpdir)
+
     def setUp(self):
         # normal-normal; known covariance
         self.lam0 = Variable(torch.Tensor([0.1]))  # precision of prior
@@ -61,10 +69,11 @@ class OptimTests(TestCase):
 
         svi.step()
         adam_initial_step_count = list(adam.get_state()['mu_q']['state'].items())[0][1]['step']
-        adam.save('adam.unittest.save')
+        filename = os.path.join(self.tmpdir, 'adam.unittest.save')
+        adam.save(filename)
         svi.step()
         adam_final_step_count = list(adam.get_state()['mu_q']['state'].items())[0][1]['step']
-        adam2.load('adam.unittest.save')
+        adam2.load(filename)
         svi2.step()
         adam2_step_count_after_load_and_step = list(adam2.get_state()['mu_q']['state'].items())[0][1]['step']
 
@@ -75,3 +84,116 @@ class OptimTests(TestCase):
         free_param_unchanged = torch.equal(pyro.param(free_param).data, torch.zeros(1))
         fixed_param_unchanged = torch.equal(pyro.param(fixed_param).data, torch.zeros(1))
         assert fixed_param_unchanged and not free_param_unchanged
+
+
+def grouped_model(use_b=True):
+    pyro.sample("x", Normal(Variable(torch.zeros(2)), Variable(torch.ones(2))))
+
+
+def grouped_guide(use_b=True):
+    loc = pyro.param("a", Variable(torch.zeros(2), requires_grad=True))
+    if use_b:
+        loc = loc + pyro.param("b", Variable(torch.zeros(2), requires_grad=True))
+    loc = loc + pyro.param("c", Variable(torch.zeros(2), requires_grad=True))
+    pyro.sample("x", Normal(loc, Variable(torch.ones(2))))
+
+
+def run_grouped_steps(make_optim, guide_kwargs, params=None, state=None):
+    pyro.clear_param_store()
+    if params is not None:
+        for name, value in params.items():
+            pyro.param(name, Variable(value.clone(), requires_grad=True))
+    adam = make_optim()
+    if state is not None:
+        adam.set_state(state)
+    svi = SVI(grouped_model, grouped_guide, adam, loss="ELBO")
+    for kwargs in guide_kwargs:
+        pyro.set_rng_seed(0)
+        svi.step(**kwargs)
+    params = {name: pyro.param(name).data.clone() for name in "abc"}
+    return params, adam
+
+
+@pytest.mark.parametrize("optim_args", [
+    {"lr": 0.1},
+    lambda module_name, param_name, tags: {"lr": 0.2 if param_name == "b" else 0.1},
+])
+def test_grouped_matches_per_param(optim_args):
+    # b is only active in some steps, and must not be updated in the others
+    guide_kwargs = [{"use_b": True}, {"use_b": False}, {"use_b": True}]
+    expected, _ = run_grouped_steps(lambda: optim.Adam(optim_args), guide_kwargs)
+    actual, adam = run_grouped_steps(lambda: optim.Adam(optim_args, grouped=True), guide_kwargs)
+    for name in "abc":
+        assert_equal(actual[name], expected[name])
+    assert len(adam._grouped_optims) == (1 if isinstance(optim_args, dict) else 2)
+
+
+@pytest.mark.parametrize("grouped_first", [True, False])
+def test_grouped_state_is_per_param(grouped_first):
+    guide_kwargs = [{"use_b": True}, {"use_b": False}]
+    params, adam = run_grouped_steps(lambda: optim.Adam({"lr": 0.1}, grouped=grouped_first), guide_kwargs)
+    state = adam.get_state()
+    assert set(state) == set("abc")
+    assert list(state["b"]["state"].values())[0]["step"] == 1
+    assert list(state["a"]["state"].values())[0]["step"] == 2
+
+    # resuming in the other mode gives the same result as continuing
+    expected, _ = run_grouped_steps(lambda: optim.Adam({"lr": 0.1}, grouped=grouped_first), guide_kwargs * 2)
+    actual, _ = run_grouped_steps(lambda: optim.Adam({"lr": 0.1}, grouped=not grouped_first), guide_kwargs,
+                                  params=params, state=state)
+    for name in "abc":
+        assert_equal(actual[name], expected[name])
+
+
+def run_multi_tensor_steps(optim_class, optim_args, multi_tensor):
+    torch.manual_seed(0)
+    sizes = [(2, 3), (4,), (1,), (3, 2, 2)]
+    params = [Variable(torch.randn(*size), requires_grad=True) for size in sizes]
+    optimizer = optim_class(params[:3], multi_tensor=multi_tensor, **optim_args)
+    for step in range(6):
+        if step == 2:
+            # the new param has a different step count than the others
+            optimizer.add_param_group({"params": [params[3]]})
+        active = params[:4] if step != 3 else params[1:4]
+        loss = sum((p * p * p).sum() for p in active)
+        for p in params:
+            p.grad = None
+        loss.backward()
+        optimizer.step()
+    return params, optimizer
+
+
+@pytest.mark.parametrize("optim_class,optim_args", [
+    (optim.pt_ClippedAdam, {"lr": 0.1, "clip_norm": 2.0}),
+    (optim.pt_ClippedAdam, {"lr": 0.1, "weight_decay": 0.1, "lrd": 0.9}),
+    (optim.pt_AdagradRMSProp, {"eta": 0.5}),
+])
+def test_multi_tensor_matches_per_param(optim_class, optim_args):
+    expected_params, expected_optim = run_multi_tensor_steps(optim_class, optim_args, multi_tensor=False)
+    actual_params, actual_optim = run_multi_tensor_steps(optim_class, optim_args, multi_tensor=True)
+    for expected, actual in zip(expected_params, actual_params):
+        assert_equal(actual.data, expected.data, prec=0)
+    expected_state = expected_optim.state_dict()["state"]
+    actual_state = actual_optim.state_dict()["state"]
+    assert_equal(actual_state, expected_state, prec=0)
+
+    # the optimizer can be restored into either mode
+    actual_optim.load_state_dict(copy.deepcopy(expected_optim.state_dict()))
+    for p in expected_params + actual_params:
+        p.grad = Variable(torch.ones(p.size()))
+    actual_optim.step()
+    expected_optim.step()
+    for expected, actual in zip(expected_params, actual_params):
+        assert_equal(actual.data, expected.data, prec=0)
+
+
+@pytest.mark.parametrize("make_optim", [optim.ClippedAdam, optim.AdagradRMSProp])
+def test_grouped_multi_tensor_matches_per_param(make_optim):
+    guide_kwargs = [{"use_b": True}, {"use_b": False}, {"use_b": True}, {"use_b": True}]
+    expected, _ = run_grouped_steps(lambda: make_optim({}), guide_kwargs)
+    actual, pyro_optim = run_grouped_steps(lambda: make_optim({"multi_tensor": True}, grouped=True), guide_kwargs)
+    for name in "abc":
+        assert_equal(actual[name], expected[name], prec=0)
+    # the params of the single shared optimizer are updated together
+    shared_optim, = pyro_optim._grouped_optims.values()
+    assert len(shared_optim.param_groups) == 3
@@ -0,0 +1,179 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import pytest
+import six
+import torch
+from torch.autograd import Variable
+
+import pyro
+import pyro.distributions as dist
+import pyro.optim as optim
+from pyro.infer import SVI
+from pyro.params.checkpoint import Checkpoint, load_checkpoint, save_checkpoint, write_checkpoint
+from pyro.params.checkpoint_manager import CheckpointManager
+from pyro.util import ng_ones
+from tests.common import assert_equal
+
+
+def model():
+    loc = pyro.param("loc", Variable(torch.zeros(2), requires_grad=True), tags="locs")
+    pyro.sample("x", dist.Normal(loc, ng_ones(2)), obs=Variable(torch.ones(2)))
+
+
+def guide():
+    pyro.param("scale", Variable(torch.ones(3, 2), requires_grad=True), tags=["scales", "all"])
+    pyro.param("counts", Variable(torch.arange(0, 4).long()))
+
+
+def train(adam, num_steps):
+    svi = SVI(model, guide, adam, loss="ELBO")
+    for _ in range(num_steps):
+        svi.step()
+
+
+def get_params():
+    return {name: param.data.clone() for name, param in pyro.get_param_store().named_parameters()}
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_and_load(tmpdir, mmap):
+    filename = os.path.join(str(tmpdir), "params.ckpt")
+    pyro.clear_param_store()
+    adam = optim.Adam({"lr": 0.1})
+    train(adam, 2)
+    save_checkpoint(filename, optim=adam, extra={"step": 2})
+    train(adam, 2)
+    expected = get_params()
+
+    pyro.clear_param_store()
+    adam = optim.Adam({"lr": 0.1})
+    checkpoint = load_checkpoint(filename, optim=adam, mmap=mmap)
+    assert checkpoint.extra == {"step": 2}
+    assert set(checkpoint.param_names()) == set(["loc", "scale", "counts"])
+    store = pyro.get_param_store()
+    assert store.get_param_tags("scale") == set(["scales", "all"])
+    assert pyro.param("counts").data.type() == "torch.LongTensor"
+    assert pyro.param("scale").requires_grad and not pyro.param("counts").requires_grad
+    # the moments of the optimizer are restored too
+    train(adam, 2)
+    assert_equal(get_params(), expected)
+
+
+def test_load_subset(tmpdir):
+    filename = os.path.join(str(tmpdir), "params.ckpt")
+    pyro.clear_param_store()
+    adam = optim.Adam({"lr": 0.1})
+    train(adam, 1)
+    expected = get_params()
+    save_checkpoint(filename, optim=adam)
+
+    checkpoint = Checkpoint(filename)
+    assert checkpoint.param_names(tags="all") == ["scale"]
+    assert set(checkpoint.param_names(names=["loc"], tags=["scales"])) == set(["loc", "scale"])
+    assert_equal(checkpoint.tensor("loc"), expected["loc"])
+    assert set(checkpoint.optim_state(names=["loc"])) == set(["loc"])
+
+    pyro.clear_param_store()
+    load_checkpoint(filename, optim=adam, tags="locs")
+    assert list(pyro.get_param_store().get_all_param_names()) == ["loc"]
+    assert_equal(pyro.param("loc").data, expected["loc"])
+
+
+def test_unicode_strings(tmpdir):
+    # the strings of a loaded header, e.g. its tags, are unicode on Python 2
+    filename = os.path.join(str(tmpdir), "params.ckpt")
+    loc = Variable(torch.zeros(2))
+    optim_state = {"loc": {"param_groups": [{"mode": six.text_type("fast")}], "state": {}}}
+    write_checkpoint(filename, [("loc", loc, [six.text_type("locs")])], optim_state)
+    checkpoint = Checkpoint(filename)
+    assert checkpoint.param_names(tags=six.text_type("locs")) == ["loc"]
+    assert checkpoint.header["optim"]["loc"]["param_groups"][0]["mode"] == "fast"
+
+
+def test_not_a_checkpoint(tmpdir):
+    filename = os.path.join(str(tmpdir), "params.ckpt")
+    pyro.clear_param_store()
+    pyro.param("loc", Variable(torch.zeros(2), requires_grad=True))
+    pyro.get_param_store().save(filename)
+    with pytest.raises(ValueError):
+        Checkpoint(filename)
+
+
+def test_checkpoint_manager(tmpdir):
+    directory = os.path.join(str(tmpdir), "checkpoints")
+    pyro.clear_param_store()
+    adam = optim.Adam({"lr": 0.1})
+    train(adam, 1)
+    manager = CheckpointManager(directory, optim=adam, interval_steps=2)
+    assert manager.maybe_save(1, extra={"step": 1})
+    expected = get_params()
+    # the checkpoint is a snapshot of the time of the call
+    train(adam, 1)
+    assert not manager.maybe_save(2)
+    manager.wait()
+    assert manager.latest() == manager.filename(1)
+
+    pyro.clear_param_store()
+    checkpoint = load_checkpoint(manager.latest(), optim=adam)
+    assert checkpoint.extra == {"step": 1}
+    assert_equal(get_params(), expected)
+    assert manager.maybe_save(3)
+    manager.close()
+    assert manager.steps() == [1, 3]
+
+
+def test_checkpoint_manager_incremental(tmpdir):
+    directory = os.path.join(str(tmpdir), "checkpoints")
+    pyro.clear_param_store()
+    adam = optim.Adam({"lr": 0.1})
+    train(adam, 1)
+    manager = CheckpointManager(directory, optim=adam, keep_last=1)
+    manager.save(0)
+    pyro.param("loc").data.fill_(2)
+    manager.save(1)
+    manager.close()
+    expected = get_params()
+
+    # only loc changed, so the rest is read from the first checkpoint, which must be kept
+    checkpoint = Checkpoint(manager.filename(1))
+    assert checkpoint.referenced_files() == set([os.path.basename(manager.filename(0))])
+    assert manager.steps() == [0, 1]
+    pyro.clear_param_store()
+    load_checkpoint(manager.filename(1))
+    assert_equal(get_params(), expected)
+
+    # the first checkpoint is deleted once nothing refers to it anymore
+    manager = CheckpointManager(directory, keep_last=1, incremental=False)
+    manager.save(2)
+    manager.close()
+    assert manager.steps() == [2]
+    assert sorted(os.listdir(directory)) == [os.path.basename(manager.filename(2))]
+
+
+def test_checkpoint_manager_retention(tmpdir):
+    directory = os.path.join(str(tmpdir), "checkpoints")
+    pyro.clear_param_store()
+    pyro.param("loc", Variable(torch.zeros(2), requires_grad=True))
+    manager = CheckpointManager(directory, keep_last=2, keep_every=4, incremental=False)
+    for step in range(10):
+        manager.save(step)
+    manager.close()
+    assert manager.steps() == [0, 4, 8, 9]
+    assert len(os.listdir(directory)) == 4
+
+
+@pytest.mark.parametrize("keep_last", [3, 5])
+def test_checkpoint_manager_keep_last(tmpdir, keep_last):
+    directory = os.path.join(str(tmpdir), "checkpoints")
+    pyro.clear_param_store()
+    pyro.param("loc", Variable(torch.zeros(2), requires_grad=True))
+    manager = CheckpointManager(directory, keep_last=keep_last, incremental=False)
+    for step in range(10):
+        manager.save(step)
+        manager.wait()
+        assert manager.steps() == list(range(max(0, step + 1 - keep_last), step + 1))
+    manager.close()
+    assert manager.steps() == list(range(10 - keep_last, 10))
+    assert len(os.listdir(directory)) == keep_last
@@ -1,19 +1,29 @@
 from __future__ import absolute_import, division, print_function
 
+import os
 from copy import copy
 from unittest import TestCase
 
 import numpy as np
+import pytest
 import torch
 import torch.optim
 from torch import nn as nn
 from torch.autograd import Variable
 
 import pyro
+import pyro.distributions as dist
+from pyro.infer import SVI
+from pyro.optim import Adam
+from pyro.util import ng_ones
 
 
 class ParamStoreDictTests(TestCase):
 
+    @pytest.fixture(autouse=True)
+    def _tmpdir(self, tmpdir):
+        self.tmpdir = str(tmpdir)
+
     def setUp(self):
         pyro.clear_param_store()
         self.linear_module = nn.Linear(3, 2)
@@ -40,11 +50,12 @@ class ParamStoreDictTests(TestCase):
         assert len(list(param_store_params.keys())) == 5
         assert len(list(param_store_param_to_name.values())) == 5
 
-        pyro.get_param_store().save('paramstore.unittest.out')
+        filename = os.path.join(self.tmpdir, 'paramstore.unittest.out')
+        pyro.get_param_store().save(filename)
         pyro.clear_param_store()
         assert len(list(pyro.get_param_store()._params)) == 0
         assert len(list(pyro.get_param_store()._param_to_name)) == 0
-        pyro.get_param_store().load('paramstore.unittest.out')
+        pyro.get_param_store().load(filename)
 
         def modules_are_equal():
             weights_equal = np.sum(np.fabs(self.linear_module3.weight.data.cpu().numpy() -
@@ -68,3 +79,104 @@ class ParamStoreDictTests(TestCase):
         assert sorted(param_store_params.keys()) == sorted(store._params.keys())
         assert sorted(param_store_param_to_name.values()) == sorted(store._param_to_name.values())
         assert sorted(store._params.keys()) == sorted(store._param_to_name.values())
+
+
+def flat_model():
+    pyro.sample("x", dist.Normal(pyro.param("loc", Variable(torch.zeros(2), requires_grad=True)),
+                                 ng_ones(2)), obs=Variable(torch.ones(2)))
+
+
+def flat_guide():
+    pass
+
+
+def run_svi_steps(flat, num_steps=3):
+    pyro.clear_param_store()
+    pyro.get_param_store().set_flat_buffers(flat)
+    pyro.param("scale", Variable(torch.ones(3, 2), requires_grad=True), tags="scales")
+    svi = SVI(flat_model, flat_guide, Adam({"lr": 0.1}), loss="ELBO")
+    for _ in range(num_steps):
+        svi.step()
+    return {name: param.data.clone() for name, param in pyro.get_param_store().named_parameters()}
+
+
+def test_flat_buffers():
+    store = pyro.get_param_store()
+    pyro.clear_param_store()
+    store.set_flat_buffers(True)
+    a = pyro.param("a", Variable(torch.ones(2), requires_grad=True))
+    b = pyro.param("b", Variable(2 * torch.ones(3, 4), requires_grad=True), tags="b_tag")
+    c = pyro.param("c", Variable(3 * torch.ones(5), requires_grad=True))
+    buffers = store.get_flat_buffers()
+    assert len(buffers) == 1 and len(buffers[0]) == 3
+    assert buffers[0].numel == 19
+
+    # the params keep their values after the buffer grew, and are views into it
+    for param, value in [(a, 1), (b, 2), (c, 3)]:
+        assert (param.data == value).all()
+    buffers[0].data.narrow(0, 2, 12).fill_(4)
+    assert (b.data == 4).all()
+    assert pyro.param("b") is b
+    assert store.param_name(b) == "b"
+    assert store.get_param_tags("b") == set(["b_tag"])
+
+    (a.sum() + (b * b).sum()).backward()
+    assert (buffers[0].grad.narrow(0, 0, 14) != 0).all()
+    store.zero_grads([a])
+    assert (buffers[0].grad == 0).all()
+    assert (b.grad.data == 0).all()
+
+    store.set_flat_buffers(False)
+    assert store.get_flat_buffers() == []
+    buffers[0].data.fill_(0)
+    assert (b.data == 4).all()
+
+
+def test_flat_buffers_set_state_reclaims_space():
+    store = pyro.get_param_store()
+    pyro.clear_param_store()
+    store.set_flat_buffers(True)
+    pyro.param("a", Variable(torch.ones(2), requires_grad=True))
+    pyro.param("b", Variable(2 * torch.ones(3, 4), requires_grad=True))
+    pyro.param("c", Variable(3 * torch.ones(5), requires_grad=True))
+    state = store.get_state()
+    store.set_state(state)
+    buffer = store.get_flat_buffers()[0]
+    capacity = buffer.data.numel()
+    for i in range(10):
+        store.set_state(store.get_state())
+        assert buffer.data.numel() == capacity
+        assert buffer.numel <= capacity
+    for name, value in [("a", 1), ("b", 2), ("c", 3)]:
+        assert (pyro.param(name).data == value).all()
+        assert store.param_name(pyro.param(name)) == name
+    assert len(store._param_to_name) == 3
+    store.set_flat_buffers(False)
+
+
+def test_flat_buffers_save_and_load():
+    store = pyro.get_param_store()
+    pyro.clear_param_store()
+    store.set_flat_buffers(True)
+    a = pyro.param("a", Variable(torch.ones(2), requires_grad=True))
+    pyro.param("b", Variable(2 * torch.ones(3), requires_grad=True))
+    state = store.get_state()
+    assert state[0]["a"] is not a
+    a.data.fill_(5)
+    store.set_state(state)
+    a = pyro.param("a")
+    assert (a.data == 1).all()
+    assert sum(len(buffer) for buffer in store.get_flat_buffers()) == 2
+    store.get_flat_buffers()[0].data.fill_(0)
+    assert (a.data == 0).all()
+    store.set_flat_buffers(False)
+
+
+def test_flat_buffers_svi_matches():
+    expected = run_svi_steps(flat=False)
+    actual = run_svi_steps(flat=True)
+    pyro.get_param_store().set_flat_buffers(False)
+    assert set(actual) == set(["loc", "scale"])
+    for name in expected:
+        assert (actual[name] == expected[name]).all()
+    assert (actual["loc"] != 0).all()
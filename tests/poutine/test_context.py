@@ -0,0 +1,136 @@
+from __future__ import absolute_import, division, print_function
+
+import threading
+import types
+
+import pytest
+import torch
+from torch.autograd import Variable
+
+import pyro
+import pyro.poutine as poutine
+from pyro.distributions import Normal
+from pyro.params import ParamStoreDict
+from pyro.poutine import _PYRO_STACK, Trace
+from pyro.poutine.block_poutine import BlockMessenger
+from pyro.poutine.trace_poutine import TraceMessenger
+from tests.common import assert_equal
+
+
+def model(name, x):
+    scale = pyro.param("{}_scale".format(name), Variable(torch.ones(1)))
+    return pyro.sample("{}_z".format(name), Normal(x, scale))
+
+
+def run_threads(target, args_list):
+    errors = []
+
+    def wrapper(*args):
+        try:
+            target(*args)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=wrapper, args=args) for args in args_list]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+def test_threads_have_own_stack():
+    entered = {"a": threading.Event(), "b": threading.Event()}
+    done = {"a": threading.Event(), "b": threading.Event()}
+    traces = {}
+
+    def job(name, other):
+        tr = poutine.trace(model)
+        with BlockMessenger(hide=["{}_x".format(name)]):
+            # both threads have poutines on their stacks while the other runs
+            entered[name].set()
+            entered[other].wait()
+            for i in range(20):
+                traces[name] = tr.get_trace(name, Variable(torch.zeros(1)))
+            assert len(_PYRO_STACK) == 1
+            done[name].set()
+            done[other].wait()
+
+    run_threads(job, [("a", "b"), ("b", "a")])
+    assert len(_PYRO_STACK) == 0
+    assert set(traces["a"].stochastic_nodes) == {"a_z"}
+    assert set(traces["b"].stochastic_nodes) == {"b_z"}
+
+
+def test_new_thread_starts_with_empty_stack():
+    lengths = []
+    with TraceMessenger():
+        run_threads(lambda: lengths.append(len(_PYRO_STACK)), [()])
+        assert len(_PYRO_STACK) == 1
+    assert lengths == [0]
+
+
+def test_asyncio_tasks_have_own_stack():
+    asyncio = pytest.importorskip("asyncio")
+    pytest.importorskip("contextvars")
+    nodes = {}
+
+    @types.coroutine
+    def job(name):
+        tr = TraceMessenger()
+        tr.trace = Trace()
+        with tr:
+            yield  # let the other task enter its poutine
+            model(name, Variable(torch.zeros(1)))
+            yield
+            model(name + "2", Variable(torch.zeros(1)))
+        nodes[name] = set(tr.trace.stochastic_nodes)
+
+    loop = asyncio.new_event_loop()
+    try:
+        tasks = [loop.create_task(job("a")), loop.create_task(job("b"))]
+        loop.run_until_complete(asyncio.wait(tasks))
+        for task in tasks:
+            task.result()
+    finally:
+        loop.close()
+    assert nodes["a"] == {"a_z", "a2_z"}
+    assert nodes["b"] == {"b_z", "b2_z"}
+    assert len(_PYRO_STACK) == 0
+
+
+def test_param_store_scope():
+    pyro.clear_param_store()
+    pyro.param("global", Variable(torch.zeros(1)))
+    param_store = ParamStoreDict()
+    with pyro.param_store_scope(param_store) as scoped:
+        assert scoped is param_store
+        assert pyro.get_param_store() is param_store
+        pyro.param("local", Variable(torch.ones(1)))
+        poutine.trace(model).get_trace("scoped", Variable(torch.zeros(1)))
+        with pyro.param_store_scope() as inner:
+            assert pyro.get_param_store() is inner
+            assert list(inner.get_all_param_names()) == []
+        assert pyro.get_param_store() is param_store
+    assert sorted(param_store.get_all_param_names()) == ["local", "scoped_scale"]
+    assert list(pyro.get_param_store().get_all_param_names()) == ["global"]
+    pyro.clear_param_store()
+
+
+def test_param_store_scope_per_thread():
+    pyro.clear_param_store()
+    stores = {}
+
+    def job(name, value):
+        with pyro.param_store_scope() as param_store:
+            stores[name] = param_store
+            for _ in range(20):
+                pyro.param("x", Variable(torch.Tensor([value])))
+                pyro.clear_param_store()
+            pyro.param("x", Variable(torch.Tensor([value])))
+
+    run_threads(job, [("a", 1.0), ("b", 2.0)])
+    assert_equal(stores["a"].get_param("x"), Variable(torch.Tensor([1.0])))
+    assert_equal(stores["b"].get_param("x"), Variable(torch.Tensor([2.0])))
+    assert list(pyro.get_param_store().get_all_param_names()) == []
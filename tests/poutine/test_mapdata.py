@@ -1,6 +1,7 @@
 from __future__ import absolute_import, division, print_function
 
 import logging
+import os
 
 import pytest
 import torch
@@ -153,6 +154,71 @@ def test_replay(model, subsample_size):
         assert different != original
 
 
+def test_sample_without_replacement():
+    counts = torch.zeros(40)
+    for _ in range(200):
+        sample = pyro._sample_without_replacement(40, 8)
+        assert len(sample) == 8
+        assert len(set(sample.tolist())) == 8
+        assert 0 <= sample.min() and sample.max() < 40
+        counts.index_add_(0, sample, torch.ones(8))
+    # each index is drawn with probability 8/40 per subsample
+    assert ((counts - 40).abs() < 25).all()
+
+
+def epoch_model(kind, name, subsample_size):
+    data = Variable(torch.zeros(20))
+    if kind == "iarange":
+        with pyro.iarange(name, 20, subsample_size, subsample_mode="epoch") as batch:
+            pyro.sample("x", dist.Normal(data[batch], Variable(torch.ones(subsample_size))))
+            return list(batch.data)
+    elif kind == "irange":
+        result = []
+        for i in pyro.irange(name, 20, subsample_size, subsample_mode="epoch"):
+            pyro.sample("x_{}".format(i), dist.Normal(data[i], Variable(torch.ones(1))))
+            result.append(i)
+        return result
+    elif kind == "map_data_vector":
+        batch = pyro.map_data(name, Variable(torch.arange(0, 20).long()), lambda batch, unused: batch,
+                              batch_size=subsample_size, subsample_mode="epoch")
+        return list(batch.data)
+    else:
+        return pyro.map_data(name, range(20), lambda i, unused: i, batch_size=subsample_size,
+                             subsample_mode="epoch")
+
+
+@pytest.mark.parametrize('subsample_size', [5, 7])
+@pytest.mark.parametrize('kind', ['iarange', 'irange', 'map_data_vector', 'map_data_iter'])
+def test_epoch_subsample(kind, subsample_size):
+    name = "epoch_{}_{}".format(kind, subsample_size)
+    indices = []
+    for _ in range(20):
+        tr = poutine.trace(epoch_model).get_trace(kind, name, subsample_size)
+        batch = [int(i) for i in tr.nodes["_RETURN"]["value"]]
+        assert len(set(batch)) == subsample_size
+        indices.extend(batch)
+        for node in tr.nodes.values():
+            if node["name"].startswith("x"):
+                assert node["scale"] == 20.0 / subsample_size
+    # every index is visited exactly once per epoch, also when a subsample straddles two epochs
+    for epoch in range(subsample_size):
+        assert sorted(indices[20 * epoch:20 * (epoch + 1)]) == list(range(20))
+    assert pyro.get_param_store().get_epoch_permutation(name, 20).epoch == subsample_size - 1
+
+    # replaying the subsample does not consume the permutation
+    replayed = poutine.replay(epoch_model, tr)(kind, name, subsample_size)
+    assert replayed == tr.nodes["_RETURN"]["value"]
+    assert pyro.get_param_store().get_epoch_permutation(name, 20).epoch == subsample_size - 1
+    epoch_model(kind, name, subsample_size)
+    assert pyro.get_param_store().get_epoch_permutation(name, 20).epoch == subsample_size
+
+
+def test_unknown_subsample_mode():
+    with pytest.raises(ValueError):
+        with pyro.iarange("data", 20, 5, subsample_mode="bogus"):
+            pass
+
+
 def iarange_custom_model(subsample):
     with pyro.iarange('iarange', 20, subsample=subsample) as batch:
         result = batch
@@ -246,3 +312,34 @@ def test_model_guide_mismatch(behavior, model_size, guide_size, model):
     else:
         with pytest.raises(ValueError):
             poutine.replay(model, model.trace)(model_size)
+
+
+def test_epoch_state_is_per_param_store():
+    def model():
+        with pyro.iarange("data", 10, subsample_size=4, subsample_mode="epoch") as ind:
+            return ind
+
+    model()
+    permutation = pyro.get_param_store().get_epoch_permutation("data", 10)
+    assert permutation._position == 4
+    with pyro.param_store_scope() as param_store:
+        model()
+        assert param_store.get_epoch_permutation("data", 10) is not permutation
+    assert pyro.get_param_store().get_epoch_permutation("data", 10) is permutation
+    pyro.clear_param_store()
+    assert pyro.get_param_store().get_epoch_permutation("data", 10) is not permutation
+
+
+def test_epoch_state_is_not_saved(tmpdir):
+    def model():
+        with pyro.iarange("data", 10, subsample_size=4, subsample_mode="epoch") as ind:
+            return ind
+
+    filename = os.path.join(str(tmpdir), "params.out")
+    pyro.clear_param_store()
+    pyro.param("loc", Variable(torch.zeros(1)))
+    model()
+    pyro.get_param_store().save(filename)
+    pyro.clear_param_store()
+    pyro.get_param_store().load(filename)
+    assert pyro.get_param_store().get_epoch_permutation("data", 10)._position == 0
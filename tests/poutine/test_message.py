@@ -0,0 +1,69 @@
+from __future__ import absolute_import, division, print_function
+
+import pickle
+
+import pytest
+
+import pyro
+import pyro.distributions as dist
+import pyro.poutine as poutine
+from pyro.poutine.message import Message
+from pyro.util import ng_ones, ng_zeros
+
+
+def test_dict_interface():
+    msg = Message("sample", "x", value=1.)
+    assert msg["type"] == "sample"
+    assert msg.value == msg["value"] == 1.
+    assert msg.kwargs == {} and msg.infer == {} and msg.cond_indep_stack == []
+
+    # memoized fields are absent until set
+    assert "log_pdf" not in msg
+    with pytest.raises(KeyError):
+        msg["log_pdf"]
+    assert msg.get("log_pdf") is None
+    msg["log_pdf"] = 2.
+    assert "log_pdf" in msg and msg.log_pdf == 2.
+    assert msg.pop("log_pdf") == 2.
+    assert "log_pdf" not in msg
+
+    # other keys are kept aside
+    msg["foo"] = "bar"
+    assert msg["foo"] == "bar"
+    assert "foo" in msg
+    assert list(msg.keys())[-1] == "foo"
+    with pytest.raises(KeyError):
+        msg["baz"]
+    with pytest.raises(KeyError):
+        del msg["value"]
+
+    msg.update(value=3., baz=4)
+    assert dict(msg)["value"] == 3.
+    assert msg == dict(msg.items())
+
+
+def test_copy_and_pickle():
+    msg = Message("sample", "x", value=[1.], foo="bar")
+    msg.score_parts = 0.
+    msg_copy = msg.copy()
+    assert msg_copy == msg
+    assert msg_copy.value is msg.value
+    msg_copy["foo"] = "baz"
+    msg_copy.score_parts = None
+    assert msg["foo"] == "bar"
+    assert "score_parts" in msg
+
+    assert pickle.loads(pickle.dumps(msg)) == msg
+
+
+def test_trace_stores_messages():
+    def model():
+        pyro.param("p", ng_zeros(1))
+        return pyro.sample("x", dist.Normal(ng_zeros(1), ng_ones(1)))
+
+    tr = poutine.trace(model).get_trace()
+    for name in ("_INPUT", "p", "x", "_RETURN"):
+        assert isinstance(tr.nodes[name], Message)
+        assert tr.nodes[name].name == name
+    assert tr.nodes["x"].value is tr.nodes["_RETURN"].value
+    assert tr.nodes["p"].fn is None and not tr.nodes["p"].is_observed
@@ -12,6 +12,7 @@ import pyro
 import pyro.distributions as dist
 import pyro.poutine as poutine
 from pyro.distributions import Bernoulli, Normal
+from pyro.poutine.poutine import get_handler_chain
 from pyro.poutine.util import all_escape, discrete_escape, NonlocalExit
 from pyro.util import ng_ones, ng_zeros
 from six.moves.queue import Queue
@@ -428,6 +429,68 @@ class QueuePoutineMixedTest(TestCase):
         assert values[0]["z"] != values[1]["z"]  # Almost surely true.
 
 
+class QueuePoutinePrefixTest(QueuePoutineDiscreteTest):
+
+    def setUp(self):
+        super(QueuePoutinePrefixTest, self).setUp()
+        self.queue = Queue()
+        self.queue.put(poutine.TracePrefix())
+
+    def test_queue_max_tries(self):
+        # a prefix is extended in place, so each try completes a trace
+        f = poutine.queue(self.model, queue=self.queue, max_tries=1)
+        f()
+        assert self.queue.qsize() == 3
+
+    def test_queue_one_run_per_trace(self):
+        model = self.model
+        runs = []
+
+        def counted_model():
+            runs.append(None)
+            return model()
+
+        f = poutine.trace(poutine.queue(counted_model, queue=self.queue))
+        trs = []
+        while not self.queue.empty():
+            trs.append(f.get_trace())
+        assert len(trs) == 2 ** 3
+        assert len(runs) == 2 ** 3
+
+    def test_queue_shares_prefix(self):
+        def model():
+            x = pyro.sample("x", Normal(ng_zeros(1), ng_ones(1)))
+            y = pyro.sample("y", Bernoulli(ng_ones(1) * 0.5))
+            z = pyro.sample("z", Normal(ng_zeros(1), ng_ones(1)))
+            return x, y, z
+
+        f = poutine.queue(model, queue=self.queue)
+        x0, y0, _ = f()
+        assert self.queue.qsize() == 1
+        prefix = self.queue.get()
+        assert "x" in prefix and "y" in prefix and "z" not in prefix
+        assert prefix.sites["y"].data[0] != y0.data[0]
+        assert prefix.parent.sites["x"] is x0
+        self.queue.put(prefix)
+        x1, y1, _ = f()
+        assert x1 is x0
+        assert y1.data[0] != y0.data[0]
+        assert self.queue.empty()
+
+
+def test_trace_prefix_extend():
+    root = poutine.TracePrefix()
+    a = root.extend({"a": 0})
+    b1 = a.extend({"b": 1})
+    b2 = a.extend({"b": 2, "c": 3})
+    assert b1.parent is b2.parent is a
+    assert b1.values() == {"a": 0, "b": 1}
+    assert b2.values() == {"a": 0, "b": 2, "c": 3}
+    assert "a" in b1 and "c" not in b1
+    assert len(b2) == 3
+    assert len(root) == 0
+
+
 class IndirectLambdaPoutineTests(TestCase):
 
     def setUp(self):
@@ -620,3 +683,40 @@ class InferConfigPoutineTests(TestCase):
         assert tr.nodes["a"]["infer"] == {"enumerate": "parallel", "blah": True}
         assert tr.nodes["b"]["infer"] == {"blah": True}
         assert tr.nodes["p"]["infer"] == {}
+
+
+def test_handler_chain_cached_per_stack_configuration():
+    chains = []
+
+    def model():
+        pyro.sample("x", Normal(ng_zeros(1), ng_ones(1)))
+        chains.append(get_handler_chain("sample"))
+        chains.append(get_handler_chain("sample"))
+        with poutine.scale(None, 2.0):
+            pyro.sample("y", Normal(ng_zeros(1), ng_ones(1)))
+            chains.append(get_handler_chain("sample"))
+
+    tr = poutine.trace(model).get_trace()
+    assert chains[0] is chains[1]
+    assert chains[2] is not chains[0]
+    assert len(chains[0]) == 1 and len(chains[2]) == 2
+    assert tr.nodes["y"]["scale"] == 2.0
+
+    # chains only depend on the classes of the frames, so they are shared across runs
+    poutine.trace(model).get_trace()
+    assert chains[3] is chains[0]
+    assert chains[5] is chains[2]
+
+
+def test_handler_chain_follows_message_type_change():
+    # LiftMessenger turns the param site into a sample site below ConditionMessenger,
+    # so ConditionMessenger must dispatch on the new message type.
+    def model():
+        return pyro.param("mu", Variable(torch.zeros(1), requires_grad=True))
+
+    data = {"mu": Variable(torch.ones(1))}
+    lifted = poutine.lift(model, prior=Normal(ng_zeros(1), ng_ones(1)))
+    tr = poutine.trace(poutine.condition(lifted, data=data)).get_trace()
+    assert tr.nodes["mu"]["type"] == "sample"
+    assert tr.nodes["mu"]["is_observed"]
+    assert tr.nodes["mu"]["value"] is data["mu"]
@@ -0,0 +1,156 @@
+from __future__ import absolute_import, division, print_function
+
+import warnings
+
+import networkx
+import pytest
+import torch
+from torch.autograd import Variable
+
+import pyro
+import pyro.distributions as dist
+import pyro.poutine as poutine
+from pyro.poutine.trace import Trace
+from pyro.poutine.trace_poutine import identify_dense_edges
+from pyro.poutine.util import prune_subsample_sites, site_is_subsample
+from pyro.util import is_nan, ng_ones, ng_zeros
+
+
+def model():
+    mu = pyro.sample("mu", dist.Normal(ng_zeros(1), ng_ones(1)))
+    for i in pyro.irange("data", 2):
+        pyro.sample("x_{}".format(i), dist.Normal(mu, ng_ones(1)), obs=Variable(torch.ones(1)))
+    return mu
+
+
+def test_flat_trace_does_not_build_graph():
+    tr = poutine.trace(model).get_trace()
+    assert list(tr.nodes.keys()) == ["_INPUT", "mu", "data", "x_0", "x_1", "_RETURN"]
+    assert tr.nodes() == list(tr.nodes.keys())
+    assert len(tr.edges) == 0
+    assert list(tr.successors("mu")) == []
+    assert tr._nx_graph is None
+
+
+def test_dense_trace_edges():
+    tr = prune_subsample_sites(poutine.trace(model, graph_type="dense").get_trace())
+    assert set(tr.edges) == set([("mu", "x_0"), ("mu", "x_1")])
+    assert ("mu", "x_0") in tr.edges
+    assert ("x_0", "mu") not in tr.edges
+    assert list(tr.successors("mu")) == ["x_0", "x_1"]
+    assert list(tr.predecessors("x_1")) == ["mu"]
+    assert tr.in_degree("x_0") == 1
+    assert tr.in_degree("mu") == 0
+    with pytest.raises(KeyError):
+        tr.successors("missing")
+
+
+def nested_model():
+    mu = pyro.sample("mu", dist.Normal(ng_zeros(1), ng_ones(1)))
+    for i in pyro.irange("outer", 3):
+        z = pyro.sample("z_{}".format(i), dist.Normal(mu, ng_ones(1)))
+        for j in pyro.irange("inner_{}".format(i), 2):
+            pyro.sample("x_{}_{}".format(i, j), dist.Normal(z, ng_ones(1)), obs=Variable(torch.ones(1)))
+        with pyro.iarange("batch_{}".format(i), 2):
+            pyro.sample("y_{}".format(i), dist.Normal(z, ng_ones(2)), obs=Variable(torch.ones(2)))
+    pyro.sample("w", dist.Normal(mu, ng_ones(1)))
+
+
+def brute_force_edges(trace):
+    edges = set()
+    names = list(trace.nodes.keys())
+    for i, name in enumerate(names):
+        node = trace.nodes[name]
+        if node["type"] != "sample" or site_is_subsample(node):
+            continue
+        for past_name in names[:i]:
+            past_node = trace.nodes[past_name]
+            if past_node["type"] != "sample" or site_is_subsample(past_node):
+                continue
+            if not any(query.name == target.name and query.counter != target.counter
+                       for query, target in zip(node["cond_indep_stack"], past_node["cond_indep_stack"])):
+                edges.add((past_name, name))
+    return edges
+
+
+def test_dense_edges_match_brute_force():
+    tr = poutine.trace(nested_model, graph_type="dense").get_trace()
+    expected = brute_force_edges(tr)
+    assert set(tr.edges) == expected
+    assert ("z_0", "x_0_1") in expected and ("z_0", "x_1_0") not in expected
+    assert ("x_0_0", "w") in expected
+    # subsample sites do not get any edges
+    assert tr.in_degree("outer") == 0 and list(tr.successors("outer")) == []
+    assert tr.graph["vectorized_map_data_info"]["rao-blackwellization-condition"]
+    assert tr.graph["vectorized_map_data_info"]["nodes"] == set(["y_0", "y_1", "y_2"])
+
+    flat_tr = poutine.trace(poutine.replay(nested_model, tr)).get_trace()
+    identify_dense_edges(flat_tr)
+    assert set(flat_tr.edges) == expected
+    assert list(flat_tr.successors("mu")) == list(tr.successors("mu"))
+
+
+def test_dependent_iaranges():
+    def model():
+        with pyro.iarange("a", 2):
+            pyro.sample("x", dist.Normal(ng_zeros(2), ng_ones(2)))
+        with pyro.iarange("b", 2):
+            pyro.sample("y", dist.Normal(ng_zeros(2), ng_ones(2)))
+
+    info = poutine.trace(model, graph_type="dense").get_trace().graph["vectorized_map_data_info"]
+    assert not info["rao-blackwellization-condition"]
+    assert info["warnings"] == set(["there exist dependent iaranges"])
+
+
+def test_to_networkx():
+    tr = poutine.trace(model, graph_type="dense").get_trace()
+    g = tr.to_networkx()
+    assert isinstance(g, networkx.DiGraph)
+    assert list(g.nodes) == list(tr.nodes.keys())
+    assert set(g.edges) == set(tr.edges)
+    assert g.graph["vectorized_map_data_info"] is tr.graph["vectorized_map_data_info"]
+    assert tr.to_networkx() is g
+
+    order = list(networkx.topological_sort(g))
+    assert order.index("mu") < order.index("x_0")
+
+    tr.remove_node("x_0")
+    assert tr.to_networkx() is not g
+    assert "x_0" not in tr.to_networkx()
+
+
+def test_copy_and_remove_node():
+    tr = prune_subsample_sites(poutine.trace(model, graph_type="dense").get_trace())
+    tr2 = tr.copy()
+    assert tr2.graph_type == "dense"
+    assert tr2.graph == tr.graph
+    assert tr2.nodes["mu"] is not tr.nodes["mu"]
+    assert tr2.nodes["mu"]["value"] is tr.nodes["mu"]["value"]
+
+    tr2.nodes["mu"]["log_pdf"] = 0.
+    tr2.remove_node("mu")
+    assert "log_pdf" not in tr.nodes["mu"]
+    assert "mu" not in tr2
+    assert len(tr2.edges) == 0
+    assert list(tr2.predecessors("x_0")) == []
+    assert set(tr.edges) == set([("mu", "x_0"), ("mu", "x_1")])
+
+
+def test_add_duplicate_node():
+    tr = Trace()
+    tr.add_node("p", type="param", value=0)
+    tr.add_node("p", type="param", value=1)
+    assert tr.nodes["p"]["value"] == 1
+    tr.add_node("x", type="sample", value=0)
+    with pytest.raises(AssertionError):
+        tr.add_node("x", type="sample", value=1)
+
+
+def test_log_pdf_nan_warning_names_site():
+    tr = poutine.trace(model).get_trace()
+    tr.nodes["x_1"]["log_pdf"] = Variable(torch.Tensor([float('nan')])).sum()
+    with warnings.catch_warnings(record=True) as record:
+        warnings.simplefilter("always")
+        log_p = tr.log_pdf()
+    assert is_nan(log_p)
+    assert [str(w.message) for w in record] == ["Encountered NAN log_pdf at site 'x_1'"]
@@ -0,0 +1,129 @@
+from __future__ import absolute_import, division, print_function
+
+import threading
+
+import pytest
+import torch
+from torch.autograd import Variable
+
+import pyro
+import pyro.distributions as dist
+import pyro.poutine as poutine
+from pyro.data_source import DataSource, is_contiguous_range
+from tests.common import assert_equal
+
+data = Variable(torch.randn(20, 3))
+labels = Variable(torch.arange(0, 20))
+
+
+def model(source):
+    with pyro.iarange("data", 20, subsample_size=5) as ind:
+        x, y = source[ind]
+        pyro.sample("x", dist.Normal(Variable(torch.zeros(5, 3)), Variable(torch.ones(5, 3))), obs=x)
+        return ind.data, x, y
+
+
+def guide(source):
+    with pyro.iarange("data", 20, subsample_size=5):
+        pass
+
+
+@pytest.mark.parametrize("subsample_mode", ["random", "epoch", "sequential"])
+def test_data_source(subsample_mode):
+    source = DataSource((data, labels), subsample_size=5, subsample_mode=subsample_mode, num_workers=2)
+    pyro.register_data_source("data", source)
+    try:
+        indices = []
+        for _ in range(8):
+            guide_trace = poutine.trace(guide).get_trace(source)
+            tr = poutine.trace(poutine.replay(model, guide_trace)).get_trace(source)
+            ind, x, y = tr.nodes["_RETURN"]["value"]
+            assert_equal(x, data[ind])
+            assert_equal(y, labels[ind])
+            assert tr.nodes["x"]["scale"] == 4.0
+            indices.append(ind)
+    finally:
+        pyro.register_data_source("data", None)
+        source.close()
+    if subsample_mode == "sequential":
+        assert [list(ind) for ind in indices[:4]] == [list(range(i, i + 5)) for i in range(0, 20, 5)]
+    if subsample_mode != "random":
+        for epoch in range(2):
+            assert sorted(torch.cat(indices[4 * epoch:4 * (epoch + 1)]).tolist()) == list(range(20))
+
+
+def test_contiguous_batches_are_views():
+    source = DataSource(data, subsample_size=5, subsample_mode="sequential")
+    try:
+        batch = source[source.next_chunk(5)]
+        assert batch.data.data_ptr() == data.data.data_ptr()
+        batch = source[source.next_chunk(5)]
+        assert_equal(batch, data[5:10])
+        # indices the data source did not draw are gathered on the spot
+        assert_equal(source[torch.LongTensor([3, 1])], data[torch.LongTensor([3, 1])])
+    finally:
+        source.close()
+
+
+def test_map_data_uses_data_source():
+    source = DataSource(data, subsample_size=4, subsample_mode="sequential")
+    pyro.register_data_source("md", source)
+    try:
+        batch = pyro.map_data("md", data, lambda ind, batch: batch, batch_size=4)
+        assert batch.data.data_ptr() == data.data.data_ptr()
+    finally:
+        pyro.register_data_source("md", None)
+        source.close()
+
+
+@pytest.mark.parametrize("other_data,batch_dim", [(True, 0), (False, 1)])
+def test_map_data_data_source_mismatch(other_data, batch_dim):
+    square = Variable(torch.randn(8, 8))
+    source = DataSource(square, subsample_size=4, subsample_mode="sequential")
+    pyro.register_data_source("md", source)
+    try:
+        other = square.clone() if other_data else square
+        with pytest.raises(ValueError, match="must wrap"):
+            pyro.map_data("md", other, lambda ind, batch: batch, batch_size=4, batch_dim=batch_dim)
+    finally:
+        pyro.register_data_source("md", None)
+        source.close()
+
+
+def test_is_contiguous_range():
+    assert is_contiguous_range(torch.LongTensor([3, 4, 5]))
+    assert not is_contiguous_range(torch.LongTensor([3, 5, 4]))
+    assert not is_contiguous_range(torch.LongTensor([3, 4, 6]))
+
+
+def test_size_mismatch():
+    source = DataSource(data, subsample_size=5)
+    pyro.register_data_source("data", source)
+    try:
+        with pytest.raises(ValueError):
+            with pyro.iarange("data", 10, subsample_size=5):
+                pass
+    finally:
+        pyro.register_data_source("data", None)
+        source.close()
+
+
+def test_data_source_is_local_to_its_context():
+    source = DataSource(data, subsample_size=5, subsample_mode="sequential")
+    subsamples = []
+
+    def run():
+        pyro.register_data_source("data", source)
+        with pyro.iarange("data", 20, subsample_size=5) as ind:
+            subsamples.append(ind.data)
+
+    try:
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        assert subsamples[0].tolist() == list(range(5))
+        # the data source of the thread, which has size 20, is not registered in this context
+        with pyro.iarange("data", 10, subsample_size=5) as ind:
+            assert len(ind) == 5
+    finally:
+        source.close()